@@ -1,14 +1,19 @@
+import asyncio
+
 import gradio as gr
-from swarm import Swarm, Agent
 
 # Import all agents
 from multi_agent_service import triage_agent, sales_agent, refunds_agent, product_agent
-import azure_open_ai
-from azure_cosmos_db import get_agent_history, tx_batch_add_agent_messages
-
+import config
+import context_window
+import multi_agent_service
+import multi_agent_service_aio
+import router
+import telemetry
+from sessions import SessionStore
+from write_behind import WriteBehindWriter
+from azure_cosmos_db import CHAT_MESSAGE_FIELDS, get_agent_history, tx_batch_add_agent_messages
 
-# Initialize Swarm client
-client = Swarm(client=azure_open_ai.aoai_client)
 
 # Map agent names to agent objects
 agent_map = {
@@ -19,34 +24,98 @@ agent_map = {
 }
 
 
+# Writes each turn's messages to Cosmos DB in the background (see config.WRITE_BEHIND_ENABLED)
+history_writer = WriteBehindWriter(write=tx_batch_add_agent_messages)
+
+# Bounds the prompt sent to the agents on each turn
+context_manager = context_window.create_manager()
+
+# User and session used when chat_interface is called outside of a browser session
+DEFAULT_USER_ID = "anonymous"
+DEFAULT_SESSION_ID = "default"
+
+# Agents with the asyncio tools, used by chat_interface_async
+async_agent_map = {
+    "Triage Agent": multi_agent_service_aio.triage_agent,
+    "Sales Agent": multi_agent_service_aio.sales_agent,
+    "Refunds Agent": multi_agent_service_aio.refunds_agent,
+    "Product Agent": multi_agent_service_aio.product_agent,
+}
+
+
+# Routes clear requests past the triage agent, created on first use
+request_router = None
+
+def get_router():
+    global request_router
+    if request_router is None:
+        request_router = router.create_router()
+    return request_router
+
+def route(user_input, agent_name):
+    """Name of the agent to serve a turn: the router's pick when the conversation is at triage."""
+    
+    if not config.ROUTER_ENABLED or agent_name != "Triage Agent":
+        return agent_name
+    try:
+        decision = get_router().route(user_input)
+    except Exception as e:
+        # The triage agent can always decide
+        print(f"Routing failed, using the triage agent: {e}")
+        return agent_name
+    return decision.agent_name or agent_name
+
+def start_turn(user_input, messages):
+    """Append the user input to messages, stamped with the next turn sequence number."""
+    
+    user_message = {"role": "user", "content": user_input}
+    assign_sequence([user_message], next_sequence(messages))
+    messages.append(user_message)
+    return user_message
+
+def report_turn(summary):
+    """End a turn's telemetry and print its summary if config.TELEMETRY_TURN_SUMMARY is set."""
+    
+    telemetry.end_turn(summary)
+    if config.TELEMETRY_TURN_SUMMARY:
+        print(summary)
+
+def finish_turn(response, user_message, messages):
+    """Sequence the agent responses and append them to messages, returning this turn's messages."""
+    
+    assign_sequence(response.messages, user_message["seq"] + 1)
+    messages.extend(response.messages)
+    return [user_message] + response.messages
+
 # Input from user comes here, put breakpoint here to debug the agent workflow
-def chat_interface(user_input, agent_name="Triage Agent", messages=None):
+def chat_interface(user_input, agent_name="Triage Agent", messages=None, user_id=DEFAULT_USER_ID, session_id=DEFAULT_SESSION_ID):
     
     if messages is None:
         messages = []
 
 
     # Update messages with user input
-    messages.append({"role": "user", "content": user_input})
+    user_message = start_turn(user_input, messages)
 
-    # Get the current agent object from the map
-    agent = agent_map.get(agent_name, triage_agent)
+    # Get the current agent object from the map, skipping triage when the request is clear
+    agent = agent_map.get(route(user_input, agent_name), triage_agent)
+    turn = telemetry.start_turn(agent.name)
 
-    # Call the Swarm API
-    response = client.run(
+    # Call the Swarm API with the recent turns, a summary of earlier ones and the pinned facts
+    response = multi_agent_service.get_swarm_client().run(
         agent=agent,
-        messages=messages,
+        messages=context_manager.prepare(messages, user_id, session_id),
         context_variables={},
         stream=False,  # Set True for streaming support
         debug=False,
     )
     
-    # Persist the user input and Agent responses to Cosmos DB in a Transaction
-    persist_agent_history(user_input, messages)    
+    # Persist only this turn (user input and Agent responses) to Cosmos DB in a Transaction
+    persist_agent_history(finish_turn(response, user_message, messages), user_id, session_id)
+    report_turn(turn)
     
     
     # Prepare chatbot messages for display
-    messages.extend(response.messages)
     chatbot_messages = format_for_gradio(messages)
     
 
@@ -55,24 +124,112 @@ def chat_interface(user_input, agent_name="Triage Agent", messages=None):
 
     return chatbot_messages, next_agent, messages
 
-def persist_agent_history(user_input, messages):
-    """Persist agent chat history to Cosmos DB."""
+def chat_interface_stream(user_input, agent_name="Triage Agent", messages=None, user_id=DEFAULT_USER_ID, session_id=DEFAULT_SESSION_ID):
+    """Streaming version of chat_interface.
     
-    #hard coding the user and session ids for now
-    # In a real application, these would be dynamically generated or passed in
-    user_id = "mark"
-    session_id = "1234"
+    Yields (chatbot_messages, agent_name, messages) as assistant tokens, tool calls and agent handoffs
+    arrive. The turn is persisted to Cosmos DB once the stream completes."""
     
-    # Create a new message object for the user input to save in Cosmos DB
-    cosmos_messages = []
-    cosmos_messages.append({"role": "user", "content": user_input, "user_id": user_id, "session_id": session_id})
+    if messages is None:
+        messages = []
+
+    user_message = start_turn(user_input, messages)
+    agent = agent_map.get(route(user_input, agent_name), triage_agent)
+    history = format_for_gradio(messages)
+    turn = telemetry.start_turn(agent.name)
+
+    stream = telemetry.within_turn(turn, multi_agent_service.get_swarm_client().run(
+        agent=agent,
+        messages=context_manager.prepare(messages, user_id, session_id),
+        context_variables={},
+        stream=True,
+        debug=False,
+    ))
+    
+    # Messages shown while the turn is in progress
+    live = []
+    current = None
+    sender = agent.name
+    response = None
+    
+    for chunk in stream:
+        if "response" in chunk:
+            response = chunk["response"]
+            break
+        if "delim" in chunk:
+            # Each completion of the turn gets its own assistant message
+            current = None
+            continue
+        
+        if chunk.get("sender") and chunk["sender"] != sender:
+            sender = chunk["sender"]
+            live.append({"role": "assistant", "content": f"<span style='color:gray'>[Transferred to {sender}]</span>\n\n"})
+        
+        if chunk.get("content"):
+            if current is None:
+                current = {"role": "assistant", "content": f"[{sender}] "}
+                live.append(current)
+            current["content"] += chunk["content"]
+        
+        for tool_call in chunk.get("tool_calls") or []:
+            name = (tool_call.get("function") or {}).get("name")
+            if name:
+                live.append({"role": "assistant", "content": f"<span style='color:red'>[Calling tool: {name}]</span>\n\n"})
+        
+        yield history + live, sender, messages
     
-    for m in messages:
-        m["user_id"] = user_id
-        m["session_id"] = session_id
-        cosmos_messages.append(m)
+    persist_agent_history(finish_turn(response, user_message, messages), user_id, session_id)
+    report_turn(turn)
     
-    tx_batch_add_agent_messages(user_id=user_id, session_id=session_id, messages=cosmos_messages)
+    yield format_for_gradio(messages), response.agent.name, messages
+
+async def chat_interface_async(user_input, agent_name="Triage Agent", messages=None, user_id=DEFAULT_USER_ID, session_id=DEFAULT_SESSION_ID):
+    """Asyncio version of chat_interface: the event loop is not blocked while waiting on Azure."""
+    
+    if messages is None:
+        messages = []
+
+    user_message = start_turn(user_input, messages)
+    agent_name = await asyncio.to_thread(route, user_input, agent_name)
+    agent = async_agent_map.get(agent_name, multi_agent_service_aio.triage_agent)
+    turn = telemetry.start_turn(agent.name)
+
+    prompt = await asyncio.to_thread(context_manager.prepare, messages, user_id, session_id)
+
+    response = await multi_agent_service_aio.get_swarm_client().run(
+        agent=agent,
+        messages=prompt,
+        context_variables={},
+        debug=False,
+    )
+    
+    await asyncio.to_thread(persist_agent_history, finish_turn(response, user_message, messages), user_id, session_id)
+    report_turn(turn)
+
+    return format_for_gradio(messages), response.agent.name, messages
+
+def next_sequence(messages):
+    """Return the next turn sequence number, one past the session's high-water mark."""
+    return max((m.get("seq", -1) for m in messages), default=-1) + 1
+
+def assign_sequence(messages, start):
+    """Stamp messages in order with consecutive sequence numbers starting at start."""
+    for offset, message in enumerate(messages):
+        message["seq"] = start + offset
+
+def persist_agent_history(new_messages, user_id, session_id):
+    """Append the messages of a single turn to the session's agent chat history in Cosmos DB.
+    
+    With write-behind the messages are only queued, and the turn does not wait on Cosmos DB."""
+    
+    # Copy the messages so the Cosmos DB fields are not sent back to the model
+    cosmos_messages = []
+    for m in new_messages:
+        cosmos_messages.append({**m, "user_id": user_id, "session_id": session_id})
+    
+    if config.WRITE_BEHIND_ENABLED:
+        return history_writer.enqueue(user_id, session_id, cosmos_messages)
+    return tx_batch_add_agent_messages(user_id=user_id, session_id=session_id, messages=cosmos_messages)
     
 
 def format_for_gradio(messages):
@@ -108,9 +265,86 @@ def format_for_gradio(messages):
 
     return chatbot_messages
 
-# Fetch agent history from Cosmos DB
-initial_messages = get_agent_history("mark", "1234") or []
-chatbot_messages = format_for_gradio(initial_messages)
+def load_history(user_id, session_id, continuation_token=None):
+    """Fetch a page of a session's agent history from its own Cosmos DB partition.
+    
+    A page can start in the middle of a turn; its messages are all kept, so the older page joins
+    up with them and the sequence high-water mark is right, and the context window manager never
+    sends a partial turn to the model.
+    
+    The newest page also gets the session's messages the write-behind has not written yet, so a
+    session reloaded meanwhile does not reuse their sequence numbers and overwrite them."""
+    
+    messages, history_token = get_agent_history(user_id, session_id, continuation_token=continuation_token)
+    if continuation_token is None and config.WRITE_BEHIND_ENABLED:
+        written = {m.get("seq") for m in messages}
+        unwritten = {}
+        for m in history_writer.unwritten(user_id, session_id):
+            if m.get("seq") not in written:
+                unwritten[m.get("seq")] = {name: m[name] for name in CHAT_MESSAGE_FIELDS if name in m}
+        messages = sorted(messages + list(unwritten.values()), key=lambda m: m.get("seq", -1))
+    return messages, history_token
+
+# Active sessions, loaded on first use and evicted when idle
+session_store = SessionStore(
+    loader=load_history,
+    max_sessions=config.SESSION_MAX_ACTIVE,
+    idle_seconds=config.SESSION_IDLE_SECONDS
+)
+
+def session_key(request: gr.Request):
+    """Derive the user and session ids of a browser connection."""
+    return request.username or DEFAULT_USER_ID, request.session_hash
+
+def respond(user_input, request: gr.Request):
+    session = session_store.get(*session_key(request))
+    
+    with session.lock:
+        chatbot_messages, session.agent_name, session.messages = chat_interface(
+            user_input, session.agent_name, session.messages, session.user_id, session.session_id)
+    
+    return chatbot_messages
+
+def respond_stream(user_input, request: gr.Request):
+    session = session_store.get(*session_key(request))
+    
+    with session.lock:
+        for chatbot_messages, session.agent_name, session.messages in chat_interface_stream(
+                user_input, session.agent_name, session.messages, session.user_id, session.session_id):
+            yield chatbot_messages
+
+async def respond_async(user_input, request: gr.Request):
+    session = await asyncio.to_thread(session_store.get, *session_key(request))
+    
+    await asyncio.to_thread(session.lock.acquire)
+    try:
+        chatbot_messages, session.agent_name, session.messages = await chat_interface_async(
+            user_input, session.agent_name, session.messages, session.user_id, session.session_id)
+    finally:
+        session.lock.release()
+    
+    return chatbot_messages
+
+def load_session(request: gr.Request):
+    """Show the latest page of agent history when a browser session opens."""
+    
+    session = session_store.get(*session_key(request))
+    return format_for_gradio(session.messages)
+
+def load_earlier_messages(request: gr.Request):
+    """Prepend the next older page of agent history from Cosmos DB."""
+    
+    session = session_store.get(*session_key(request))
+    
+    with session.lock:
+        if session.history_token:
+            older_messages, session.history_token = load_history(session.user_id, session.session_id, session.history_token)
+            session.messages = older_messages + session.messages
+    
+    return format_for_gradio(session.messages)
+
+def close_session(request: gr.Request):
+    session_store.drop(*session_key(request))
 
 # Define Gradio UI
 with gr.Blocks(css=".chatbox { background-color: #f9f9f9; border-radius: 10px; padding: 10px; }") as demo:
@@ -129,7 +363,6 @@ with gr.Blocks(css=".chatbox { background-color: #f9f9f9; border-radius: 10px; p
             label="Chat with the Assistant",
             elem_classes=["chatbox"],
             type="messages",
-            value=chatbot_messages # Initialize with agent chat history from Cosmos DB messages
         )
 
     with gr.Row():
@@ -140,18 +373,42 @@ with gr.Blocks(css=".chatbox { background-color: #f9f9f9; border-radius: 10px; p
             elem_id="user_input"
         )
 
-    agent_name = gr.State("Triage Agent")
-    #messages = gr.State([])
-    messages = gr.State(initial_messages)
+    with gr.Row():
+        load_earlier = gr.Button("Load earlier messages", size="sm")
+
+    # Initialize with agent chat history from Cosmos DB messages
+    demo.load(fn=load_session, inputs=None, outputs=chatbot)
+    demo.unload(close_session)
 
 
     # Chat interaction
+    if config.ASYNC_MODE:
+        respond_fn = respond_async
+    elif config.STREAM_RESPONSES:
+        respond_fn = respond_stream
+    else:
+        respond_fn = respond
+
     user_input.submit(
-        fn=chat_interface,
-        inputs=[user_input, agent_name, messages],
-        outputs=[chatbot, agent_name, messages],
+        fn=respond_fn,
+        inputs=user_input,
+        outputs=chatbot,
     ).then(
         lambda: "", inputs=None, outputs=user_input
     )  # Clear the input box after submission
 
-demo.launch()
\ No newline at end of file
+    # Older pages of history are only read from Cosmos DB when asked for
+    load_earlier.click(
+        fn=load_earlier_messages,
+        inputs=None,
+        outputs=chatbot,
+    )
+
+# Serve many sessions at once (Gradio runs one event at a time by default)
+demo.queue(default_concurrency_limit=config.GRADIO_CONCURRENCY_LIMIT)
+
+if __name__ == "__main__":
+    import bootstrap
+    print(bootstrap.bootstrap())
+    
+    demo.launch()
\ No newline at end of file
@@ -1,86 +1,109 @@
 import config
+import json
+import threading
+import time
 import uuid
+from dataclasses import dataclass, field
 
-from azure.identity import DefaultAzureCredential
-from azure.cosmos import CosmosClient, PartitionKey, exceptions
+from azure.cosmos import PartitionKey, exceptions
 
 import azure_open_ai
-
-# Initialize the Cosmos client
-# reference environment variables for the values of these variables
-endpoint = config.AZURE_COSMOSDB_ENDPOINT
-credential = DefaultAzureCredential()
-client = CosmosClient(endpoint, credential)
-print("Authenticated using DefaultAzureCredential")
-print("Cosmos client initialized")
+import clients
+import resilience
+import telemetry
 
 # Create global variables for the database and containers
 global DATABASE_NAME, USERS_CONTAINER_NAME, PURCHASE_HISTORY_CONTAINER_NAME, PRODUCTS_CONTAINER_NAME, CHAT_CONTAINER_NAME
-global DATABASE, USERS_CONTAINER, PURCHASE_HISTORY_CONTAINER, PRODUCTS_CONTAINER, CHAT_CONTAINER
 
 # Database and container names
 DATABASE_NAME = "MultiAgentDemoDB"
 USERS_CONTAINER_NAME = "Users"
 PURCHASE_HISTORY_CONTAINER_NAME = "PurchaseHistory"
-PRODUCTS_CONTAINER_NAME = "Products"
+PRODUCTS_CONTAINER_NAME = config.PRODUCTS_CONTAINER_NAME
 CHAT_CONTAINER_NAME = "Chat"
 
-# Database and container references (hydrated in create_database)
-DATABASE = None
-USERS_CONTAINER = None
-PURCHASE_HISTORY_CONTAINER = None
-PRODUCTS_CONTAINER = None
-CHAT_CONTAINER = None
+# Dimensions of the embedding deployment when config.EMBEDDING_DIMENSIONS is not set
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+
+# Product fields with a full-text index, searched by the hybrid product search
+PRODUCT_FULL_TEXT_PATHS = ["/product_name", "/product_description"]
+
+# Chat message fields returned by get_agent_history (system fields are projected away server side)
+CHAT_MESSAGE_FIELDS = ["seq", "role", "content", "sender", "tool_calls", "tool_call_id", "tool_name", "function_call", "refusal"]
+
+# Transactional batch limits (operations per batch and payload size)
+MAX_BATCH_OPERATIONS = 100
+MAX_BATCH_BYTES = 2 * 1024 * 1024
+BATCH_OPERATION_OVERHEAD_BYTES = 256
+
+# Cosmos client and container references, created on first use
+_client = None
+_containers = {}
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the Cosmos client, creating it (and authenticating) on first use."""
+    global _client
+    
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = clients.create_cosmos_client()
+                print("Cosmos client initialized")
+    return _client
+
+def get_database():
+    return get_client().get_database_client(DATABASE_NAME)
+
+def get_container(container_name):
+    """Return the client for a container; no request is made until the container is used."""
+    
+    container = _containers.get(container_name)
+    if container is None:
+        container = _containers.setdefault(container_name, get_database().get_container_client(container_name))
+    return container
+
+@dataclass
+class BatchResult:
+    """Outcome of a single transactional batch."""
+    operations: int
+    request_charge: float
+    latency_ms: float
+    retries: int = 0
+
+@dataclass
+class BatchWriteResult:
+    """Outcome of writing a list of messages as one or more transactional batches."""
+    batches: list = field(default_factory=list)
+    error: str = None
+    
+    @property
+    def succeeded(self):
+        return self.error is None
+    
+    @property
+    def request_charge(self):
+        return sum(batch.request_charge for batch in self.batches)
 
 # Create database and containers if they don't exist
 def create_database():
-    global DATABASE, USERS_CONTAINER, PURCHASE_HISTORY_CONTAINER, PRODUCTS_CONTAINER, CHAT_CONTAINER
     
     try:
-        DATABASE = client.create_database_if_not_exists(id=DATABASE_NAME)
+        DATABASE = get_client().create_database_if_not_exists(id=DATABASE_NAME)
         
-        USERS_CONTAINER = DATABASE.create_container_if_not_exists(
+        _containers[USERS_CONTAINER_NAME] = DATABASE.create_container_if_not_exists(
             id=USERS_CONTAINER_NAME,
             partition_key=PartitionKey(path="/user_id")
         )
         
-        PURCHASE_HISTORY_CONTAINER = DATABASE.create_container_if_not_exists(
+        _containers[PURCHASE_HISTORY_CONTAINER_NAME] = DATABASE.create_container_if_not_exists(
             id=PURCHASE_HISTORY_CONTAINER_NAME,
             partition_key=PartitionKey(path="/user_id")
         )
         
-        vector_embedding_policy = {
-            "vectorEmbeddings": [
-                {
-                    "path": "/product_description_vector",
-                    "dataType": "float32",
-                    "distanceFunction": "cosine",
-                    "dimensions": 1536
-                },
-            ]
-        }
-        diskann_indexing_policy = {
-            "includedPaths": [
-                {"path": "/*"}
-            ],
-            "excludedPaths": [
-                {"path": "/\"_etag\"/?"}
-            ],
-            "vectorIndexes": [
-                {
-                    "path": "/product_description_vector",
-                    "type": "diskANN",
-                }
-            ]
-        }
-        PRODUCTS_CONTAINER = DATABASE.create_container_if_not_exists(
-            id=PRODUCTS_CONTAINER_NAME,
-            partition_key=PartitionKey(path="/product_id"),
-            vector_embedding_policy=vector_embedding_policy,
-            indexing_policy=diskann_indexing_policy
-        )
+        _containers[PRODUCTS_CONTAINER_NAME] = create_products_container(PRODUCTS_CONTAINER_NAME)
         
-        CHAT_CONTAINER = DATABASE.create_container_if_not_exists(
+        _containers[CHAT_CONTAINER_NAME] = DATABASE.create_container_if_not_exists(
             id=CHAT_CONTAINER_NAME,
             partition_key=PartitionKey(path=["/user_id", "/session_id"], kind="MultiHash"),
             indexing_policy={
@@ -92,6 +115,67 @@ def create_database():
     except exceptions.CosmosHttpResponseError as e:
         print(f"Database creation failed: {e}")
 
+def product_vector_policies(dimensions=None, data_type=None, quantization_bytes=None):
+    """Vector embedding and indexing policies of a products container.
+    
+    Defaults come from config: EMBEDDING_DIMENSIONS (or DEFAULT_EMBEDDING_DIMENSIONS),
+    PRODUCT_VECTOR_DATA_TYPE and PRODUCT_VECTOR_QUANTIZATION_BYTES."""
+    
+    vector_embedding_policy = {
+        "vectorEmbeddings": [
+            {
+                "path": "/product_description_vector",
+                "dataType": data_type or config.PRODUCT_VECTOR_DATA_TYPE,
+                "distanceFunction": "cosine",
+                "dimensions": dimensions or config.EMBEDDING_DIMENSIONS or DEFAULT_EMBEDDING_DIMENSIONS
+            },
+        ]
+    }
+    vector_index = {
+        "path": "/product_description_vector",
+        "type": "diskANN",
+    }
+    # Size of the product-quantized vectors the index keeps in memory; smaller is cheaper but less exact
+    quantization_bytes = config.PRODUCT_VECTOR_QUANTIZATION_BYTES if quantization_bytes is None else quantization_bytes
+    if quantization_bytes:
+        vector_index["quantizationByteSize"] = quantization_bytes
+    diskann_indexing_policy = {
+        "includedPaths": [
+            {"path": "/*"}
+        ],
+        "excludedPaths": [
+            {"path": "/\"_etag\"/?"},
+            {"path": "/product_description_vector/*"}
+        ],
+        "vectorIndexes": [vector_index]
+    }
+    if config.PRODUCT_SEARCH_FULL_TEXT:
+        # For the hybrid product search (see product_search.HYBRID_SEARCH_QUERY)
+        diskann_indexing_policy["fullTextIndexes"] = [{"path": path} for path in PRODUCT_FULL_TEXT_PATHS]
+    return vector_embedding_policy, diskann_indexing_policy
+
+def product_full_text_policy():
+    """Full-text policy of a products container, or None without config.PRODUCT_SEARCH_FULL_TEXT."""
+    
+    if not config.PRODUCT_SEARCH_FULL_TEXT:
+        return None
+    return {
+        "defaultLanguage": "en-US",
+        "fullTextPaths": [{"path": path, "language": "en-US"} for path in PRODUCT_FULL_TEXT_PATHS]
+    }
+
+def create_products_container(container_name, dimensions=None, data_type=None, quantization_bytes=None):
+    """Create a products container with the given vector settings if it doesn't exist."""
+    
+    vector_embedding_policy, indexing_policy = product_vector_policies(dimensions, data_type, quantization_bytes)
+    return get_database().create_container_if_not_exists(
+        id=container_name,
+        partition_key=PartitionKey(path="/product_id"),
+        vector_embedding_policy=vector_embedding_policy,
+        indexing_policy=indexing_policy,
+        full_text_policy=product_full_text_policy()
+    )
+
 def add_user(user_id, first_name, last_name, email, phone):
     
     
@@ -104,10 +188,12 @@ def add_user(user_id, first_name, last_name, email, phone):
         "phone": phone
     }
     try:
-        USERS_CONTAINER.create_item(body=user)
+        with telemetry.cosmos_operation("create_item", USERS_CONTAINER_NAME) as operation:
+            get_container(USERS_CONTAINER_NAME).create_item(body=user, response_hook=operation.record)
     except exceptions.CosmosResourceExistsError:
         print(f"User with user_id {user_id} already exists.")
 
+@resilience.cosmos.guard
 def add_purchase(user_id, date_of_purchase, item_id, amount):
     
     purchase = {
@@ -118,14 +204,16 @@ def add_purchase(user_id, date_of_purchase, item_id, amount):
         "amount": amount
     }
     try:
-        PURCHASE_HISTORY_CONTAINER.create_item(body=purchase)
+        with telemetry.cosmos_operation("create_item", PURCHASE_HISTORY_CONTAINER_NAME) as operation:
+            get_container(PURCHASE_HISTORY_CONTAINER_NAME).create_item(body=purchase, response_hook=operation.record)
     except exceptions.CosmosResourceExistsError:
         print(f"Purchase already exists for user_id {user_id} on {date_of_purchase} for item_id {item_id}.")
 
-def add_product(product_id, product_name, product_description, price):
+def add_product(product_id, product_name, product_description, price, product_description_vector=None):
     
     
-    product_description_vector = azure_open_ai.generate_embedding(product_description)
+    if product_description_vector is None:
+        product_description_vector = azure_open_ai.generate_embedding(product_description)
     
     product = {
         "id": str(product_id),
@@ -137,13 +225,130 @@ def add_product(product_id, product_name, product_description, price):
     }
     
     try:
-        PRODUCTS_CONTAINER.create_item(body=product)
+        with telemetry.cosmos_operation("create_item", PRODUCTS_CONTAINER_NAME) as operation:
+            get_container(PRODUCTS_CONTAINER_NAME).create_item(body=product, response_hook=operation.record)
     except exceptions.CosmosResourceExistsError:
         print(f"Product with product_id {product_id} already exists.")
 
+@resilience.cosmos.guard
+def get_user(user_id) -> dict | None:
+    """Point read a user by user_id, returns None if the user does not exist."""
+    
+    try:
+        with telemetry.cosmos_operation("read_item", USERS_CONTAINER_NAME) as operation:
+            return get_container(USERS_CONTAINER_NAME).read_item(
+                item=str(user_id), partition_key=int(user_id), response_hook=operation.record)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+@resilience.cosmos.guard
+def get_product(product_id) -> dict | None:
+    """Point read a product by product_id, returns None if the product does not exist."""
+    
+    try:
+        with telemetry.cosmos_operation("read_item", PRODUCTS_CONTAINER_NAME) as operation:
+            return get_container(PRODUCTS_CONTAINER_NAME).read_item(
+                item=str(product_id), partition_key=int(product_id), response_hook=operation.record)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+@resilience.cosmos.guard
+def get_purchases_for_user(user_id, item_id=None) -> list[dict]:
+    """Return a user's purchases, optionally only those of one item, from the user's partition."""
+    
+    query = "SELECT c.user_id, c.date_of_purchase, c.item_id, c.amount FROM c"
+    parameters = []
+    if item_id is not None:
+        query += " WHERE c.item_id=@item_id"
+        parameters.append({"name": "@item_id", "value": int(item_id)})
+    
+    container = get_container(PURCHASE_HISTORY_CONTAINER_NAME)
+    with telemetry.cosmos_operation("query_items", PURCHASE_HISTORY_CONTAINER_NAME) as operation:
+        return query_all(container, operation, query=query, parameters=parameters, partition_key=int(user_id))
+
+def query_all(container, operation, **kwargs):
+    """Run a query to completion, recording every request it makes on a telemetry operation."""
+    
+    items = []
+    with telemetry.record_requests(operation):
+        for page in container.query_items(**kwargs).by_page():
+            items.extend(page)
+    return items
+
+def get_product_vectors():
+    """Stream every product with its description vector, for building a local vector index."""
+    
+    return get_container(PRODUCTS_CONTAINER_NAME).query_items(
+        query="SELECT c.id, c.product_id, c.product_name, c.price, c.product_description, c.product_description_vector FROM c",
+        enable_cross_partition_query=True
+    )
+
+class ChangeFeedWatcher:
+    """Poll a container's change feed in a background thread and pass each changed document to listeners.
+    
+    The feed starts at the time of the first poll: poll once before reading a snapshot of the
+    container to also hear about the changes made while it is read. Deletes do not appear in the
+    change feed, so listeners that cache documents should still expire them."""
+    
+    def __init__(self, container_name, poll_interval=config.CHANGE_FEED_POLL_SECONDS):
+        self.container_name = container_name
+        self.poll_interval = poll_interval
+        self.listeners = []
+        self._continuation = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def poll(self):
+        """Read the changes since the last poll and notify the listeners."""
+        
+        container = get_container(self.container_name)
+        
+        # Response headers of this feed's own requests, where the SDK also puts the continuation
+        # for the next poll (the client's last_response_headers are overwritten by other threads)
+        responses = []
+        
+        def record(headers, result):
+            responses.append(headers)
+        
+        if self._continuation is None:
+            changes = container.query_items_change_feed(start_time="Now", response_hook=record)
+        else:
+            changes = container.query_items_change_feed(continuation=self._continuation, response_hook=record)
+        
+        for document in changes:
+            for listener in self.listeners:
+                listener(document)
+        
+        if responses and responses[-1].get("etag"):
+            self._continuation = responses[-1]["etag"]
+    
+    def _run(self):
+        # The first poll establishes the starting point of the feed
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                # Keep polling: the caches rely on this thread to hear about changes
+                print(f"Change feed poll failed for {self.container_name}: {e}")
+            if self._stop.wait(self.poll_interval):
+                break
+    
+    def start(self):
+        """Start polling in a daemon thread, without blocking the caller on Cosmos DB."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"change-feed-{self.container_name}", daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+
 def preview_table(container_name):
     
-    container = DATABASE.get_container_client(container_name)
+    container = get_container(container_name)
     
     items = container.query_items(
         query="SELECT * FROM c",
@@ -162,66 +367,147 @@ def preview_table(container_name):
             item.pop("product_description_vector", None)
         print(item)
 
-def get_agent_history(user_id = None, session_id = None):
+@resilience.cosmos.guard
+def get_agent_history(user_id, session_id, max_items=50, continuation_token=None):
+    """Return one page of a session's chat history, newest page first.
     
-    container = DATABASE.get_container_client(CHAT_CONTAINER_NAME)
+    Only the [user_id, session_id] partition is queried. Messages in the page are returned in
+    chronological order together with a continuation token for the next (older) page, or None."""
     
-    items = container.query_items(
-        query="SELECT * FROM c WHERE c.user_id=@user_id AND c.session_id=@session_id",
-        parameters=[
-            {"name": "@user_id", "value": user_id},
-            {"name": "@session_id", "value": session_id}
-        ],
-        enable_cross_partition_query=False
-    )
+    projection = ", ".join(f"c.{name}" for name in CHAT_MESSAGE_FIELDS)
     
-    items = container.query_items("SELECT * FROM c",
-        enable_cross_partition_query=True
-    )
+    container = get_container(CHAT_CONTAINER_NAME)
     
-    # Convert iterator to list
-    items = list(items)
+    with telemetry.cosmos_operation("query_items", CHAT_CONTAINER_NAME) as operation, telemetry.record_requests(operation):
+        pages = container.query_items(
+            # Summaries and other non-message documents carry a type and are not part of the history
+            query=f"SELECT {projection} FROM c WHERE NOT IS_DEFINED(c.type) ORDER BY c.seq DESC",
+            partition_key=[user_id, session_id],
+            max_item_count=max_items
+        ).by_page(continuation_token)
+        try:
+            items = list(next(pages))
+        except StopIteration:
+            return [], None
     
-    # Clean up the items for display
-    for item in items:
-        item.pop("id", None)
-        item.pop("user_id", None)
-        item.pop("session_id", None)
-        item.pop("_rid", None)
-        item.pop("_self", None)
-        item.pop("_etag", None)
-        item.pop("_attachments", None)
-        item.pop("_ts", None)
-        print(item)
+    # Pages are read newest first, display them oldest first
+    items.reverse()
         
-    return items
+    return items, pages.continuation_token
+
+@resilience.cosmos.guard
+def get_chat_summary(user_id, session_id) -> dict | None:
+    """Point read the conversation summary of a session, returns None if there is none yet."""
+    
+    try:
+        with telemetry.cosmos_operation("read_item", CHAT_CONTAINER_NAME) as operation:
+            return get_container(CHAT_CONTAINER_NAME).read_item(
+                item=f"{user_id}_{session_id}_summary", partition_key=[user_id, session_id], response_hook=operation.record)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+def upsert_chat_summary(user_id, session_id, summary):
+    """Store the conversation summary of a session next to its messages in the Chat container."""
+    
+    document = {
+        **summary,
+        "id": f"{user_id}_{session_id}_summary",
+        "user_id": user_id,
+        "session_id": session_id,
+        "type": "summary",
+    }
+    try:
+        with telemetry.cosmos_operation("upsert_item", CHAT_CONTAINER_NAME) as operation:
+            resilience.cosmos.call(get_container(CHAT_CONTAINER_NAME).upsert_item, body=document, response_hook=operation.record)
+    except exceptions.CosmosHttpResponseError as e:
+        print(f"An error occurred saving the summary: {e.message}")
+    except resilience.CircuitOpenError as e:
+        print(f"Not saving the summary: {e}")
 
 def add_agent_message(message):
     
     try:
-        CHAT_CONTAINER.create_item(body=message, enable_automatic_id_generation=True)
+        get_container(CHAT_CONTAINER_NAME).create_item(body=message, enable_automatic_id_generation=True)
     except exceptions.CosmosResourceExistsError:
         print("error")
         #print(f"Chat message already exists for user_id {message["userId"]} in session {message["sessionId"]}.")
 
-def tx_batch_add_agent_messages(user_id, session_id, messages):
+def message_id(user_id, session_id, seq):
+    """Deterministic id for a chat message, derived from its session and turn sequence number."""
+    return f"{user_id}_{session_id}_{seq:08d}"
+
+def chunk_messages(messages, max_operations=MAX_BATCH_OPERATIONS, max_bytes=MAX_BATCH_BYTES):
+    """Split messages into ordered chunks that fit within the transactional batch limits."""
     
-    try:
-        batch_operations = []
+    chunks = []
+    current, current_bytes = [], 0
+    
+    for message in messages:
+        size = len(json.dumps(message).encode("utf-8")) + BATCH_OPERATION_OVERHEAD_BYTES
+        if current and (len(current) >= max_operations or current_bytes + size > max_bytes):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(message)
+        current_bytes += size
+    
+    if current:
+        chunks.append(current)
+    
+    return chunks
 
-        for message in messages:
-            message["id"] = str(uuid.uuid4()) # Generate a new unique ID for each message
-            tuple_to_append = ("create", (message,))
-            batch_operations.append(tuple_to_append)
+def _execute_batch(partition_key, batch_operations):
+    """Execute one transactional batch; throttled (429) and conflicting-write (449) responses are
+    retried by resilience.cosmos, and all the attempts are recorded as one operation."""
+    
+    start = time.perf_counter()
+    container = get_container(CHAT_CONTAINER_NAME)
+    with telemetry.cosmos_operation("execute_item_batch", CHAT_CONTAINER_NAME) as operation:
+        resilience.cosmos.call(
+            container.execute_item_batch, partition_key=partition_key, batch_operations=batch_operations,
+            response_hook=operation.record, on_retry=operation.retried)
+    return BatchResult(
+        operations=len(batch_operations),
+        request_charge=operation.request_charge,
+        latency_ms=(time.perf_counter() - start) * 1000,
+        retries=operation.retries,
+    )
 
-        partition_key = [user_id, session_id]
+def tx_batch_add_agent_messages(user_id, session_id, messages):
+    """Write messages to the Chat container in ordered transactional batches under one partition.
     
-        # Execute the batch operation
-        response = CHAT_CONTAINER.execute_item_batch(partition_key=partition_key, batch_operations=batch_operations)
-        #print("\nResults for the batch operations: {}\n".format(response))
+    Returns a BatchWriteResult with the RU charge and latency of each batch sent."""
+    
+    result = BatchWriteResult()
+    partition_key = [user_id, session_id]
+    
+    for message in messages:
+        if message.get("seq") is not None:
+            # Sequenced messages get a deterministic id, so writing a turn again overwrites it in place
+            message["id"] = message_id(user_id, session_id, message["seq"])
+        else:
+            message["id"] = str(uuid.uuid4()) # Generate a new unique ID for each message
+    
+    for chunk in chunk_messages(messages):
+        # Upserts, so a chunk mixing messages already written (by a retry or a replayed journal)
+        # with new ones is written whole rather than rejected as a conflict
+        batch_operations = [("upsert", (message,)) for message in chunk]
         
-    except exceptions.CosmosHttpResponseError as e:
-        print(f"An error occurred: {e.message}")
+        try:
+            result.batches.append(_execute_batch(partition_key, batch_operations))
+        except exceptions.CosmosBatchOperationError as e:
+            print(f"An error occurred: {e.message}")
+            result.error = e.message
+            break
+        except exceptions.CosmosHttpResponseError as e:
+            print(f"An error occurred: {e.message}")
+            result.error = e.message
+            break
+        except resilience.CircuitOpenError as e:
+            print(f"An error occurred: {e}")
+            result.error = str(e)
+            break
+    
+    return result
 
 # Initialize and load database
 def initialize_database():
@@ -229,54 +515,6 @@ def initialize_database():
     # Create the database and containers if not exists (legacy, rerun azd up if needed)
     create_database()
 
-    # Add some initial users
-    initial_users = [
-        (1, "Alice", "Smith", "alice@test.com", "123-456-7890"),
-        (2, "Bob", "Johnson", "bob@test.com", "234-567-8901"),
-        (3, "Sarah", "Brown", "sarah@test.com", "555-567-8901"),
-    ]
-
-    for user in initial_users:
-        add_user(*user)
-
-    # Add some initial purchases
-    initial_purchases = [
-        (1, "2024-01-01", 101, 99.99),
-        (2, "2023-12-25", 100, 39.99),
-        (3, "2023-11-14", 307, 49.99),
-    ]
-
-    for purchase in initial_purchases:
-        add_purchase(*purchase)
-
-    initial_products = [
-        (7, "Hat", "A hat is a stylish and functional accessory designed to shield the "
-            "head from the elements while adding a touch of personality to any outfit. "
-            "Crafted from materials such as wool, cotton, straw, or synthetic blends, hats come "
-            "in a variety of shapes and designs, from wide-brimmed sun hats to snug beanies and classic fedoras. "
-            "They offer versatile use, providing protection from sun, rain, or cold while serving as a "
-            "fashionable statement piece. Whether for outdoor adventures, formal occasions, "
-            "or casual outings, a hat combines practicality and style, making it a "
-            "timeless wardrobe essential", 19.99),
-        (8, "Wool socks", "Wool socks are premium, cozy footwear accessories designed "
-            "to provide exceptional warmth, comfort, and moisture-wicking properties. "
-            "Made from natural wool fibers, they are ideal for keeping feet insulated in "
-            "cold weather while remaining breathable in warmer conditions. These socks are soft, "
-            "durable, and naturally odor-resistant, making them perfect for everyday wear, "
-            "outdoor adventures, or lounging at home. With their ability to regulate "
-            "temperature and cushion feet, wool socks offer unparalleled comfort, "
-            "making them an essential addition to any wardrobe, whether for hiking, working, "
-            "or simply relaxing.", 29.99),
-        (9, "Shoes","Shoes are versatile footwear designed to protect and comfort "
-                "the feet while enabling effortless movement and style. They "
-                "come in a wide range of designs, materials, and functions, catering "
-                "to various activities, from formal occasions to rugged outdoor adventures. "
-                "Crafted from durable materials such as leather, canvas, or synthetic blends, "
-                "shoes provide support, cushioning, and stability through features like rubber soles, "
-                "padded insoles, and secure fastenings. Available in diverse styles such as sneakers, boots, "
-                "sandals, and dress shoes, they blend functionality with aesthetic appeal, making them a staple "
-                "for every wardrobe", 39.99),
-    ]
-
-    for product in initial_products:
-        add_product(*product)
\ No newline at end of file
+    # Load the sample users, purchases and products (see data/), skipping rows already in the containers
+    import ingest
+    ingest.ingest_directory(ingest.SAMPLE_DATA_DIR, reconcile=True)
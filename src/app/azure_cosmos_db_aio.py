@@ -0,0 +1,104 @@
+from azure.cosmos import exceptions
+
+import clients
+import resilience
+import telemetry
+from azure_cosmos_db import DATABASE_NAME, USERS_CONTAINER_NAME, PURCHASE_HISTORY_CONTAINER_NAME, PRODUCTS_CONTAINER_NAME
+
+# Asyncio counterparts of the data access functions in azure_cosmos_db, used when config.ASYNC_MODE is set.
+# The client is bound to the event loop it is first used on.
+
+_client = None
+_containers = {}
+
+def get_client():
+    """Return the asyncio Cosmos client, creating it on first use."""
+    global _client
+    
+    if _client is None:
+        _client = clients.create_async_cosmos_client()
+    return _client
+
+def get_container(container_name):
+    container = _containers.get(container_name)
+    if container is None:
+        container = _containers.setdefault(
+            container_name, get_client().get_database_client(DATABASE_NAME).get_container_client(container_name))
+    return container
+
+async def close():
+    global _client
+    
+    if _client is not None:
+        await _client.close()
+        _client = None
+        _containers.clear()
+
+@resilience.cosmos.guard
+async def get_user(user_id) -> dict | None:
+    """Point read a user by user_id, returns None if the user does not exist."""
+    
+    try:
+        with telemetry.cosmos_operation("read_item", USERS_CONTAINER_NAME) as operation:
+            return await get_container(USERS_CONTAINER_NAME).read_item(
+                item=str(user_id), partition_key=int(user_id), response_hook=operation.record)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+@resilience.cosmos.guard
+async def get_product(product_id) -> dict | None:
+    """Point read a product by product_id, returns None if the product does not exist."""
+    
+    try:
+        with telemetry.cosmos_operation("read_item", PRODUCTS_CONTAINER_NAME) as operation:
+            return await get_container(PRODUCTS_CONTAINER_NAME).read_item(
+                item=str(product_id), partition_key=int(product_id), response_hook=operation.record)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+@resilience.cosmos.guard
+async def get_purchases_for_user(user_id, item_id=None) -> list[dict]:
+    """Return a user's purchases, optionally only those of one item, from the user's partition."""
+    
+    query = "SELECT c.user_id, c.date_of_purchase, c.item_id, c.amount FROM c"
+    parameters = []
+    if item_id is not None:
+        query += " WHERE c.item_id=@item_id"
+        parameters.append({"name": "@item_id", "value": int(item_id)})
+    
+    container = get_container(PURCHASE_HISTORY_CONTAINER_NAME)
+    with telemetry.cosmos_operation("query_items", PURCHASE_HISTORY_CONTAINER_NAME) as operation:
+        return await query_all(container, operation, query=query, parameters=parameters, partition_key=int(user_id))
+
+@resilience.cosmos.guard
+async def add_purchase(user_id, date_of_purchase, item_id, amount):
+    
+    purchase = {
+        "id": f"{user_id}_{item_id}_{date_of_purchase}",
+        "user_id": user_id,
+        "date_of_purchase": date_of_purchase,
+        "item_id": item_id,
+        "amount": amount
+    }
+    try:
+        with telemetry.cosmos_operation("create_item", PURCHASE_HISTORY_CONTAINER_NAME) as operation:
+            await get_container(PURCHASE_HISTORY_CONTAINER_NAME).create_item(body=purchase, response_hook=operation.record)
+    except exceptions.CosmosResourceExistsError:
+        print(f"Purchase already exists for user_id {user_id} on {date_of_purchase} for item_id {item_id}.")
+
+@resilience.cosmos.guard
+async def query_products(query, parameters):
+    """Run a query across the Products container and return the results as a list."""
+    
+    container = get_container(PRODUCTS_CONTAINER_NAME)
+    with telemetry.cosmos_operation("query_items", PRODUCTS_CONTAINER_NAME) as operation:
+        return await query_all(container, operation, query=query, parameters=parameters, populate_query_metrics=True)
+
+async def query_all(container, operation, **kwargs):
+    """Run a query to completion, recording every request it makes on a telemetry operation."""
+    
+    items = []
+    with telemetry.record_requests(operation):
+        async for page in container.query_items(**kwargs).by_page():
+            items.extend([item async for item in page])
+    return items
@@ -1,21 +1,161 @@
-import json
+import base64
 import config
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from openai import AzureOpenAI
+import clients
+import resilience
+import vector_utils
+from embedding_cache import EmbeddingCache
 
 
-token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
+# Azure OpenAI clients, created on first use
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
 
-aoai_client = AzureOpenAI(
-    api_version="2024-09-01-preview",
-    azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
-    azure_ad_token_provider=token_provider
-)
-print("[DEBUG] Initialized Azure OpenAI client.")
+def get_client():
+    """Return the Azure OpenAI client, creating it on first use."""
+    global _client
+    
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = clients.create_openai_client()
+                print("[DEBUG] Initialized Azure OpenAI client.")
+    return _client
 
-def generate_embedding(text):
-    response = aoai_client.embeddings.create(input=text, model=config.AZURE_OPENAI_EMBEDDING_DEPLOYMENT)
-    json_response = response.model_dump_json(indent=2)
-    parsed_response = json.loads(json_response)
-    return parsed_response['data'][0]['embedding']
\ No newline at end of file
+def get_async_client():
+    """Return the asyncio Azure OpenAI client, creating it on first use."""
+    global _async_client
+    
+    if _async_client is None:
+        _async_client = clients.create_async_openai_client()
+    return _async_client
+
+# Embeddings already generated, keyed by text and deployment
+embedding_cache = EmbeddingCache(max_items=config.EMBEDDING_CACHE_MAX_ITEMS, path=config.EMBEDDING_CACHE_PATH)
+
+def embedding_model(dimensions=None):
+    """Deployment and dimensions to embed with, and the name they are cached under."""
+    
+    deployment = config.AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+    dimensions = dimensions or config.EMBEDDING_DIMENSIONS or None
+    # Shortened embeddings of the same text are different vectors, so they are cached apart
+    cache_name = f"{deployment}@{dimensions}" if dimensions else deployment
+    return deployment, dimensions, cache_name
+
+def _dimensions_argument(dimensions):
+    return {"dimensions": dimensions} if dimensions else {}
+
+def _embed(inputs, deployment, dimensions=None):
+    """Request embeddings as base64 float32 and return them packed, in input order.
+    
+    Decoding base64 straight into float32 bytes avoids building and parsing a JSON list of floats."""
+    
+    texts = [inputs] if isinstance(inputs, str) else inputs
+    response = resilience.openai_embeddings.call(
+        get_client().embeddings.create, cost=sum(estimate_tokens(text) for text in texts),
+        input=inputs, model=deployment, encoding_format="base64", **_dimensions_argument(dimensions))
+    return [base64.b64decode(item.embedding) for item in sorted(response.data, key=lambda item: item.index)]
+
+def generate_embedding(text, compact=False, dimensions=None):
+    """Embed text, returned as a list of floats or, with compact=True, as a float32 vector.
+    
+    dimensions defaults to config.EMBEDDING_DIMENSIONS."""
+    
+    deployment, dimensions, cache_name = embedding_model(dimensions)
+    
+    data = embedding_cache.get(text, cache_name)
+    if data is None:
+        data = _embed(text, deployment, dimensions)[0]
+        embedding_cache.set(text, cache_name, data)
+    
+    return vector_utils.unpack(data, compact)
+
+async def generate_embedding_async(text, compact=False, dimensions=None):
+    """Asyncio version of generate_embedding, sharing the same embedding cache."""
+    
+    deployment, dimensions, cache_name = embedding_model(dimensions)
+    
+    data = embedding_cache.get(text, cache_name)
+    if data is None:
+        response = await resilience.openai_embeddings.call_async(
+            get_async_client().embeddings.create, cost=estimate_tokens(text), input=text, model=deployment, encoding_format="base64", **_dimensions_argument(dimensions))
+        data = base64.b64decode(response.data[0].embedding)
+        embedding_cache.set(text, cache_name, data)
+    
+    return vector_utils.unpack(data, compact)
+
+def summarize_conversation(previous_summary, messages):
+    """Summarize earlier conversation turns, folding in the previous summary if there is one."""
+    
+    transcript = "\n".join(
+        f"{m.get('sender') or m['role']}: {m.get('content') or ''}" for m in messages if m.get("content")
+    )
+    prompt = (
+        "Summarize this customer service conversation in a few sentences. Keep every user id, item id, "
+        "product id, product name, price and open request.\n\n"
+        f"Earlier summary: {previous_summary or 'none'}\n\nConversation:\n{transcript}"
+    )
+    
+    messages = [{"role": "user", "content": prompt}]
+    completion = resilience.openai_chat.call(
+        get_client().chat.completions.create, cost=resilience.estimate_chat_tokens(messages),
+        model=config.AZURE_OPENAI_GPT_DEPLOYMENT,
+        messages=messages,
+        max_tokens=300,
+    )
+    return completion.choices[0].message.content
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token), used to size embedding batches."""
+    return len(text) // 4 + 1
+
+def batch_texts(texts, max_items=config.EMBEDDING_BATCH_MAX_ITEMS, max_tokens=config.EMBEDDING_BATCH_MAX_TOKENS):
+    """Split texts into ordered batches bounded by input count and estimated tokens."""
+    
+    batches = []
+    current, current_tokens = [], 0
+    
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    
+    if current:
+        batches.append(current)
+    
+    return batches
+
+def generate_embeddings(texts, max_concurrency=config.EMBEDDING_MAX_CONCURRENCY, compact=False, dimensions=None):
+    """Generate embeddings for many texts, returned in input order.
+    
+    Cached and duplicate texts are embedded once at most, the rest are packed into batched
+    embedding requests that run concurrently, up to max_concurrency at a time."""
+    
+    deployment, dimensions, cache_name = embedding_model(dimensions)
+    packed = [None] * len(texts)
+    
+    # Positions of each text that still needs an embedding
+    pending = {}
+    for i, text in enumerate(texts):
+        data = embedding_cache.get(text, cache_name)
+        if data is not None:
+            packed[i] = data
+        else:
+            pending.setdefault(text, []).append(i)
+    
+    batches = batch_texts(list(pending))
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        results = executor.map(lambda batch: _embed(batch, deployment, dimensions), batches)
+        for batch, vectors in zip(batches, results):
+            for text, data in zip(batch, vectors):
+                embedding_cache.set(text, cache_name, data)
+                for i in pending[text]:
+                    packed[i] = data
+    
+    return [vector_utils.unpack(data, compact) for data in packed]
\ No newline at end of file
@@ -0,0 +1,61 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupReport:
+    """Wall-clock time spent in each startup phase."""
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def __str__(self):
+        lines = [f"Startup took {self.total_seconds * 1000:.1f} ms"]
+        lines += [f"  {name:<24} {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        return "\n".join(lines)
+
+
+def bootstrap(warm=False, watch_changes=True):
+    """Prepare the application to serve requests and return a StartupReport.
+
+    Clients are created lazily, so by default no request is made to Azure here. Set warm to
+    authenticate and connect to Cosmos DB and Azure OpenAI up front instead of on the first
+    request. Seeding and previewing data are separate, opt-in commands (see cli.py)."""
+
+    report = StartupReport()
+
+    with report.phase("import modules"):
+        import config
+        import clients
+        import azure_cosmos_db
+        import azure_open_ai
+        import multi_agent_service
+
+    if warm:
+        with report.phase("credential"):
+            clients.warm_credential()
+        with report.phase("cosmos client"):
+            azure_cosmos_db.get_client()
+        with report.phase("openai client"):
+            azure_open_ai.get_client()
+
+    if watch_changes:
+        with report.phase("cache invalidation"):
+            multi_agent_service.start_cache_invalidation()
+
+    if watch_changes and config.LOCAL_VECTOR_INDEX != "off":
+        with report.phase("local vector index"):
+            multi_agent_service.start_local_vector_index()
+
+    return report
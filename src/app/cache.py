@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe, bounded LRU cache whose entries expire after a time-to-live.
+
+    Set ttl_seconds to None to keep entries until they are evicted or invalidated."""
+
+    def __init__(self, max_items=1024, ttl_seconds=300):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        # Tokens of the loads in progress per key; invalidating a key drops them
+        self._loads = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        # Returns the (expires_at, value) entry for key, dropping it if it has expired
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss."""
+
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Cache value under key, evicting the least recently used entries beyond max_items."""
+
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        expires_at = None if self.ttl_seconds is None else time.monotonic() + self.ttl_seconds
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _start_load(self, key):
+        token = object()
+        with self._lock:
+            self._loads.setdefault(key, set()).add(token)
+        return token
+
+    def _finish_load(self, key, token, value):
+        # Cache the loaded value unless key was invalidated while it was being loaded: the value
+        # may predate the change
+        with self._lock:
+            tokens = self._loads.get(key)
+            if tokens is None or token not in tokens:
+                return
+            tokens.discard(token)
+            if not tokens:
+                del self._loads[key]
+            if value is not None:
+                self._store(key, value)
+
+    def get_or_load(self, key, loader):
+        """Read-through lookup: return the cached value or load, cache and return it.
+
+        None results are not cached, so items created later are picked up on the next call."""
+
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        token, value = self._start_load(key), None
+        try:
+            value = loader(key)
+        finally:
+            self._finish_load(key, token, value)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """get_or_load with a coroutine function as the loader."""
+
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        token, value = self._start_load(key), None
+        try:
+            value = await loader(key)
+        finally:
+            self._finish_load(key, token, value)
+        return value
+
+    def invalidate(self, key):
+        """Drop key from the cache if present, and keep loads in progress from caching it."""
+
+        with self._lock:
+            self._loads.pop(key, None)
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loads.clear()
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
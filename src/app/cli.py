@@ -0,0 +1,88 @@
+import argparse
+
+import azure_cosmos_db
+import bootstrap
+import config
+import ingest
+import migrate_vectors
+import router
+
+
+def provision(args):
+    azure_cosmos_db.create_database()
+
+def seed(args):
+    azure_cosmos_db.create_database()
+    ingest.ingest_directory(args.data_dir, state_path=args.state, max_concurrency=args.concurrency, reconcile=args.reconcile)
+
+def preview(args):
+    for container_name in args.containers:
+        azure_cosmos_db.preview_table(container_name)
+
+def migrate(args):
+    print(migrate_vectors.migrate_products(
+        args.target, dimensions=args.dimensions, data_type=args.data_type,
+        quantization_bytes=args.quantization_bytes, reembed=args.reembed, max_concurrency=args.concurrency))
+
+def route_eval(args):
+    examples = router.load_examples(args.examples)
+    evaluation_router = router.create_router()
+    for threshold in args.threshold:
+        evaluation_router.threshold, evaluation_router.margin = threshold, args.margin
+        results = router.evaluate(evaluation_router, examples, triage_ms=args.triage_ms)
+        print(f"threshold {threshold:.2f} margin {args.margin:.2f}: "
+              f"routed {results['routed']}/{results['examples']} ({results['coverage']:.0%}), "
+              f"accuracy {results['accuracy']:.0%}, misrouted {results['misrouted']}, "
+              f"{results['average_route_ms']:.0f} ms routing, ~{results['saved_ms_per_request']:.0f} ms saved per request")
+
+def startup(args):
+    print(bootstrap.bootstrap(warm=args.warm, watch_changes=False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Administrative commands for the multi-agent sample.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("provision", help="create the database and containers if they don't exist").set_defaults(func=provision)
+
+    seed_parser = commands.add_parser("seed", help="load users, purchases and products into Azure Cosmos DB")
+    seed_parser.add_argument("--data-dir", default=ingest.SAMPLE_DATA_DIR, help="directory with users/purchases/products .jsonl or .csv files")
+    seed_parser.add_argument("--state", default=".ingest_state.json", help="checkpoint file used to skip unchanged rows and resume")
+    seed_parser.add_argument("--concurrency", type=int, default=8, help="maximum concurrent write requests")
+    seed_parser.add_argument("--reconcile", action="store_true", help="seed the checkpoint from content hashes already in Cosmos DB")
+    seed_parser.set_defaults(func=seed)
+
+    preview_parser = commands.add_parser("preview", help="print the documents in one or more containers")
+    preview_parser.add_argument("containers", nargs="*", default=[
+        azure_cosmos_db.USERS_CONTAINER_NAME,
+        azure_cosmos_db.PURCHASE_HISTORY_CONTAINER_NAME,
+        azure_cosmos_db.PRODUCTS_CONTAINER_NAME,
+    ])
+    preview_parser.set_defaults(func=preview)
+
+    migrate_parser = commands.add_parser("migrate-vectors", help="copy the products into a new container with other vector settings")
+    migrate_parser.add_argument("target", help="name of the products container to create and fill")
+    migrate_parser.add_argument("--dimensions", type=int, help="embedding dimensions (default: EMBEDDING_DIMENSIONS or the model's)")
+    migrate_parser.add_argument("--data-type", choices=["float32", "int8"], default="float32", help="vector data type to store")
+    migrate_parser.add_argument("--quantization-bytes", type=int, help="quantizationByteSize of the vector index")
+    migrate_parser.add_argument("--reembed", action="store_true", help="embed descriptions again instead of converting the stored vectors")
+    migrate_parser.add_argument("--concurrency", type=int, default=8, help="maximum concurrent write requests")
+    migrate_parser.set_defaults(func=migrate)
+
+    route_parser = commands.add_parser("route-eval", help="measure the pre-routing accuracy and latency saved on labelled requests")
+    route_parser.add_argument("--examples", help="JSON lines file of {text, agent} (default: data/routing_examples.jsonl)")
+    route_parser.add_argument("--threshold", type=float, nargs="+", default=[config.ROUTER_THRESHOLD], help="one or more thresholds to compare")
+    route_parser.add_argument("--margin", type=float, default=config.ROUTER_MARGIN)
+    route_parser.add_argument("--triage-ms", type=float, default=800.0, help="latency of a triage agent completion")
+    route_parser.set_defaults(func=route_eval)
+
+    startup_parser = commands.add_parser("startup", help="print the time spent in each startup phase")
+    startup_parser.add_argument("--warm", action="store_true", help="include creating the Azure clients")
+    startup_parser.set_defaults(func=startup)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
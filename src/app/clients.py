@@ -0,0 +1,248 @@
+import asyncio
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient
+from azure.cosmos.documents import ConnectionPolicy, RetryOptions
+from azure.identity import AzureCliCredential, DefaultAzureCredential, EnvironmentCredential, ManagedIdentityCredential
+from openai import AsyncAzureOpenAI, AzureOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+from requests.adapters import HTTPAdapter
+
+import config
+import telemetry
+
+# Factory of the Azure clients. Cosmos DB and Azure OpenAI, sync and asyncio, share one credential
+# and its tokens, and each client keeps a pool of keep-alive connections, so credential discovery,
+# token acquisition and TLS handshakes are paid once per process rather than on every cold path.
+
+OPENAI_API_VERSION = "2024-09-01-preview"
+OPENAI_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+# A token is never handed out with less than this many seconds left
+TOKEN_MIN_VALIDITY_SECONDS = 30
+
+
+class CachedCredential:
+    """Token credential keeping the tokens of an underlying credential, per scope.
+
+    A token is renewed in the background once it is within refresh_margin seconds of expiring,
+    while the current one keeps being served, so requests do not wait on token acquisition."""
+
+    def __init__(self, credential, refresh_margin=config.TOKEN_REFRESH_MARGIN_SECONDS):
+        self.credential = credential
+        self.refresh_margin = refresh_margin
+        self._tokens = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def fresh_token(self, *scopes):
+        """The cached token for scopes if it is not due for renewal yet, else None."""
+
+        token = self._tokens.get(scopes)
+        if token is not None and token.expires_on - time.time() > self.refresh_margin:
+            return token
+        return None
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        if claims or tenant_id:
+            # Claims challenges and other tenants always need a new token
+            return self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+
+        token = self._tokens.get(scopes)
+        remaining = token.expires_on - time.time() if token is not None else 0
+        if remaining > self.refresh_margin:
+            return token
+        if remaining > TOKEN_MIN_VALIDITY_SECONDS:
+            self._refresh_in_background(scopes, kwargs)
+            return token
+
+        with self._lock:
+            token = self._tokens.get(scopes)
+            if token is None or token.expires_on - time.time() <= TOKEN_MIN_VALIDITY_SECONDS:
+                token = self._tokens[scopes] = self.credential.get_token(*scopes, **kwargs)
+        return token
+
+    def _refresh_in_background(self, scopes, kwargs):
+        with self._lock:
+            if scopes in self._refreshing:
+                return
+            self._refreshing.add(scopes)
+
+        def refresh():
+            try:
+                token = self.credential.get_token(*scopes, **kwargs)
+                with self._lock:
+                    self._tokens[scopes] = token
+            except Exception as e:
+                # The current token is still valid; the next request retries
+                print(f"Token refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(scopes)
+
+        threading.Thread(target=refresh, name="token-refresh", daemon=True).start()
+
+    def close(self):
+        self.credential.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+class AsyncCachedCredential:
+    """Asyncio view of a CachedCredential for the asyncio clients, sharing its tokens."""
+
+    def __init__(self, credential):
+        self.credential = credential
+
+    async def get_token(self, *scopes, **kwargs):
+        token = None if kwargs.get("claims") else self.credential.fresh_token(*scopes)
+        return token or await asyncio.to_thread(self.credential.get_token, *scopes, **kwargs)
+
+    async def close(self):
+        # The shared credential outlives the asyncio clients
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+# Shared credential, created on first use
+_credential = None
+_credential_lock = threading.Lock()
+
+def create_credential(kind=config.AZURE_CREDENTIAL):
+    """Credential of the given kind; any kind but "default" skips DefaultAzureCredential's discovery."""
+
+    if kind == "managed_identity":
+        return ManagedIdentityCredential(client_id=config.AZURE_CLIENT_ID)
+    if kind == "cli":
+        return AzureCliCredential()
+    if kind == "environment":
+        return EnvironmentCredential()
+    if kind == "default":
+        return DefaultAzureCredential()
+    raise ValueError(f"Unknown AZURE_CREDENTIAL: {kind}")
+
+def get_credential():
+    """Return the credential shared by all the Azure clients."""
+    global _credential
+
+    if _credential is None:
+        with _credential_lock:
+            if _credential is None:
+                _credential = CachedCredential(create_credential())
+    return _credential
+
+def get_async_credential():
+    return AsyncCachedCredential(get_credential())
+
+def cosmos_scope(endpoint=None):
+    """Token scope of a Cosmos DB account, as the SDK requests it."""
+
+    url = urlparse(endpoint or config.AZURE_COSMOSDB_ENDPOINT)
+    return f"{url.scheme}://{url.hostname}/.default"
+
+def warm_credential():
+    """Acquire the Cosmos DB and Azure OpenAI tokens ahead of the first request."""
+
+    credential = get_credential()
+    credential.get_token(cosmos_scope())
+    credential.get_token(OPENAI_SCOPE)
+
+
+def cosmos_connection_policy():
+    """Connection policy without the SDK's own throttling (429) retries.
+
+    resilience.py retries throttled requests and slows its rate limiter down when they happen; the
+    SDK would otherwise retry them itself up to 9 times over 30 seconds, under every attempt of
+    resilience.py. retry_total=0 can't turn them off, as the SDK takes 0 for "not set"."""
+
+    policy = ConnectionPolicy()
+    policy.RetryOptions = RetryOptions(max_retry_attempt_count=0, max_wait_time_in_seconds=0)
+    return policy
+
+def cosmos_options():
+    """Connection options shared by the sync and asyncio Cosmos clients."""
+
+    options = {
+        "connection_timeout": config.HTTP_TIMEOUT_SECONDS,
+        "connection_policy": cosmos_connection_policy(),
+        # Request charges of every query request, see telemetry.record_requests
+        "raw_response_hook": telemetry.record_response,
+    }
+    if config.COSMOS_PREFERRED_REGIONS:
+        options["preferred_locations"] = config.COSMOS_PREFERRED_REGIONS
+    if config.COSMOS_CONSISTENCY_LEVEL:
+        options["consistency_level"] = config.COSMOS_CONSISTENCY_LEVEL
+    return options
+
+def cosmos_transport():
+    """Requests transport with a connection pool sized for concurrent chat turns.
+
+    The default pool keeps 10 connections per host; connections over that are closed after
+    each request and have to be opened (with a TLS handshake) again."""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session)
+
+def async_cosmos_transport():
+    """aiohttp transport with a connection pool; must be called with an event loop running."""
+
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    connector = aiohttp.TCPConnector(limit=config.HTTP_POOL_SIZE, keepalive_timeout=config.HTTP_KEEPALIVE_SECONDS)
+    return AioHttpTransport(session=aiohttp.ClientSession(connector=connector))
+
+def create_cosmos_client(endpoint=None):
+    return CosmosClient(endpoint or config.AZURE_COSMOSDB_ENDPOINT, get_credential(),
+                        transport=cosmos_transport(), **cosmos_options())
+
+def create_async_cosmos_client(endpoint=None):
+    from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+
+    return AsyncCosmosClient(endpoint or config.AZURE_COSMOSDB_ENDPOINT, get_async_credential(),
+                        transport=async_cosmos_transport(), **cosmos_options())
+
+
+def _http_limits():
+    return httpx.Limits(max_connections=config.HTTP_POOL_SIZE, max_keepalive_connections=config.HTTP_POOL_SIZE,
+                        keepalive_expiry=config.HTTP_KEEPALIVE_SECONDS)
+
+def create_openai_client():
+    credential = get_credential()
+    return AzureOpenAI(
+        api_version=OPENAI_API_VERSION,
+        azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
+        azure_ad_token_provider=lambda: credential.get_token(OPENAI_SCOPE).token,
+        # Retries are made by resilience.py, which also slows down the rate limiter when throttled
+        max_retries=0,
+        http_client=DefaultHttpxClient(limits=_http_limits(), timeout=config.HTTP_TIMEOUT_SECONDS),
+    )
+
+def create_async_openai_client():
+    credential = get_async_credential()
+
+    async def token_provider():
+        return (await credential.get_token(OPENAI_SCOPE)).token
+
+    return AsyncAzureOpenAI(
+        api_version=OPENAI_API_VERSION,
+        azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
+        azure_ad_token_provider=token_provider,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=_http_limits(), timeout=config.HTTP_TIMEOUT_SECONDS),
+    )
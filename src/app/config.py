@@ -10,3 +10,125 @@ AZURE_COSMOSDB_ENDPOINT = os.getenv("AZURE_COSMOSDB_ENDPOINT")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_GPT_DEPLOYMENT = os.getenv("AZURE_OPENAI_GPT_DEPLOYMENT")
 AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+
+# Credential shared by the Azure clients: "default" (DefaultAzureCredential), or "managed_identity"
+# (with AZURE_CLIENT_ID for a user-assigned identity), "cli" or "environment" to skip its discovery.
+# Tokens are renewed this many seconds before they expire.
+AZURE_CREDENTIAL = os.getenv("AZURE_CREDENTIAL", "default").lower()
+AZURE_CLIENT_ID = os.getenv("AZURE_CLIENT_ID")
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+# HTTP connections kept open to each service, how long an idle one is kept and the request timeout
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+
+# Cosmos DB regions to use in order (comma-separated, e.g. "West US 2,East US") and the consistency
+# level of the client (Session, Eventual, ...; it can only be weaker than the account's default)
+COSMOS_PREFERRED_REGIONS = [region.strip() for region in os.getenv("COSMOS_PREFERRED_REGIONS", "").split(",") if region.strip()]
+COSMOS_CONSISTENCY_LEVEL = os.getenv("COSMOS_CONSISTENCY_LEVEL") or None
+
+# Calls to Cosmos DB and Azure OpenAI that are throttled (429) or fail transiently are retried up
+# to this many attempts, after the service's retry-after or a jittered exponential backoff
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.1"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "10"))
+
+# Client-side rate limits matching the provisioned throughput (0 for none): Cosmos DB request units
+# per second, and tokens per minute of the chat and embedding deployments
+COSMOS_RU_PER_SECOND = float(os.getenv("COSMOS_RU_PER_SECOND", "0"))
+OPENAI_CHAT_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_CHAT_TOKENS_PER_MINUTE", "0"))
+OPENAI_EMBEDDING_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_EMBEDDING_TOKENS_PER_MINUTE", "0"))
+
+# Circuit breaker: consecutive failed calls after which a dependency is failed fast, and for how long
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Write chat history to Cosmos DB in the background instead of during the turn: turns queued, the
+# messages or seconds after which a session's queued messages are written, sessions written at
+# once, and the journal keeping messages that could not be written, retried after retry seconds
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_FLUSH_MESSAGES = int(os.getenv("WRITE_BEHIND_FLUSH_MESSAGES", "50"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.5"))
+WRITE_BEHIND_CONCURRENCY = int(os.getenv("WRITE_BEHIND_CONCURRENCY", "4"))
+WRITE_BEHIND_JOURNAL_PATH = os.getenv("WRITE_BEHIND_JOURNAL_PATH", ".chat_history_journal.jsonl")
+WRITE_BEHIND_RETRY_SECONDS = float(os.getenv("WRITE_BEHIND_RETRY_SECONDS", "5"))
+
+
+# Read-through cache for the user and product lookups made by the agent tools
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+
+# How often the change feed is polled to invalidate cached documents
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "5"))
+
+# Embedding cache (set EMBEDDING_CACHE_PATH to a SQLite file to keep embeddings across restarts)
+EMBEDDING_CACHE_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+# Batched embedding requests (inputs and estimated tokens per request, requests in flight)
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+# Serve chat turns with the asyncio clients (azure.cosmos.aio and AsyncAzureOpenAI)
+ASYNC_MODE = os.getenv("ASYNC_MODE", "false").lower() == "true"
+
+# Chat sessions kept in memory, and how long an idle session is kept before it is evicted
+SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", "1000"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+
+# Chat turns the Gradio app runs at the same time
+GRADIO_CONCURRENCY_LIMIT = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "64"))
+
+# Prompt context window: token budget, most recent turns kept verbatim, and the size above which
+# tool results from earlier turns are shortened
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "6"))
+CONTEXT_MAX_TOOL_RESULT_TOKENS = int(os.getenv("CONTEXT_MAX_TOOL_RESULT_TOKENS", "200"))
+
+# Earlier turns are summarized this many at a time; until then they are sent as they are if they fit
+CONTEXT_SUMMARY_BATCH_TURNS = int(os.getenv("CONTEXT_SUMMARY_BATCH_TURNS", "4"))
+
+# Stream assistant tokens, tool calls and handoffs to the chat UI as they arrive (not used with ASYNC_MODE)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+
+# Semantic cache of product searches: minimum cosine similarity for a hit, size and time-to-live
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ITEMS = int(os.getenv("SEMANTIC_CACHE_MAX_ITEMS", "1000"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+
+# In-memory replica of the product vectors: "off", "fallback" (used while Cosmos DB throttles)
+# or "replica" (serves every product search); HNSW is used from this many products on
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "off").lower()
+LOCAL_VECTOR_INDEX_HNSW_THRESHOLD = int(os.getenv("LOCAL_VECTOR_INDEX_HNSW_THRESHOLD", "50000"))
+
+# Product search: re-rank vector candidates with full-text (BM25) scores of the product name and
+# description, and how many candidates to take from the vector search for it
+PRODUCT_SEARCH_HYBRID = os.getenv("PRODUCT_SEARCH_HYBRID", "true").lower() == "true"
+PRODUCT_SEARCH_CANDIDATES = int(os.getenv("PRODUCT_SEARCH_CANDIDATES", "20"))
+
+# Hybrid product search in Cosmos DB: fuse the vector search with full-text scores over the whole
+# container rather than only re-ranking the vector candidates. Products containers get full-text
+# indexes when they are created; existing ones fall back to re-ranking.
+PRODUCT_SEARCH_FULL_TEXT = os.getenv("PRODUCT_SEARCH_FULL_TEXT", "true").lower() == "true"
+
+# Product vectors: container they are stored in, embedding dimensions requested from the model (0
+# keeps the model's default; shorter vectors need a text-embedding-3 model), the type they are
+# stored as ("float32" or "int8") and the bytes per vector kept by the vector index (0 lets the
+# service choose). See migrate_vectors.py for moving existing products to new settings.
+PRODUCTS_CONTAINER_NAME = os.getenv("PRODUCTS_CONTAINER_NAME", "Products")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+PRODUCT_VECTOR_DATA_TYPE = os.getenv("PRODUCT_VECTOR_DATA_TYPE", "float32").lower()
+PRODUCT_VECTOR_QUANTIZATION_BYTES = int(os.getenv("PRODUCT_VECTOR_QUANTIZATION_BYTES", "0"))
+
+# Print the Cosmos DB request charge and latency of each chat turn, per agent and tool
+TELEMETRY_TURN_SUMMARY = os.getenv("TELEMETRY_TURN_SUMMARY", "false").lower() == "true"
+
+# Route new conversations straight to the sales, refunds or product agent when the request is
+# clear, skipping the triage agent's completion: minimum exemplar similarity and the lead needed
+# over the next agent (see router.py and "cli.py route-eval" for tuning them)
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.6"))
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.05"))
@@ -0,0 +1,191 @@
+import json
+import re
+
+import config
+from cache import TTLCache
+
+# tiktoken gives exact token counts when it is installed; otherwise counts are estimated
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except ImportError:
+    _encoding = None
+
+# Facts that stay in the prompt even after the turns that mentioned them are summarized
+PINNED_FACT_KEYS = ("user_id", "item_id", "product_id")
+PINNED_FACT_PATTERN = re.compile(r"\b(user|item|product)[ _]?id\s*(?:is|:|=|#)?\s*(\d+)", re.IGNORECASE)
+
+# Tokens added per message for the role and message framing
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_text_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+def count_tokens(message):
+    """Number of prompt tokens a message takes up."""
+
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_text_tokens(message.get("content"))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        tokens += count_text_tokens(function.get("name")) + count_text_tokens(function.get("arguments"))
+    return tokens
+
+def split_turns(messages):
+    """Group messages into turns, each starting at a user message."""
+
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def extract_facts(messages, facts=None):
+    """Collect the latest user, item and product ids from tool call arguments and user messages."""
+
+    facts = dict(facts or {})
+    for message in messages:
+        for tool_call in message.get("tool_calls") or []:
+            try:
+                arguments = json.loads((tool_call.get("function") or {}).get("arguments") or "{}")
+            except json.JSONDecodeError:
+                continue
+            for key in PINNED_FACT_KEYS:
+                if key in arguments:
+                    facts[key] = arguments[key]
+        if message["role"] == "user":
+            for kind, value in PINNED_FACT_PATTERN.findall(message.get("content") or ""):
+                facts[f"{kind.lower()}_id"] = int(value)
+    return facts
+
+def shorten_tool_result(message, max_tokens):
+    """Shorten a long tool result from an earlier turn."""
+
+    if message["role"] != "tool" or count_text_tokens(message.get("content")) <= max_tokens:
+        return message
+    content = message["content"][:max_tokens * 4]
+    return {**message, "content": f"{content}... [truncated]"}
+
+def message_position(messages, message):
+    return message.get("seq", messages.index(message))
+
+
+class ContextWindowManager:
+    """Builds the prompt for a turn from a session's full transcript.
+
+    The most recent turns are kept verbatim within a token budget, earlier turns are folded into
+    a running summary and the pinned facts (user, item and product ids) are always included.
+    Long tool results from earlier turns are shortened. Summaries are persisted in the Chat
+    container next to the raw history, which is never modified.
+
+    Earlier turns are summarized summary_batch_turns at a time, so most turns make no summary
+    call; until a batch is due they stay in the prompt if they fit the budget. If summarizing
+    fails the turn goes ahead with the last summary."""
+
+    def __init__(self, max_tokens=config.CONTEXT_MAX_TOKENS, recent_turns=config.CONTEXT_RECENT_TURNS,
+                 max_tool_result_tokens=config.CONTEXT_MAX_TOOL_RESULT_TOKENS,
+                 summary_batch_turns=config.CONTEXT_SUMMARY_BATCH_TURNS,
+                 summarize=None, load_summary=None, save_summary=None):
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summary_batch_turns = summary_batch_turns
+        self.max_tool_result_tokens = max_tool_result_tokens
+        self.summarize = summarize
+        self.load_summary = load_summary
+        self.save_summary = save_summary
+        self.summaries = TTLCache(max_items=config.SESSION_MAX_ACTIVE, ttl_seconds=config.SESSION_IDLE_SECONDS)
+
+    def _summary(self, user_id, session_id):
+        key = (user_id, session_id)
+        summary = self.summaries.get(key)
+        if summary is None:
+            summary = (self.load_summary(user_id, session_id) if self.load_summary and user_id else None) or {}
+            self.summaries.set(key, summary)
+        return summary
+
+    def prepare(self, messages, user_id=None, session_id=None):
+        """Return the messages to send to the model for the latest turn in messages.
+
+        Without a user_id the summary is kept in memory only."""
+
+        turns = split_turns(messages)
+        kept = turns[-self.recent_turns:]
+        older = turns[:-len(kept)]
+
+        # A loaded history page can start in the middle of a turn, which is summarized, never sent
+        if len(kept) > 1 and kept[0][0]["role"] != "user":
+            older.append(kept.pop(0))
+
+        # Earlier tool results are shortened; the current turn is sent as is
+        kept = [[shorten_tool_result(m, self.max_tool_result_tokens) for m in turn] for turn in kept[:-1]] + kept[-1:]
+
+        # Drop the oldest kept turns until the window fits the token budget
+        while len(kept) > 1 and sum(count_tokens(m) for turn in kept for m in turn) > self.max_tokens:
+            older.append(turns[len(older)])
+            kept.pop(0)
+
+        if not older:
+            return messages
+
+        summary = self._summary(user_id, session_id)
+        through_seq = summary.get("through_seq", -1)
+        pending = [turn for turn in older if message_position(messages, turn[-1]) > through_seq]
+        unsummarized = [m for turn in pending for m in turn if message_position(messages, m) > through_seq]
+
+        # Turns not summarized yet are sent as they are, except a partial one, while they fit
+        verbatim = [[shorten_tool_result(m, self.max_tool_result_tokens) for m in turn] for turn in pending if turn[0]["role"] == "user"]
+        fits = sum(count_tokens(m) for turn in verbatim + kept for m in turn) <= self.max_tokens
+
+        if unsummarized and (len(pending) >= self.summary_batch_turns or not fits):
+            try:
+                summary = self._summarize(user_id, session_id, summary, unsummarized, message_position(messages, pending[-1][-1]))
+                unsummarized, verbatim = [], []
+            except Exception as e:
+                # The turns are summarized on a later turn
+                print(f"Summarizing the conversation failed, using the last summary: {e}")
+        if not fits:
+            verbatim = []
+
+        facts = extract_facts(unsummarized + [m for turn in kept for m in turn], summary.get("pinned"))
+        context = []
+        if summary.get("content"):
+            context.append(f"Summary of the earlier conversation: {summary['content']}")
+        if facts:
+            context.append("Known facts: " + ", ".join(f"{key}={value}" for key, value in facts.items()))
+
+        prompt = [m for turn in verbatim + kept for m in turn]
+        if context:
+            prompt.insert(0, {"role": "system", "content": "\n".join(context)})
+        return prompt
+
+    def _summarize(self, user_id, session_id, summary, unsummarized, through):
+        summary = {
+            "content": self.summarize(summary.get("content"), unsummarized) if self.summarize else summary.get("content"),
+            "through_seq": through,
+            "pinned": extract_facts(unsummarized, summary.get("pinned")),
+        }
+        self.summaries.set((user_id, session_id), summary)
+        if self.save_summary and user_id:
+            try:
+                self.save_summary(user_id, session_id, summary)
+            except Exception as e:
+                print(f"Saving the conversation summary failed, keeping it in memory: {e}")
+        return summary
+
+
+def create_manager():
+    """Context window manager that summarizes with Azure OpenAI and persists to Cosmos DB."""
+
+    import azure_cosmos_db
+    import azure_open_ai
+
+    return ContextWindowManager(
+        summarize=azure_open_ai.summarize_conversation,
+        load_summary=azure_cosmos_db.get_chat_summary,
+        save_summary=azure_cosmos_db.upsert_chat_summary,
+    )
@@ -0,0 +1,60 @@
+import hashlib
+import sqlite3
+import threading
+
+from cache import TTLCache
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different inputs share a cache entry."""
+    return " ".join(text.split())
+
+def embedding_key(text, deployment):
+    """Content address of an embedding: a hash of the normalized text and the deployment name."""
+    return hashlib.sha256(f"{deployment}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache with an in-memory LRU tier and an optional SQLite tier.
+
+    Vectors are stored and returned as packed float32 bytes (see vector_utils.pack). When path
+    is set, embeddings survive restarts and are promoted into memory on first use."""
+
+    def __init__(self, max_items=10000, path=None):
+        self.memory = TTLCache(max_items=max_items, ttl_seconds=None)
+        self.path = path
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    def get(self, text, deployment):
+        """Return the cached packed embedding for text, or None."""
+
+        key = embedding_key(text, deployment)
+        data = self.memory.get(key)
+
+        if data is None and self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                data = row[0]
+                self.memory.set(key, data)
+
+        return data
+
+    def set(self, text, deployment, data):
+        """Cache the packed embedding of text in every tier."""
+
+        key = embedding_key(text, deployment)
+        self.memory.set(key, data)
+
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", (key, data))
+                self._db.commit()
+
+    def stats(self):
+        return self.memory.stats()
@@ -0,0 +1,246 @@
+import csv
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from azure.cosmos import exceptions
+
+import config
+import azure_cosmos_db
+import azure_open_ai
+import vector_utils
+
+# Sample catalog loaded by initialize_database
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# Rows are read, embedded and written in chunks of this size; progress is checkpointed per chunk
+CHUNK_SIZE = 500
+
+
+def _user_document(row):
+    return {
+        "id": str(row["user_id"]),
+        "user_id": int(row["user_id"]),
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+        "email": row["email"],
+        "phone": row["phone"],
+    }
+
+def _purchase_document(row):
+    return {
+        "id": f"{row['user_id']}_{row['item_id']}_{row['date_of_purchase']}",
+        "user_id": int(row["user_id"]),
+        "date_of_purchase": row["date_of_purchase"],
+        "item_id": int(row["item_id"]),
+        "amount": float(row["amount"]),
+    }
+
+def _product_document(row):
+    return {
+        "id": str(row["product_id"]),
+        "product_id": int(row["product_id"]),
+        "product_name": row["product_name"],
+        "product_description": row["product_description"],
+        "price": float(row["price"]),
+    }
+
+# Kinds of rows that can be ingested: container, document builder and partition key field
+SOURCES = {
+    "users": (azure_cosmos_db.USERS_CONTAINER_NAME, _user_document, "user_id"),
+    "purchases": (azure_cosmos_db.PURCHASE_HISTORY_CONTAINER_NAME, _purchase_document, "user_id"),
+    "products": (azure_cosmos_db.PRODUCTS_CONTAINER_NAME, _product_document, "product_id"),
+}
+
+
+def read_rows(path):
+    """Stream rows from a JSONL or CSV file."""
+
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def content_hash(document):
+    """Hash of a document's content, used to skip rows that have not changed since the last run."""
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class IngestState:
+    """Checkpoint of the content hash of every document written, saved after each chunk so an
+    interrupted run resumes by skipping the rows that were already written."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hashes = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.hashes = json.load(f)
+
+    def unchanged(self, kind, document_id, digest):
+        return self.hashes.get(kind, {}).get(document_id) == digest
+
+    def record(self, kind, document_id, digest):
+        self.hashes.setdefault(kind, {})[document_id] = digest
+
+    def reconcile(self, kind):
+        """Seed the checkpoint from the content hashes already stored in the container."""
+
+        container_name = SOURCES[kind][0]
+        container = azure_cosmos_db.get_container(container_name)
+        items = container.query_items(
+            query="SELECT c.id, c.content_hash FROM c WHERE IS_DEFINED(c.content_hash)",
+            enable_cross_partition_query=True
+        )
+        for item in items:
+            self.record(kind, item["id"], item["content_hash"])
+
+    def save(self):
+        if not self.path:
+            return
+        # Write to a temporary file first so a crash never leaves a truncated checkpoint
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+        os.replace(temporary_path, self.path)
+
+
+@dataclass
+class IngestReport:
+    """Throughput of an ingestion run for one kind of row."""
+    kind: str
+    read: int = 0
+    skipped: int = 0
+    written: int = 0
+    failed: int = 0
+    embedded: int = 0
+    request_charge: float = 0.0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def items_per_second(self):
+        return self.written / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def ru_per_second(self):
+        return self.request_charge / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.kind}: read {self.read}, skipped {self.skipped}, written {self.written}, "
+                f"failed {self.failed}, embedded {self.embedded}, {self.items_per_second:.1f} items/s, "
+                f"{self.request_charge:.1f} RU ({self.ru_per_second:.1f} RU/s)")
+
+
+def _write_documents(container, documents, partition_key_field, max_concurrency, report):
+    """Upsert documents with bounded concurrency, returning the ids that were written.
+
+    Documents sharing a partition key are written together as transactional batches; documents
+    alone in their partition (such as products) are upserted individually."""
+
+    lock = threading.Lock()
+    written = []
+
+    def record_charge(headers, _):
+        with lock:
+            report.request_charge += float(headers.get("x-ms-request-charge", 0))
+
+    groups = {}
+    for document in documents:
+        groups.setdefault(document[partition_key_field], []).append(document)
+
+    def write_group(item):
+        partition_key, group = item
+        ids = [document["id"] for document in group]
+        try:
+            if len(group) == 1:
+                container.upsert_item(body=group[0], response_hook=record_charge)
+            else:
+                for start in range(0, len(group), azure_cosmos_db.MAX_BATCH_OPERATIONS):
+                    operations = [("upsert", (document,)) for document in group[start:start + azure_cosmos_db.MAX_BATCH_OPERATIONS]]
+                    container.execute_item_batch(batch_operations=operations, partition_key=partition_key, response_hook=record_charge)
+            return ids, None
+        except exceptions.CosmosHttpResponseError as e:
+            return ids, e.message
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        for ids, error in executor.map(write_group, groups.items()):
+            if error:
+                print(f"Failed to write {len(ids)} {report.kind} documents: {error}")
+                report.failed += len(ids)
+            else:
+                written.extend(ids)
+
+    report.written += len(written)
+    return set(written)
+
+
+def ingest(kind, rows, state, max_concurrency=8, chunk_size=CHUNK_SIZE):
+    """Ingest an iterable of rows of one kind, returning an IngestReport.
+
+    Rows whose content hash matches the checkpoint are skipped. Product descriptions are embedded
+    in batches only for new or changed products."""
+
+    container_name, to_document, partition_key_field = SOURCES[kind]
+    container = azure_cosmos_db.get_container(container_name)
+    report = IngestReport(kind=kind)
+    start = time.perf_counter()
+    rows = iter(rows)
+
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        report.read += len(chunk)
+
+        changed = []
+        for row in chunk:
+            document = to_document(row)
+            document["content_hash"] = content_hash(document)
+            if state.unchanged(kind, document["id"], document["content_hash"]):
+                report.skipped += 1
+            else:
+                changed.append(document)
+
+        if kind == "products" and changed:
+            vectors = azure_open_ai.generate_embeddings([document["product_description"] for document in changed])
+            for document, vector in zip(changed, vectors):
+                document["product_description_vector"] = vector_utils.to_storage(vector, config.PRODUCT_VECTOR_DATA_TYPE)
+            report.embedded += len(changed)
+
+        written = _write_documents(container, changed, partition_key_field, max_concurrency, report)
+        for document in changed:
+            if document["id"] in written:
+                state.record(kind, document["id"], document["content_hash"])
+        state.save()
+
+    report.elapsed_seconds = time.perf_counter() - start
+    return report
+
+
+def ingest_directory(data_dir=SAMPLE_DATA_DIR, state_path=None, max_concurrency=8, reconcile=False):
+    """Ingest users, purchases and products from <kind>.jsonl or <kind>.csv files in data_dir."""
+
+    state = IngestState(state_path)
+    reports = []
+
+    for kind in SOURCES:
+        for extension in (".jsonl", ".csv"):
+            path = os.path.join(data_dir, kind + extension)
+            if os.path.exists(path):
+                if reconcile:
+                    state.reconcile(kind)
+                report = ingest(kind, read_rows(path), state, max_concurrency=max_concurrency)
+                print(report)
+                reports.append(report)
+                break
+
+    return reports
+
@@ -0,0 +1,64 @@
+import itertools
+import time
+
+import azure_cosmos_db
+import azure_open_ai
+import ingest
+import vector_utils
+
+# Cosmos DB system properties, which are not copied to the new container
+SYSTEM_FIELDS = ("_rid", "_self", "_etag", "_attachments", "_ts")
+
+
+def convert_vectors(documents, dimensions, data_type, reembed):
+    """Set the product_description_vector of documents for the target dimensions and data type.
+
+    With reembed the descriptions are embedded again at the target dimensions. Otherwise the stored
+    vectors are reused: shortened to the target dimensions (valid for text-embedding-3 models) and
+    re-quantized to the target data type."""
+
+    if reembed:
+        vectors = azure_open_ai.generate_embeddings(
+            [document["product_description"] for document in documents], compact=True, dimensions=dimensions)
+    else:
+        vectors = []
+        for document in documents:
+            vector = document["product_description_vector"]
+            if dimensions and dimensions > len(vector):
+                raise ValueError(f"Product {document['product_id']} has a {len(vector)}-dimension vector; "
+                                 f"re-embed to get {dimensions} dimensions")
+            vectors.append(vector_utils.truncate(vector, dimensions) if dimensions and dimensions < len(vector) else vector)
+
+    for document, vector in zip(documents, vectors):
+        document["product_description_vector"] = vector_utils.to_storage(vector, data_type)
+
+def migrate_products(target_container_name, dimensions=None, data_type="float32", quantization_bytes=None,
+                     reembed=False, max_concurrency=8, chunk_size=ingest.CHUNK_SIZE):
+    """Copy every product into a new container with the given vector settings, returning an IngestReport.
+
+    The source container is left untouched. Once the copy is complete, point the application at
+    the new container with PRODUCTS_CONTAINER_NAME, EMBEDDING_DIMENSIONS and PRODUCT_VECTOR_DATA_TYPE."""
+
+    source = azure_cosmos_db.get_container(azure_cosmos_db.PRODUCTS_CONTAINER_NAME)
+    target = azure_cosmos_db.create_products_container(target_container_name, dimensions, data_type, quantization_bytes)
+    report = ingest.IngestReport(kind="products")
+    start = time.perf_counter()
+
+    documents = source.query_items(query="SELECT * FROM c", enable_cross_partition_query=True)
+    while True:
+        chunk = list(itertools.islice(documents, chunk_size))
+        if not chunk:
+            break
+        report.read += len(chunk)
+
+        for document in chunk:
+            for name in SYSTEM_FIELDS:
+                document.pop(name, None)
+        convert_vectors(chunk, dimensions, data_type, reembed)
+        if reembed:
+            report.embedded += len(chunk)
+
+        ingest._write_documents(target, chunk, "product_id", max_concurrency, report)
+
+    report.elapsed_seconds = time.perf_counter() - start
+    return report
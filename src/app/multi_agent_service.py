@@ -1,145 +1,271 @@
 import datetime
 import random
+import threading
 
-from swarm import Swarm, Agent
+from swarm import Agent
 from swarm.repl import run_demo_loop
 from swarm.repl.repl import process_and_print_streaming_response, pretty_print_messages
+from azure.cosmos import exceptions
 
 import config
 import azure_cosmos_db
 import azure_open_ai
+import context_window
+import product_search
+import resilience
+import telemetry
+from cache import TTLCache
+from semantic_cache import SemanticCache
+import vector_index
+from swarm_ext import ParallelSwarm, handoff
+
+
+# Swarm client with Azure OpenAI client, created on first use and shared by the app
+swarm_client = None
+_swarm_client_lock = threading.Lock()
+
+def get_swarm_client():
+    global swarm_client
+    if swarm_client is None:
+        with _swarm_client_lock:
+            if swarm_client is None:
+                swarm_client = ParallelSwarm(client=azure_open_ai.get_client())
+    return swarm_client
+
+# Read-through caches in front of the Cosmos DB user and product lookups
+user_cache = TTLCache(max_items=config.CACHE_MAX_ITEMS, ttl_seconds=config.CACHE_TTL_SECONDS)
+product_cache = TTLCache(max_items=config.CACHE_MAX_ITEMS, ttl_seconds=config.CACHE_TTL_SECONDS)
+
+# In-memory replica of the product vectors (see config.LOCAL_VECTOR_INDEX)
+local_index = vector_index.LocalVectorIndex(hnsw_threshold=config.LOCAL_VECTOR_INDEX_HNSW_THRESHOLD)
+
+# Product search results of recent questions, matched by embedding similarity
+semantic_cache = SemanticCache(
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    max_items=config.SEMANTIC_CACHE_MAX_ITEMS,
+    ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS
+)
+
+
+def get_user(user_id):
+    return user_cache.get_or_load(int(user_id), azure_cosmos_db.get_user)
+
+def get_product(product_id):
+    return product_cache.get_or_load(int(product_id), azure_cosmos_db.get_product)
+
+def start_cache_invalidation():
+    """Evict cached users and products as soon as they change in Cosmos DB."""
+    
+    users_feed = azure_cosmos_db.ChangeFeedWatcher(azure_cosmos_db.USERS_CONTAINER_NAME)
+    users_feed.add_listener(lambda user: user_cache.invalidate(user["user_id"]))
+    
+    products_feed = azure_cosmos_db.ChangeFeedWatcher(azure_cosmos_db.PRODUCTS_CONTAINER_NAME)
+    products_feed.add_listener(lambda product: product_cache.invalidate(product["product_id"]))
+    products_feed.add_listener(semantic_cache.invalidate_product)
+    
+    return users_feed.start(), products_feed.start()
 
+def start_local_vector_index():
+    """Build the in-memory replica of the product vectors in the background and keep it current
+    from the change feed. Products are removed from it by setting "deleted": true on them."""
+    
+    if vector_index.np is None:
+        print("The local vector index needs numpy, searching Azure Cosmos DB only")
+        return None
+    
+    products_feed = azure_cosmos_db.ChangeFeedWatcher(azure_cosmos_db.PRODUCTS_CONTAINER_NAME)
+    products_feed.add_listener(local_index.upsert)
+    
+    def build():
+        try:
+            # Start the feed before reading the products, so changes made while they are read are
+            # applied afterwards rather than missed
+            products_feed.poll()
+        except exceptions.CosmosHttpResponseError as e:
+            print(f"Starting the products change feed failed, it starts after the load: {e.message}")
+        try:
+            local_index.load(azure_cosmos_db.get_product_vectors())
+            print(f"Local vector index ready with {len(local_index)} products")
+            products_feed.start()
+        except exceptions.CosmosHttpResponseError as e:
+            print(f"Building the local vector index failed: {e.message}")
+    
+    threading.Thread(target=build, name="local-vector-index", daemon=True).start()
+    return products_feed
 
-# Initialize Swarm client with Azure OpenAI client
-swarm_client = Swarm(client=azure_open_ai.aoai_client)
+def cache_stats():
+    return {"users": user_cache.stats(), "products": product_cache.stats(), "product_search": semantic_cache.stats()}
 
 
+@resilience.tool_errors
+@telemetry.tool
 def refund_item(user_id, item_id):
     """Initiate a refund based on the user ID and item ID.
     Takes as input arguments in the format '{"user_id":1,"item_id":3}'
     """
     
-    try:
-        container = azure_cosmos_db.PURCHASE_HISTORY_CONTAINER
-        
-        query = "SELECT c.amount FROM c WHERE c.user_id=@user_id AND c.item_id=@item_id"
-        parameters = [
-            {"name": "@user_id", "value": int(user_id)},
-            {"name": "@item_id", "value": int(item_id)}
-        ]
-        items = list(container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
-        
-        if items:
-            amount = items[0]['amount']
-            # Refund the amount to the user
-            refund_message = f"Refunding ${amount} to user ID {user_id} for item ID {item_id}."
-            return refund_message
-        else:
-            refund_message = f"No purchase found for user ID {user_id} and item ID {item_id}. Refund initiated."
-            return refund_message
+    items = azure_cosmos_db.get_purchases_for_user(user_id, item_id)
     
-    except Exception as e:
-        print(f"An error occurred during refund: {e}")
-
-
+    if items:
+        amount = items[0]['amount']
+        # Refund the amount to the user
+        refund_message = f"Refunding ${amount} to user ID {user_id} for item ID {item_id}."
+        return refund_message
+    else:
+        refund_message = f"No purchase found for user ID {user_id} and item ID {item_id}. Refund initiated."
+        return refund_message
+
+
+@resilience.tool_errors
+@telemetry.tool
 def notify_customer(user_id, method):
     """Notify a customer by their preferred method of either phone or email.
     Takes as input arguments in the format '{"user_id":1,"method":"email"}'"""
     
-    try:
-        container = azure_cosmos_db.USERS_CONTAINER
-        
-        query = "SELECT c.email, c.phone FROM c WHERE c.user_id=@user_id"
-        parameters = [{"name": "@user_id", "value": int(user_id)}]
-        items = list(container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
-        
-        if items:
-            email, phone = items[0]['email'], items[0]['phone']
-            if method == "email" and email:
-                print(f"Emailed customer {email} a notification.")
-            elif method == "phone" and phone:
-                print(f"Texted customer {phone} a notification.")
-            else:
-                print(f"No {method} contact available for user ID {user_id}.")
-        else:
-            print(f"User ID {user_id} not found.")
+    user = get_user(user_id)
     
-    except Exception as e:
-        print(f"An error occurred during notification: {e}")
+    if user:
+        email, phone = user['email'], user['phone']
+        if method == "email" and email:
+            print(f"Emailed customer {email} a notification.")
+        elif method == "phone" and phone:
+            print(f"Texted customer {phone} a notification.")
+        else:
+            print(f"No {method} contact available for user ID {user_id}.")
+    else:
+        print(f"User ID {user_id} not found.")
 
 
+@resilience.tool_errors
+@telemetry.tool
 def order_item(user_id, product_id):
     """Place an order for a product based on the user ID and product ID.
     Takes as input arguments in the format '{"user_id":1,"product_id":2}'"""
     
-    try:
-        # Get the current date and time for the purchase
-        date_of_purchase = datetime.datetime.now().isoformat()
-        # Generate a random item ID
-        item_id = random.randint(1, 300)
+    # Get the current date and time for the purchase
+    date_of_purchase = datetime.datetime.now().isoformat()
+    # Generate a random item ID
+    item_id = random.randint(1, 300)
 
 
-        container = azure_cosmos_db.PRODUCTS_CONTAINER
+    # Read the product information through the cache
+    product = get_product(product_id)
+    
+    if product:
+        product_id, product_name, price = product['product_id'], product['product_name'], product['price']
         
-        # Query the database for the product information
-        query = "SELECT c.product_id, c.product_name, c.price FROM c WHERE c.product_id=@product_id"
-        parameters = [{"name": "@product_id", "value": int(product_id)}]
-        items = list(container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
+        print(f"Ordering product {product_name} for user ID {user_id}. The price is {price}.")
         
-        if items:
-            product = items[0]
-            product_id, product_name, price = product['product_id'], product['product_name'], product['price']
-            
-            print(f"Ordering product {product_name} for user ID {user_id}. The price is {price}.")
-            
-            # Add the purchase to the database
-            azure_cosmos_db.add_purchase(int(user_id), date_of_purchase, item_id, price)
-            
-            order_item_message = f"Order placed for product {product_name} for user ID {user_id}. Item ID: {item_id}."
-            return order_item_message
-        else:
-            order_item_message = f"Product {product_id} not found."
-            return order_item_message
-    
-    except Exception as e:
-        print(f"An error occurred during order placement: {e}")
+        # Add the purchase to the database
+        azure_cosmos_db.add_purchase(int(user_id), date_of_purchase, item_id, price)
+        
+        order_item_message = f"Order placed for product {product_name} for user ID {user_id}. Item ID: {item_id}."
+        return order_item_message
+    else:
+        order_item_message = f"Product {product_id} not found."
+        return order_item_message
 
 
+@resilience.tool_errors
+@telemetry.tool
 def product_information(user_prompt):
     """Provide information about a product based on the user prompt.
     Takes as input the user prompt as a string."""
     
-    # Perform a vector search on the Cosmos DB container and return results to the agent
-    vectors = azure_open_ai.generate_embedding(user_prompt)
-    vector_search_results = product_vector_search(vectors)
+    # Perform a vector search on the Cosmos DB container and return results to the agent,
+    # unless a semantically equivalent question was answered recently
+    vectors = azure_open_ai.generate_embedding(user_prompt, compact=True)
+    
+    vector_search_results = semantic_cache.lookup(vectors)
+    if vector_search_results is None:
+        vector_search_results = product_vector_search(vectors, query_text=user_prompt)
+        cache_search_results(vectors, vector_search_results)
     
     return vector_search_results
 
 
+def cache_search_results(vectors, results, num_results=3):
+    """Add vector search results to the semantic cache."""
+    
+    scores = [result['SimilarityScore'] for result in results]
+    # With fewer results than requested, any changed product could now rank into them. With
+    # hybrid ranking so could a less similar product with a better text score.
+    complete = len(results) >= num_results and not config.PRODUCT_SEARCH_HYBRID
+    min_score = min(scores) if complete else None
+    semantic_cache.store(vectors, results, [result['document']['product_id'] for result in results], min_score)
+
+
+def search_candidates(num_results, query_text=None):
+    """Number of rows to fetch from the vector search for num_results results."""
+    
+    if query_text and config.PRODUCT_SEARCH_HYBRID:
+        return max(num_results, config.PRODUCT_SEARCH_CANDIDATES)
+    return num_results
+
 # Perform a vector search on the Cosmos DB container
-def product_vector_search(vectors, similarity_score=0.02, num_results=3):
+def product_vector_search(vectors, similarity_score=0.02, num_results=3, query_text=None):
+    """Return the products closest to the query embedding, also matching the text of the
+    question when query_text is given and hybrid search is enabled: by hybrid search in Cosmos DB
+    with config.PRODUCT_SEARCH_FULL_TEXT, else by re-ranking the vector search candidates."""
     
-    # Execute the query
-    container = azure_cosmos_db.PRODUCTS_CONTAINER
+    query_text = query_text if config.PRODUCT_SEARCH_HYBRID else None
+    candidates = search_candidates(num_results, query_text)
     
-    results = container.query_items(
-        query='''
-        SELECT TOP @num_results c.product_id, c.price, c.product_description, VectorDistance(c.product_description_vector, @embedding) as SimilarityScore 
-        FROM c
-        WHERE VectorDistance(c.product_description_vector,@embedding) > @similarity_score
-        ORDER BY VectorDistance(c.product_description_vector,@embedding)
-        ''',
-        parameters=[
-            {"name": "@embedding", "value": vectors},
-            {"name": "@num_results", "value": num_results},
-            {"name": "@similarity_score", "value": similarity_score}
-        ],
-        enable_cross_partition_query=True, populate_query_metrics=True)
+    # Serve from the in-memory replica when it is the configured source
+    rows = local_search(vectors, similarity_score, candidates)
+    if rows is None:
+        try:
+            rows, hybrid = cosmos_product_search(vectors, candidates, query_text)
+        except (exceptions.CosmosHttpResponseError, resilience.CircuitOpenError) as e:
+            rows = local_search(vectors, similarity_score, candidates, error=e)
+            if rows is None:
+                raise
+        else:
+            print("Executed vector search in Azure Cosmos DB... \n")
+            if hybrid:
+                # Ranked by the hybrid search already
+                query_text = None
+    
+    return format_vector_search_results(product_search.rank_results(rows, query_text, similarity_score, num_results))
+
+def cosmos_product_search(vectors, candidates, query_text=None):
+    """Run the product search in Cosmos DB; returns the rows and whether it was a hybrid search."""
+    
+    container = azure_cosmos_db.get_container(azure_cosmos_db.PRODUCTS_CONTAINER_NAME)
+    query, parameters, hybrid = product_search.search_query(vectors, candidates, query_text)
+    try:
+        with telemetry.cosmos_operation("vector_search", azure_cosmos_db.PRODUCTS_CONTAINER_NAME) as operation:
+            rows = resilience.cosmos.call(
+                azure_cosmos_db.query_all, container, operation, query=query, parameters=parameters,
+                enable_cross_partition_query=True, populate_query_metrics=True)
+    except exceptions.CosmosHttpResponseError as e:
+        if not hybrid or e.status_code != 400:
+            raise
+        product_search.full_text_unavailable(e)
+        return cosmos_product_search(vectors, candidates, query_text)
+    return rows, hybrid
+
+def local_search(vectors, similarity_score, candidates, error=None):
+    """Search the local vector index instead of Cosmos DB, or return None to query Cosmos DB.
+    
+    The index is searched when it is the configured source of product searches, or after error
+    while Cosmos DB is throttling or unavailable, so product questions keep being answered."""
     
-    print("Executed vector search in Azure Cosmos DB... \n")
-    results = list(results)
+    if not local_index.ready:
+        return None
+    if error is None:
+        if config.LOCAL_VECTOR_INDEX != "replica":
+            return None
+    elif isinstance(error, resilience.CircuitOpenError) or resilience.status_code(error) == 429:
+        print("Vector search throttled, using the local vector index... \n")
+    else:
+        return None
+    return local_index.search(vectors, similarity_score, candidates)
+
+
+def format_vector_search_results(results):
+    """Extract the necessary information from the vector search results for the agent."""
     
-    # Extract the necessary information from the results
     formatted_results = []
     
     for result in results:
@@ -158,25 +284,20 @@ def product_vector_search(vectors, similarity_score=0.02, num_results=3):
     return formatted_results
 
 
-# Initialize the database
-azure_cosmos_db.initialize_database()
-
-# Preview tables
-azure_cosmos_db.preview_table("Users")
-azure_cosmos_db.preview_table("PurchaseHistory")
-azure_cosmos_db.preview_table("Products")
-
-
 # define the transfer functions for each agent
+@handoff
 def transfer_to_sales():
     return sales_agent
 
+@handoff
 def transfer_to_refunds():
     return refunds_agent
 
+@handoff
 def transfer_to_product():
     return product_agent
 
+@handoff
 def transfer_to_triage():
     return triage_agent
 
@@ -242,14 +363,12 @@ triage_agent = Agent(
     Do not share your thought process with the user! Do not make unreasonable assumptions on behalf of user."""
 )
 
-for f in triage_agent.functions:
-    print(f.__name__)
-
 triage_agent.functions = [transfer_to_sales, transfer_to_refunds, transfer_to_product]
 
 def run_demo_loop(starting_agent, context_variables=None, stream=False, debug=False) -> None:
     
-    client = swarm_client
+    client = get_swarm_client()
+    context_manager = context_window.create_manager()
     print("Starting Swarm CLI 🐝")
 
     messages = []
@@ -263,7 +382,7 @@ def run_demo_loop(starting_agent, context_variables=None, stream=False, debug=Fa
 
         response = client.run(
             agent=agent,
-            messages=messages,
+            messages=context_manager.prepare(messages),
             context_variables=context_variables or {},
             stream=stream,
             debug=debug,
@@ -279,6 +398,9 @@ def run_demo_loop(starting_agent, context_variables=None, stream=False, debug=Fa
         agent = response.agent
 
 if __name__ == "__main__":
+    import bootstrap
+    print(bootstrap.bootstrap())
+    
     # Run the demo loop
     run_demo_loop(triage_agent, debug=True)
 
@@ -0,0 +1,186 @@
+import datetime
+import random
+
+from azure.cosmos import exceptions
+
+import config
+import azure_cosmos_db_aio
+import azure_open_ai
+import multi_agent_service
+import product_search
+import resilience
+import telemetry
+from multi_agent_service import user_cache, product_cache
+from swarm_ext import AsyncSwarm, handoff
+
+# Asyncio versions of the agent tools and agents in multi_agent_service. The tools keep the same
+# names, signatures and docstrings, so the model sees the same functions in both modes.
+
+
+# Async Swarm client, created on first use
+swarm_client = None
+
+def get_swarm_client():
+    global swarm_client
+    if swarm_client is None:
+        swarm_client = AsyncSwarm(client=azure_open_ai.get_async_client())
+    return swarm_client
+
+
+async def get_user(user_id):
+    return await user_cache.get_or_load_async(int(user_id), azure_cosmos_db_aio.get_user)
+
+async def get_product(product_id):
+    return await product_cache.get_or_load_async(int(product_id), azure_cosmos_db_aio.get_product)
+
+
+@resilience.tool_errors
+@telemetry.tool
+async def refund_item(user_id, item_id):
+    """Initiate a refund based on the user ID and item ID.
+    Takes as input arguments in the format '{"user_id":1,"item_id":3}'
+    """
+
+    items = await azure_cosmos_db_aio.get_purchases_for_user(user_id, item_id)
+
+    if items:
+        amount = items[0]['amount']
+        # Refund the amount to the user
+        return f"Refunding ${amount} to user ID {user_id} for item ID {item_id}."
+    else:
+        return f"No purchase found for user ID {user_id} and item ID {item_id}. Refund initiated."
+
+
+@resilience.tool_errors
+@telemetry.tool
+async def notify_customer(user_id, method):
+    """Notify a customer by their preferred method of either phone or email.
+    Takes as input arguments in the format '{"user_id":1,"method":"email"}'"""
+
+    user = await get_user(user_id)
+
+    if user:
+        email, phone = user['email'], user['phone']
+        if method == "email" and email:
+            print(f"Emailed customer {email} a notification.")
+        elif method == "phone" and phone:
+            print(f"Texted customer {phone} a notification.")
+        else:
+            print(f"No {method} contact available for user ID {user_id}.")
+    else:
+        print(f"User ID {user_id} not found.")
+
+
+@resilience.tool_errors
+@telemetry.tool
+async def order_item(user_id, product_id):
+    """Place an order for a product based on the user ID and product ID.
+    Takes as input arguments in the format '{"user_id":1,"product_id":2}'"""
+
+    # Get the current date and time for the purchase
+    date_of_purchase = datetime.datetime.now().isoformat()
+    # Generate a random item ID
+    item_id = random.randint(1, 300)
+
+    # Read the product information through the cache
+    product = await get_product(product_id)
+
+    if product:
+        product_id, product_name, price = product['product_id'], product['product_name'], product['price']
+
+        print(f"Ordering product {product_name} for user ID {user_id}. The price is {price}.")
+
+        # Add the purchase to the database
+        await azure_cosmos_db_aio.add_purchase(int(user_id), date_of_purchase, item_id, price)
+
+        return f"Order placed for product {product_name} for user ID {user_id}. Item ID: {item_id}."
+    else:
+        return f"Product {product_id} not found."
+
+
+@resilience.tool_errors
+@telemetry.tool
+async def product_information(user_prompt):
+    """Provide information about a product based on the user prompt.
+    Takes as input the user prompt as a string."""
+
+    # Perform a vector search on the Cosmos DB container and return results to the agent,
+    # unless a semantically equivalent question was answered recently
+    vectors = await azure_open_ai.generate_embedding_async(user_prompt, compact=True)
+
+    vector_search_results = multi_agent_service.semantic_cache.lookup(vectors)
+    if vector_search_results is None:
+        vector_search_results = await product_vector_search(vectors, query_text=user_prompt)
+        multi_agent_service.cache_search_results(vectors, vector_search_results)
+
+    return vector_search_results
+
+
+async def product_vector_search(vectors, similarity_score=0.02, num_results=3, query_text=None):
+
+    query_text = query_text if config.PRODUCT_SEARCH_HYBRID else None
+    candidates = multi_agent_service.search_candidates(num_results, query_text)
+
+    # The same in-memory replica and fallback as the sync search
+    rows = multi_agent_service.local_search(vectors, similarity_score, candidates)
+    if rows is None:
+        try:
+            rows, hybrid = await cosmos_product_search(vectors, candidates, query_text)
+        except (exceptions.CosmosHttpResponseError, resilience.CircuitOpenError) as e:
+            rows = multi_agent_service.local_search(vectors, similarity_score, candidates, error=e)
+            if rows is None:
+                raise
+        else:
+            if hybrid:
+                query_text = None
+
+    return multi_agent_service.format_vector_search_results(
+        product_search.rank_results(rows, query_text, similarity_score, num_results))
+
+async def cosmos_product_search(vectors, candidates, query_text=None):
+    """asyncio version of multi_agent_service.cosmos_product_search."""
+
+    query, parameters, hybrid = product_search.search_query(vectors, candidates, query_text)
+    try:
+        return await azure_cosmos_db_aio.query_products(query, parameters), hybrid
+    except exceptions.CosmosHttpResponseError as e:
+        if not hybrid or e.status_code != 400:
+            raise
+        product_search.full_text_unavailable(e)
+        return await cosmos_product_search(vectors, candidates, query_text)
+
+
+# define the transfer functions for each agent
+@handoff
+async def transfer_to_sales():
+    return sales_agent
+
+@handoff
+async def transfer_to_refunds():
+    return refunds_agent
+
+@handoff
+async def transfer_to_product():
+    return product_agent
+
+@handoff
+async def transfer_to_triage():
+    return triage_agent
+
+
+# Same agents and instructions as multi_agent_service, with the async tools
+refunds_agent = multi_agent_service.refunds_agent.model_copy(
+    update={"functions": [transfer_to_triage, refund_item, notify_customer]}
+)
+
+sales_agent = multi_agent_service.sales_agent.model_copy(
+    update={"functions": [transfer_to_triage, order_item, notify_customer, transfer_to_refunds]}
+)
+
+product_agent = multi_agent_service.product_agent.model_copy(
+    update={"functions": [transfer_to_triage, product_information, transfer_to_sales, transfer_to_refunds]}
+)
+
+triage_agent = multi_agent_service.triage_agent.model_copy(
+    update={"functions": [transfer_to_sales, transfer_to_refunds, transfer_to_product]}
+)
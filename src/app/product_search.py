@@ -0,0 +1,132 @@
+import math
+import re
+from collections import Counter
+
+import config
+import vector_utils
+
+# Top candidates by vector similarity, with only the fields the agent needs. The vector index
+# evaluates VectorDistance once per document and serves both the projection and the ORDER BY from
+# it; for cosine it is a similarity, so ORDER BY returns the most similar products first. The
+# minimum similarity is applied to the returned rows rather than in a WHERE clause, which would
+# evaluate the distance again for every document and keep the index from serving the TOP.
+PRODUCT_SEARCH_QUERY = '''
+        SELECT TOP @num_results c.product_id, c.product_name, c.price, c.product_description,
+            VectorDistance(c.product_description_vector, @embedding) AS SimilarityScore
+        FROM c
+        ORDER BY VectorDistance(c.product_description_vector, @embedding)
+        '''
+
+# Hybrid search: the vector similarity and the full-text (BM25) scores of the product name and
+# description are fused by reciprocal rank fusion over the whole container, so products matching
+# only the words of the question are found too. Needs the full-text policy and indexes of the
+# products container; {terms} is filled in with a parameter per search term.
+HYBRID_SEARCH_QUERY = '''
+        SELECT TOP @num_results c.product_id, c.product_name, c.price, c.product_description,
+            VectorDistance(c.product_description_vector, @embedding) AS SimilarityScore
+        FROM c
+        ORDER BY RANK RRF(VectorDistance(c.product_description_vector, @embedding),
+            FullTextScore(c.product_name, {terms}), FullTextScore(c.product_description, {terms}))
+        '''
+
+# Words left out of the full-text score
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can do does for from have i in is it its me my of on or "
+    "that the their this to want was what which with you your".split()
+)
+
+# BM25 term frequency saturation and length normalization, and the reciprocal rank fusion constant
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# Words of the question passed to the full-text search
+MAX_SEARCH_TERMS = 8
+
+# Cleared when the products container turns out to have no full-text indexes
+_full_text = config.PRODUCT_SEARCH_FULL_TEXT
+
+
+def search_parameters(vectors, num_results):
+    return [
+        {"name": "@embedding", "value": vector_utils.to_storage(vectors, config.PRODUCT_VECTOR_DATA_TYPE)},
+        {"name": "@num_results", "value": num_results},
+    ]
+
+def search_query(vectors, num_results, query_text=None):
+    """Query and parameters of a product search in Cosmos DB, and whether it is a hybrid search.
+
+    The search is hybrid when there is a query_text with words to search for and full-text
+    search is enabled; its rows are then already ranked."""
+
+    parameters = search_parameters(vectors, num_results)
+    terms = list(dict.fromkeys(tokenize(query_text)))[:MAX_SEARCH_TERMS] if query_text and _full_text else []
+    if not terms:
+        return PRODUCT_SEARCH_QUERY, parameters, False
+    names = [f"@term{i}" for i in range(len(terms))]
+    parameters += [{"name": name, "value": term} for name, term in zip(names, terms)]
+    return HYBRID_SEARCH_QUERY.format(terms=", ".join(names)), parameters, True
+
+def full_text_unavailable(error):
+    """Search by vector similarity only from now on, e.g. after error from a hybrid search (400)
+    against a products container created without full-text indexes."""
+
+    global _full_text
+    if _full_text:
+        _full_text = False
+        print(f"Hybrid product search failed, re-ranking vector search results instead: {error}")
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", (text or "").lower()) if word not in STOP_WORDS]
+
+def bm25_scores(query, documents):
+    """BM25 score of each document text for the query, with statistics taken from the documents."""
+
+    query_terms = set(tokenize(query))
+    tokenized = [tokenize(document) for document in documents]
+    if not query_terms or not tokenized:
+        return [0.0] * len(documents)
+
+    average_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1
+    document_frequency = Counter(term for tokens in tokenized for term in set(tokens) & query_terms)
+
+    scores = []
+    for tokens in tokenized:
+        frequencies = Counter(tokens)
+        score = 0.0
+        for term in query_terms:
+            frequency = frequencies[term]
+            if not frequency:
+                continue
+            idf = math.log((len(tokenized) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5) + 1)
+            length_norm = 1 - BM25_B + BM25_B * len(tokens) / average_length
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+        scores.append(score)
+    return scores
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse rankings (lists of row indexes, best first) into one score per row index."""
+
+    scores = Counter()
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] += 1 / (k + rank + 1)
+    return scores
+
+def rank_results(rows, query_text=None, similarity_score=0.02, num_results=3):
+    """Return the best num_results search rows (ordered by similarity) at or above similarity_score.
+
+    With a query_text the rows are re-ranked by reciprocal rank fusion of their vector similarity
+    and the BM25 score of their product name and description."""
+
+    rows = [row for row in rows if row["SimilarityScore"] >= similarity_score]
+    if not query_text or len(rows) < 2:
+        return rows[:num_results]
+
+    text_scores = bm25_scores(query_text, [f"{row['product_name']} {row['product_description']}" for row in rows])
+    vector_ranking = sorted(range(len(rows)), key=lambda i: -rows[i]["SimilarityScore"])
+    text_ranking = sorted((i for i in range(len(rows)) if text_scores[i] > 0), key=lambda i: -text_scores[i])
+
+    fused = reciprocal_rank_fusion([vector_ranking, text_ranking])
+    best = sorted(range(len(rows)), key=lambda i: (-fused[i], -rows[i]["SimilarityScore"]))[:num_results]
+    return [rows[i] for i in best]
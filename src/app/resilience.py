@@ -0,0 +1,356 @@
+import asyncio
+import functools
+import inspect
+import json
+import random
+import threading
+import time
+
+import openai
+
+import config
+import context_window
+import telemetry
+
+# Calls to Cosmos DB and Azure OpenAI go through a Dependency: a token bucket keeps them under the
+# provisioned throughput, throttled and transient failures are retried after the service's
+# retry-after (or a jittered backoff), and a circuit breaker fails calls fast while the service
+# keeps failing. Agent tools turn the errors into a structured result the model can relay.
+
+# Throttled, conflicting write, timed out or unavailable
+RETRYABLE_STATUS_CODES = (408, 429, 449, 500, 502, 503, 504)
+
+# Completion tokens assumed for a chat completion before its usage is known
+CHAT_COMPLETION_TOKENS_ESTIMATE = 300
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit breaker is open."""
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(f"{dependency} is unavailable, retry in {retry_after:.0f} s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def status_code(error):
+    """HTTP status of a Cosmos DB or Azure OpenAI error; connection errors count as 503."""
+
+    code = getattr(error, "status_code", None)
+    if code is None and isinstance(error, openai.APIConnectionError):
+        return 503
+    return code
+
+def retry_after_seconds(error):
+    """How long the service asked to wait before retrying, or None."""
+
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    headers = headers or {}
+    for name, seconds in (("x-ms-retry-after-ms", 0.001), ("retry-after-ms", 0.001), ("retry-after", 1)):
+        try:
+            return float(headers[name]) * seconds
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+def backoff_seconds(attempt, base=config.RETRY_BASE_DELAY_SECONDS, maximum=config.RETRY_MAX_DELAY_SECONDS):
+    """Exponential backoff with full jitter, so clients throttled together don't retry together."""
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Rate limiter allowing rate units per second on average, in bursts of up to capacity.
+
+    Units can be spent after the fact (the RU charge of a request is only known once it completes);
+    the debt delays the callers that follow. When the service throttles anyway, the rate is halved
+    (once per second, however many concurrent requests were throttled) and every success then
+    adds back a twentieth of the configured rate."""
+
+    def __init__(self, rate, capacity=None, min_rate_fraction=0.1):
+        self.max_rate = self.rate = rate
+        self.min_rate = rate * min_rate_fraction
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, cost=0):
+        """Take cost units and return the seconds to wait before making the call."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= cost
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def spend(self, cost):
+        """Take cost units (or give them back when negative) without waiting."""
+
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - cost)
+
+    def throttled(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            if now - self.decreased_at >= 1.0:
+                self.rate, self.decreased_at = max(self.min_rate, self.rate / 2), now
+            if retry_after:
+                # Every caller waits out the service's retry-after, not only the one throttled
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """Fails calls fast for reset_seconds after failure_threshold consecutive failures, then lets
+    a single trial call through and closes again if it succeeds."""
+
+    def __init__(self, name, failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD, reset_seconds=config.CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call is not let through; returns True for the trial call."""
+
+        with self._lock:
+            if self.state == "closed":
+                return False
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                return True
+            raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def end_trial(self):
+        """Open again if the trial call ended without an outcome (e.g. it was cancelled)."""
+
+        with self._lock:
+            if self.state == "half_open":
+                self.state, self.opened_at = "open", time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures = "closed", 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit breaker for {self.name} opened after {self.failures} failures")
+                self.state, self.opened_at = "open", time.monotonic()
+
+
+class Dependency:
+    """A remote service called through a rate limiter, retries and a circuit breaker.
+
+    measure returns the units a result actually used (e.g. its token usage), to correct the
+    cost reserved before the call."""
+
+    def __init__(self, name, rate=0, capacity=None, max_attempts=config.RETRY_MAX_ATTEMPTS, measure=None):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity) if rate else None
+        self.breaker = CircuitBreaker(name)
+        self.max_attempts = max_attempts
+        self.measure = measure
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _before(self, cost):
+        """Whether the call is the circuit breaker's trial, and the seconds to wait before making it."""
+
+        try:
+            trial = self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+        self._count("calls")
+        return trial, self.bucket.reserve(cost) if self.bucket else 0.0
+
+    def _succeeded(self, result, cost):
+        self.breaker.record_success()
+        if self.bucket:
+            self.bucket.succeeded()
+            used = self.measure(result) if self.measure else None
+            if used is not None:
+                self.bucket.spend(used - cost)
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying error, or None to give up."""
+
+        code = status_code(error)
+        if code not in RETRYABLE_STATUS_CODES:
+            if code is not None:
+                # The service answered (e.g. not found or conflict), so it is up
+                self.breaker.record_success()
+            # Other errors (e.g. a bug in the caller) say nothing about the service; a trial call
+            # that ends with one opens the breaker again
+            return None
+        retry_after = retry_after_seconds(error)
+        if code == 429:
+            self._count("throttled")
+            if self.bucket:
+                self.bucket.throttled(retry_after)
+        if attempt + 1 >= self.max_attempts or self.breaker.state == "half_open":
+            self._count("failed")
+            self.breaker.record_failure()
+            return None
+        self._count("retries")
+        return retry_after if retry_after is not None else backoff_seconds(attempt)
+
+    def call(self, func, *args, cost=0, on_retry=None, **kwargs):
+        """Call func(*args, **kwargs), reserving cost units of the rate limit first.
+
+        on_retry is called with the error of every attempt that is retried."""
+
+        attempt = 0
+        while True:
+            trial, wait = self._before(cost)
+            try:
+                time.sleep(wait)
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(e)
+            else:
+                self._succeeded(result, cost)
+                return result
+            finally:
+                if trial:
+                    self.breaker.end_trial()
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, func, *args, cost=0, on_retry=None, **kwargs):
+        """Asyncio version of call; func can be a coroutine function or return an awaitable."""
+
+        attempt = 0
+        while True:
+            trial, wait = self._before(cost)
+            try:
+                await asyncio.sleep(wait)
+                result = func(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(e)
+            else:
+                self._succeeded(result, cost)
+                return result
+            finally:
+                # A cancelled trial call records no outcome, and must not leave the breaker half open
+                if trial:
+                    self.breaker.end_trial()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def guard(self, func):
+        """Decorate a function so every call to it goes through this dependency."""
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.call_async(func, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+
+def _total_tokens(result):
+    return getattr(getattr(result, "usage", None), "total_tokens", None)
+
+def estimate_chat_tokens(messages):
+    """Tokens a chat completion is expected to use, before its usage is known."""
+    return sum(context_window.count_tokens(message) for message in messages) + CHAT_COMPLETION_TOKENS_ESTIMATE
+
+
+# Dependencies of the app. Request units are charged to the Cosmos DB rate limit as each operation
+# completes; token buckets for Azure OpenAI refill per second, with up to ten seconds of burst.
+cosmos = Dependency("Cosmos DB", rate=config.COSMOS_RU_PER_SECOND)
+openai_chat = Dependency(
+    "Azure OpenAI chat", rate=config.OPENAI_CHAT_TOKENS_PER_MINUTE / 60,
+    capacity=config.OPENAI_CHAT_TOKENS_PER_MINUTE / 6, measure=_total_tokens)
+openai_embeddings = Dependency(
+    "Azure OpenAI embeddings", rate=config.OPENAI_EMBEDDING_TOKENS_PER_MINUTE / 60,
+    capacity=config.OPENAI_EMBEDDING_TOKENS_PER_MINUTE / 6, measure=_total_tokens)
+
+if cosmos.bucket is not None:
+    telemetry.add_listener(lambda operation: cosmos.bucket.spend(operation.request_charge))
+
+def stats():
+    return {dependency.name: {**dependency.stats, "circuit": dependency.breaker.state,
+                              "rate": dependency.bucket.rate if dependency.bucket else None}
+            for dependency in (cosmos, openai_chat, openai_embeddings)}
+
+
+def tool_error(error):
+    """Structured result of a tool that failed, for the model to tell the user what happened."""
+
+    if isinstance(error, CircuitOpenError):
+        return {
+            "error": "unavailable",
+            "message": f"{error.dependency} is temporarily unavailable. Ask the user to try again shortly.",
+            "retry_after_seconds": round(error.retry_after),
+        }
+    if status_code(error) == 429:
+        return {
+            "error": "busy",
+            "message": "The service is busy. Ask the user to try again shortly.",
+            "retry_after_seconds": round(retry_after_seconds(error) or 1),
+        }
+    return {"error": "failed", "message": f"The request could not be completed: {getattr(error, 'message', None) or error}"}
+
+def tool_errors(func):
+    """Decorate an agent tool so an exception is returned to the model as a tool_error, as JSON."""
+
+    def failed(e):
+        print(f"An error occurred in {func.__name__}: {e}")
+        return json.dumps(tool_error(e))
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                return failed(e)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            return failed(e)
+    return wrapper
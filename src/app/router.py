@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+import config
+import vector_utils
+
+# Example requests for each agent the triage agent hands off to
+ROUTE_EXEMPLARS = {
+    "Sales Agent": [
+        "I want to buy this",
+        "I'd like to place an order",
+        "Can I order the wool socks?",
+        "Please purchase a hat for me",
+        "Add the shoes to my order",
+        "I want to order product 7",
+    ],
+    "Refunds Agent": [
+        "I want a refund",
+        "I'd like to return an item",
+        "Can I get my money back for my order?",
+        "Please refund item 101",
+        "The shoes I bought don't fit, I want to send them back",
+        "How do I get a refund for my purchase?",
+    ],
+    "Product Agent": [
+        "What products do you have?",
+        "Tell me about your hats",
+        "Do you sell something to keep my feet warm?",
+        "Which shoes would you recommend for running?",
+        "What is the price of the wool socks?",
+        "I'm looking for a gift, what do you have?",
+    ],
+}
+
+# Fallback when the embeddings are not conclusive: phrases that point to a single agent
+ROUTE_KEYWORDS = {
+    "Sales Agent": ("buy", "order", "purchase", "checkout"),
+    "Refunds Agent": ("refund", "return", "money back", "send back", "reimburse"),
+    "Product Agent": ("recommend", "do you have", "do you sell", "tell me about", "looking for", "price of", "what products"),
+}
+
+# Labelled requests for evaluating the router (agent is null where only the LLM should decide)
+ROUTING_EXAMPLES_PATH = "data/routing_examples.jsonl"
+
+
+@dataclass
+class RouteDecision:
+    """Agent a request was routed to (None to leave it to the triage agent) and how."""
+    agent_name: str = None
+    method: str = None
+    score: float = 0.0
+    margin: float = 0.0
+    elapsed_ms: float = 0.0
+
+
+def keyword_route(text):
+    """Return the only agent whose keywords appear in text, or None if none or several do."""
+
+    text = text.lower()
+    matches = {
+        agent_name for agent_name, keywords in ROUTE_KEYWORDS.items()
+        if any(re.search(rf"\b{re.escape(keyword)}", text) for keyword in keywords)
+    }
+    return matches.pop() if len(matches) == 1 else None
+
+
+class Router:
+    """Routes clear requests straight to the sales, refunds or product agent.
+
+    A request is routed by embedding when its best exemplar similarity reaches threshold and beats
+    the best exemplar of any other agent by margin, otherwise by keywords when exactly one agent's
+    keywords match. Anything else goes to the triage agent, which asks the LLM."""
+
+    def __init__(self, embed, embed_many, exemplars=ROUTE_EXEMPLARS,
+                 threshold=config.ROUTER_THRESHOLD, margin=config.ROUTER_MARGIN):
+        self.embed = embed
+        self.embed_many = embed_many
+        self.exemplars = exemplars
+        self.threshold = threshold
+        self.margin = margin
+        self._labels = None
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.counts = {"embedding": 0, "keyword": 0, "triage": 0}
+        self.route_ms = 0.0
+
+    def _load(self):
+        with self._lock:
+            if self._labels is None:
+                labels = [agent_name for agent_name, texts in self.exemplars.items() for _ in texts]
+                vectors = self.embed_many([text for texts in self.exemplars.values() for text in texts])
+                self._matrix = [vector_utils.normalize(vector) for vector in vectors]
+                if vector_utils.np is not None:
+                    self._matrix = vector_utils.np.stack(self._matrix)
+                self._labels = labels
+
+    def scores(self, text):
+        """Best exemplar similarity per agent for text."""
+
+        self._load()
+        vector = vector_utils.normalize(self.embed(text))
+        if vector_utils.np is not None:
+            similarities = (self._matrix @ vector).tolist()
+        else:
+            similarities = [sum(x * y for x, y in zip(row, vector)) for row in self._matrix]
+
+        best = {}
+        for label, similarity in zip(self._labels, similarities):
+            best[label] = max(best.get(label, -1.0), similarity)
+        return best
+
+    def route(self, text):
+        start = time.perf_counter()
+        best = sorted(self.scores(text).items(), key=lambda item: -item[1])
+        (agent_name, score), runner_up = best[0], best[1][1] if len(best) > 1 else -1.0
+
+        if score >= self.threshold and score - runner_up >= self.margin:
+            decision = RouteDecision(agent_name, "embedding", score, score - runner_up)
+        else:
+            keyword_agent = keyword_route(text)
+            decision = RouteDecision(keyword_agent, "keyword" if keyword_agent else "triage", score, score - runner_up)
+
+        decision.elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.counts[decision.method] += 1
+            self.route_ms += decision.elapsed_ms
+        return decision
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            routed = total - self.counts["triage"]
+            return {
+                **self.counts,
+                "routed_rate": routed / total if total else 0.0,
+                "average_route_ms": self.route_ms / total if total else 0.0,
+            }
+
+
+def load_examples(path=None):
+    """Labelled routing examples: dicts with text and agent (None when the LLM should decide)."""
+
+    path = path or os.path.join(os.path.dirname(__file__), ROUTING_EXAMPLES_PATH)
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(router, examples, triage_ms):
+    """Accuracy, coverage and estimated latency saved of the router on labelled examples.
+
+    Every request routed correctly skips the triage agent's completion, estimated at triage_ms,
+    while a misrouted one costs about as much again for the agent to hand it back. Every request
+    costs the time spent routing (mostly embedding the request)."""
+
+    routed = correct = wrong = 0
+    route_ms = 0.0
+    for example in examples:
+        decision = router.route(example["text"])
+        route_ms += decision.elapsed_ms
+        if decision.agent_name is None:
+            continue
+        routed += 1
+        if decision.agent_name == example.get("agent"):
+            correct += 1
+        else:
+            wrong += 1
+
+    total = len(examples)
+    return {
+        "examples": total,
+        "routed": routed,
+        "accuracy": correct / routed if routed else 0.0,
+        "misrouted": wrong,
+        "coverage": routed / total if total else 0.0,
+        "average_route_ms": route_ms / total if total else 0.0,
+        "saved_ms_per_request": ((correct - wrong) * triage_ms - route_ms) / total if total else 0.0,
+    }
+
+
+def create_router():
+    """Router embedding with the Azure OpenAI embedding deployment."""
+
+    import azure_open_ai
+
+    return Router(
+        embed=lambda text: azure_open_ai.generate_embedding(text, compact=True),
+        embed_many=lambda texts: azure_open_ai.generate_embeddings(texts, compact=True),
+    )
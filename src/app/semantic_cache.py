@@ -0,0 +1,124 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+import vector_utils
+
+
+class SemanticCache:
+    """Caches product search results by query embedding.
+
+    A query whose embedding has a cosine similarity of at least threshold with a cached query is
+    answered with that query's results. Entries expire after ttl_seconds and the least recently
+    used are evicted beyond max_items. When a product changes, the entries it could affect are
+    dropped: those that returned it, and those it would now rank into."""
+
+    def __init__(self, threshold=0.95, max_items=1000, ttl_seconds=3600):
+        self.threshold = threshold
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _similarities(self, vector):
+        # Cosine similarity of the (normalized) vector with every cached query
+        if vector_utils.np is not None:
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = vector_utils.np.stack([self._entries[key]["vector"] for key in self._matrix_keys])
+            return zip(self._matrix_keys, (self._matrix @ vector).tolist())
+        return ((key, sum(x * y for x, y in zip(entry["vector"], vector))) for key, entry in self._entries.items())
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._matrix = None
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry["expires_at"] <= now]:
+            self._remove(key)
+            self.evictions += 1
+
+    def lookup(self, vector):
+        """Return the results cached for the most similar query above the threshold, or None."""
+
+        vector = vector_utils.normalize(vector)
+        with self._lock:
+            self._expire()
+            best_key, best_similarity = None, self.threshold
+            if self._entries:
+                for key, similarity in self._similarities(vector):
+                    if similarity >= best_similarity:
+                        best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            return copy.deepcopy(self._entries[best_key]["results"])
+
+    def store(self, vector, results, product_ids, min_score=None):
+        """Cache the results of a query.
+
+        min_score is the lowest similarity a product needs to rank into these results, or None
+        if any product could (fewer results than requested)."""
+
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = {
+                "vector": vector_utils.normalize(vector),
+                "results": copy.deepcopy(results),
+                "product_ids": {str(product_id) for product_id in product_ids},
+                "min_score": min_score,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._matrix = None
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_product(self, product):
+        """Drop the entries a changed product document could affect."""
+
+        product_id = str(product["product_id"])
+        product_vector = product.get("product_description_vector")
+        with self._lock:
+            affected = set()
+            if product_vector is not None and self._entries:
+                for key, similarity in self._similarities(vector_utils.normalize(product_vector)):
+                    min_score = self._entries[key]["min_score"]
+                    if min_score is None or similarity >= min_score:
+                        affected.add(key)
+            affected.update(key for key, entry in self._entries.items() if product_id in entry["product_ids"])
+
+            for key in affected:
+                self._remove(key)
+            self.invalidations += len(affected)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Session:
+    """In-memory state of one chat session."""
+    user_id: str
+    session_id: str
+    messages: list = field(default_factory=list)
+    agent_name: str = "Triage Agent"
+    history_token: str = None
+    last_active: float = field(default_factory=time.monotonic)
+    # Serializes turns of the same session
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+class SessionStore:
+    """Bounded store of active chat sessions keyed by (user_id, session_id).
+
+    A session's history is loaded lazily from its own Cosmos DB partition the first time it is
+    used. Sessions idle for longer than idle_seconds, or the least recently used ones beyond
+    max_sessions, are dropped from memory; their history stays in Cosmos DB and is loaded
+    again if the session comes back."""
+
+    def __init__(self, loader, max_sessions=1000, idle_seconds=1800):
+        self.loader = loader
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user_id, session_id):
+        """Return the session, loading its latest history page if it is not in memory."""
+
+        key = (user_id, session_id)
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(key)
+            if session is not None:
+                session.last_active = time.monotonic()
+                self._sessions.move_to_end(key)
+                return session
+
+        # Load outside the store lock so other sessions are not blocked on Cosmos DB
+        messages, history_token = self.loader(user_id, session_id)
+        session = Session(user_id=user_id, session_id=session_id, messages=messages, history_token=history_token)
+
+        with self._lock:
+            self.loads += 1
+            session = self._sessions.setdefault(key, session)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def drop(self, user_id, session_id):
+        with self._lock:
+            self._sessions.pop((user_id, session_id), None)
+
+    def _evict_idle(self):
+        # Sessions are kept in least recently used order, so idle ones are at the front
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.last_active > cutoff:
+                break
+            del self._sessions[key]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._sessions), "loads": self.loads, "evictions": self.evictions}
@@ -0,0 +1,209 @@
+import asyncio
+import contextvars
+import copy
+import inspect
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from swarm import Swarm
+from swarm.types import Response, Result
+from swarm.util import debug_print
+
+import config
+import resilience
+import telemetry
+
+# Name of the argument Swarm injects into tool functions that ask for the context variables
+CTX_VARS_NAME = "context_variables"
+
+# Tool calls of a single completion expected to run at the same time
+TOOL_CALLS_PER_TURN = 8
+
+
+def handoff(func):
+    """Mark a tool function as an agent handoff.
+
+    Handoffs are never run concurrently: they run one at a time, in the order the model called
+    them, so the agent that ends up active is the same as with sequential execution."""
+    func.handoff = True
+    return func
+
+def is_handoff(func):
+    return getattr(func, "handoff", False)
+
+def prepare_tool_call(tool_call, function_map, context_variables):
+    """Return the function and arguments for a tool call, or (None, None) if the tool is unknown."""
+
+    func = function_map.get(tool_call.function.name)
+    if func is None:
+        return None, None
+
+    args = json.loads(tool_call.function.arguments)
+    # Signature rather than __code__, so decorated tool functions are seen through
+    if CTX_VARS_NAME in inspect.signature(func).parameters:
+        args[CTX_VARS_NAME] = context_variables
+    return func, args
+
+def merge_tool_results(tool_calls, results):
+    """Build the partial response from tool results, in the model's original tool call order."""
+
+    partial_response = Response(messages=[], agent=None, context_variables={})
+
+    for tool_call, result in zip(tool_calls, results):
+        partial_response.messages.append(
+            {"role": "tool", "tool_call_id": tool_call.id, "tool_name": tool_call.function.name, "content": result.value}
+        )
+        partial_response.context_variables.update(result.context_variables)
+        if result.agent:
+            partial_response.agent = result.agent
+
+    return partial_response
+
+
+class ParallelSwarm(Swarm):
+    """Swarm client that runs the independent tool calls of a completion concurrently.
+
+    Tool calls other than handoffs run in a thread pool; tool messages are still appended in the
+    order the model returned the calls. The pool is shared by every session, so it is sized for
+    all the turns Gradio runs at once; a turn's tool calls would otherwise wait on other sessions'.
+    Threads are only started as they are needed."""
+
+    def __init__(self, client=None, max_workers=None):
+        super().__init__(client)
+        max_workers = max_workers or config.GRADIO_CONCURRENCY_LIMIT * TOOL_CALLS_PER_TURN
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="swarm-tool")
+
+    def get_chat_completion(self, agent, *args, **kwargs):
+        telemetry.set_agent(agent.name)
+        # Rate limited and retried here; the OpenAI client itself does not retry
+        cost = resilience.estimate_chat_tokens(kwargs.get("history") or [])
+        return resilience.openai_chat.call(super().get_chat_completion, agent, *args, cost=cost, **kwargs)
+
+    def handle_tool_calls(self, tool_calls, functions, context_variables, debug) -> Response:
+        function_map = {f.__name__: f for f in functions}
+        results = [None] * len(tool_calls)
+        futures = {}
+        sequential = []
+
+        for i, tool_call in enumerate(tool_calls):
+            name = tool_call.function.name
+            func, args = prepare_tool_call(tool_call, function_map, context_variables)
+            if func is None:
+                debug_print(debug, f"Tool {name} not found in function map.")
+                results[i] = Result(value=f"Error: Tool {name} not found.")
+            elif is_handoff(func) or len(tool_calls) == 1:
+                sequential.append((i, func, args))
+            else:
+                debug_print(debug, f"Processing tool call: {name} with arguments {args}")
+                # Run in a copy of this context so the tool's telemetry is attributed to this turn
+                futures[i] = self.executor.submit(contextvars.copy_context().run, func, **args)
+
+        for i, func, args in sequential:
+            debug_print(debug, f"Processing tool call: {func.__name__} with arguments {args}")
+            results[i] = self.handle_function_result(func(**args), debug)
+
+        for i, future in futures.items():
+            results[i] = self.handle_function_result(future.result(), debug)
+
+        return merge_tool_results(tool_calls, results)
+
+
+class AsyncSwarm(Swarm):
+    """Swarm run loop for an AsyncAzureOpenAI client.
+
+    Coroutine tool functions are awaited; plain functions run in a worker thread so they do not
+    block the event loop. Independent tool calls of a completion run concurrently."""
+
+    def get_chat_completion(self, agent, *args, **kwargs):
+        telemetry.set_agent(agent.name)
+        cost = resilience.estimate_chat_tokens(kwargs.get("history") or [])
+        # A coroutine: the asyncio client returns an awaitable completion
+        return resilience.openai_chat.call_async(super().get_chat_completion, agent, *args, cost=cost, **kwargs)
+
+    async def call_tool(self, func, args):
+        if inspect.iscoroutinefunction(func):
+            return await func(**args)
+        return await asyncio.to_thread(func, **args)
+
+    async def handle_tool_calls(self, tool_calls, functions, context_variables, debug) -> Response:
+        function_map = {f.__name__: f for f in functions}
+        results = [None] * len(tool_calls)
+        tasks = {}
+        handoffs = []
+
+        for i, tool_call in enumerate(tool_calls):
+            name = tool_call.function.name
+            func, args = prepare_tool_call(tool_call, function_map, context_variables)
+            if func is None:
+                debug_print(debug, f"Tool {name} not found in function map.")
+                results[i] = Result(value=f"Error: Tool {name} not found.")
+            elif is_handoff(func):
+                handoffs.append((i, func, args))
+            else:
+                debug_print(debug, f"Processing tool call: {name} with arguments {args}")
+                tasks[i] = self.call_tool(func, args)
+
+        # Independent tool calls run concurrently, handoffs one at a time in model order
+        for i, raw_result in zip(tasks, await asyncio.gather(*tasks.values())):
+            results[i] = self.handle_function_result(raw_result, debug)
+
+        for i, func, args in handoffs:
+            debug_print(debug, f"Processing tool call: {func.__name__} with arguments {args}")
+            results[i] = self.handle_function_result(await self.call_tool(func, args), debug)
+
+        return merge_tool_results(tool_calls, results)
+
+    async def run(
+        self,
+        agent,
+        messages,
+        context_variables={},
+        model_override=None,
+        stream=False,
+        debug=False,
+        max_turns=float("inf"),
+        execute_tools=True,
+    ) -> Response:
+        if stream:
+            raise ValueError("AsyncSwarm does not support streaming")
+
+        active_agent = agent
+        context_variables = copy.deepcopy(context_variables)
+        history = copy.deepcopy(messages)
+        init_len = len(messages)
+
+        while len(history) - init_len < max_turns and active_agent:
+
+            # get completion with current history, agent (the async client returns a coroutine)
+            completion = await self.get_chat_completion(
+                agent=active_agent,
+                history=history,
+                context_variables=defaultdict(str, context_variables),
+                model_override=model_override,
+                stream=stream,
+                debug=debug,
+            )
+            message = completion.choices[0].message
+            debug_print(debug, "Received completion:", message)
+            message.sender = active_agent.name
+            history.append(json.loads(message.model_dump_json()))
+
+            if not message.tool_calls or not execute_tools:
+                debug_print(debug, "Ending turn.")
+                break
+
+            # handle function calls, updating context_variables, and switching agents
+            partial_response = await self.handle_tool_calls(
+                message.tool_calls, active_agent.functions, context_variables, debug
+            )
+            history.extend(partial_response.messages)
+            context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                active_agent = partial_response.agent
+
+        return Response(
+            messages=history[init_len:],
+            agent=active_agent,
+            context_variables=context_variables,
+        )
@@ -0,0 +1,316 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+# OpenTelemetry is optional; without it operations are still summarized per turn and in totals()
+try:
+    from opentelemetry import metrics, trace
+except ImportError:
+    metrics = trace = None
+
+# Instrumentation scope of the spans and metrics
+INSTRUMENTATION_NAME = "multi-agent-cosmos"
+
+if trace is not None:
+    _tracer = trace.get_tracer(INSTRUMENTATION_NAME)
+    _meter = metrics.get_meter(INSTRUMENTATION_NAME)
+    _request_charge = _meter.create_histogram("cosmos.request_charge", unit="RU", description="Request units charged per operation")
+    _client_duration = _meter.create_histogram("cosmos.client.duration", unit="ms", description="Operation latency seen by the client")
+    _server_duration = _meter.create_histogram("cosmos.server.duration", unit="ms", description="Operation latency reported by the service")
+    _retries = _meter.create_counter("cosmos.retries", description="Throttled requests retried")
+
+# Turn being served in the current context, and the tool function running in it
+_turn = contextvars.ContextVar("telemetry_turn", default=None)
+_tool = contextvars.ContextVar("telemetry_tool", default=None)
+# Operation recording the Cosmos DB requests made in the current context, see record_requests
+_recording = contextvars.ContextVar("telemetry_recording", default=None)
+
+
+def parse_query_metrics(header):
+    """Parse an x-ms-documentdb-query-metrics header ("name=value;...") into a dict of floats."""
+
+    parsed = {}
+    for pair in (header or "").split(";"):
+        name, _, value = pair.partition("=")
+        try:
+            parsed[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return parsed
+
+
+@dataclass
+class Operation:
+    """RU charge and latency of one Cosmos DB data-access call, summed over its requests and pages."""
+    name: str
+    container: str
+    agent: str = None
+    tool: str = None
+    request_charge: float = 0.0
+    client_ms: float = 0.0
+    server_ms: float = 0.0
+    retries: int = 0
+    requests: int = 0
+    status_code: int = None
+    query_metrics: dict = field(default_factory=dict)
+    # Set when every request is recorded through record_requests, error responses included
+    per_request: bool = False
+
+    def record(self, headers, _=None):
+        """Add the response headers of one request. Can be passed as an SDK response_hook."""
+
+        headers = headers or {}
+        self.requests += 1
+        self.request_charge += float(headers.get("x-ms-request-charge", 0) or 0)
+        self.server_ms += float(headers.get("x-ms-request-duration-ms", 0) or 0)
+        self.retries += int(headers.get("x-ms-throttle-retry-count", 0) or 0)
+        for name, value in parse_query_metrics(headers.get("x-ms-documentdb-query-metrics")).items():
+            self.query_metrics[name] = self.query_metrics.get(name, 0.0) + value
+
+    def retried(self, error):
+        """Count a retry of the operation; can be passed as the on_retry of resilience.Dependency.call."""
+        self.retries += 1
+
+    @property
+    def attributes(self):
+        attributes = {"db.system": "cosmosdb", "db.operation.name": self.name, "db.collection.name": self.container}
+        if self.agent:
+            attributes["app.agent"] = self.agent
+        if self.tool:
+            attributes["app.tool"] = self.tool
+        if self.status_code is not None:
+            attributes["db.response.status_code"] = str(self.status_code)
+        return attributes
+
+
+@dataclass
+class TurnSummary:
+    """Cosmos DB operations made while serving one chat turn, and the agent currently active."""
+    agent: str = None
+    operations: list = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    elapsed_ms: float = 0.0
+    span: object = field(default=None, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, operation):
+        with self.lock:
+            self.operations.append(operation)
+
+    @property
+    def request_charge(self):
+        return sum(operation.request_charge for operation in self.operations)
+
+    def by_tool(self):
+        """Operations, RU and client latency per (agent, tool), in order of RU charged."""
+
+        return _group(self.operations)
+
+    def __str__(self):
+        lines = [f"Turn took {self.elapsed_ms:.0f} ms, {len(self.operations)} Cosmos DB operations, {self.request_charge:.2f} RU"]
+        for (agent, tool), totals in self.by_tool().items():
+            lines.append(f"  {agent or '-'} / {tool or '-'}: {totals['operations']} operations, "
+                         f"{totals['request_charge']:.2f} RU, {totals['client_ms']:.0f} ms")
+        return "\n".join(lines)
+
+
+def _group(operations):
+    groups = {}
+    for operation in operations:
+        totals = groups.setdefault((operation.agent, operation.tool), {"operations": 0, "request_charge": 0.0, "client_ms": 0.0, "retries": 0})
+        totals["operations"] += 1
+        totals["request_charge"] += operation.request_charge
+        totals["client_ms"] += operation.client_ms
+        totals["retries"] += operation.retries
+    return dict(sorted(groups.items(), key=lambda item: -item[1]["request_charge"]))
+
+# Every operation since the process started, summed per (agent, tool), e.g. to see where RUs go under load
+_totals = {}
+_totals_lock = threading.Lock()
+
+def _add_to_totals(operation):
+    with _totals_lock:
+        for key, values in _group([operation]).items():
+            totals = _totals.setdefault(key, {name: 0 for name in values})
+            for name, value in values.items():
+                totals[name] += value
+
+def totals():
+    with _totals_lock:
+        return dict(sorted(((key, dict(values)) for key, values in _totals.items()), key=lambda item: -item[1]["request_charge"]))
+
+
+def current_turn():
+    return _turn.get()
+
+def start_turn(agent=None):
+    """Start collecting operations for a chat turn in the current context and return its TurnSummary."""
+
+    summary = TurnSummary(agent=agent)
+    if trace is not None:
+        summary.span = _tracer.start_span("chat turn", attributes={"app.agent": agent or ""})
+    _turn.set(summary)
+    return summary
+
+def resume_turn(summary):
+    """Make summary the current turn again, e.g. in a generator resumed in a fresh context."""
+    _turn.set(summary)
+
+def end_turn(summary):
+    """Finish a turn started with start_turn and return its summary."""
+
+    summary.elapsed_ms = (time.perf_counter() - summary.started) * 1000
+    if summary.span is not None:
+        summary.span.set_attribute("cosmos.request_charge", summary.request_charge)
+        summary.span.set_attribute("cosmos.operations", len(summary.operations))
+        summary.span.end()
+    if _turn.get() is summary:
+        _turn.set(None)
+    return summary
+
+def within_turn(summary, iterable):
+    """Iterate with summary as the current turn on every step.
+
+    Gradio advances generators in worker threads, each in a copy of the caller's context, so a
+    turn set while producing one item would be gone by the next."""
+
+    iterator = iter(iterable)
+    while True:
+        resume_turn(summary)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        yield item
+
+def set_agent(name):
+    """Attribute the operations that follow in this turn to the agent name."""
+
+    summary = _turn.get()
+    if summary is not None:
+        summary.agent = name
+
+
+def _parent_context():
+    # Spans nest under the current span, or under the turn's span when there is none
+    summary = _turn.get()
+    if summary is None or summary.span is None or trace.get_current_span().get_span_context().is_valid:
+        return None
+    return trace.set_span_in_context(summary.span)
+
+@contextmanager
+def _span(name, attributes):
+    if trace is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, context=_parent_context(), attributes=attributes) as span:
+        yield span
+
+def tool(func):
+    """Decorate an agent tool function so the Cosmos DB operations it makes are attributed to it."""
+
+    def attributes():
+        summary = _turn.get()
+        return {"app.tool": func.__name__, "app.agent": (summary.agent if summary else None) or ""}
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            token = _tool.set(func.__name__)
+            try:
+                with _span(f"tool {func.__name__}", attributes()):
+                    return await func(*args, **kwargs)
+            finally:
+                _tool.reset(token)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _tool.set(func.__name__)
+        try:
+            with _span(f"tool {func.__name__}", attributes()):
+                return func(*args, **kwargs)
+        finally:
+            _tool.reset(token)
+    return wrapper
+
+@contextmanager
+def cosmos_operation(name, container):
+    """Measure one Cosmos DB data-access call.
+
+    Yields an Operation: pass its record method as the response_hook of point operations, and
+    read queries within record_requests(operation). Client latency is measured here."""
+
+    summary = _turn.get()
+    operation = Operation(name=name, container=container, agent=summary.agent if summary else None, tool=_tool.get())
+    start = time.perf_counter()
+
+    with _span(f"cosmos {name} {container}", operation.attributes) as span:
+        try:
+            yield operation
+        except Exception as e:
+            operation.status_code = getattr(e, "status_code", None)
+            headers = getattr(e, "headers", None)
+            if headers and not operation.per_request:
+                operation.record(headers)
+            raise
+        finally:
+            operation.client_ms = (time.perf_counter() - start) * 1000
+            if span is not None:
+                span.set_attributes({
+                    "cosmos.request_charge": operation.request_charge,
+                    "cosmos.server_duration_ms": operation.server_ms,
+                    "cosmos.retries": operation.retries,
+                    **{f"cosmos.query.{metric}": value for metric, value in operation.query_metrics.items()},
+                })
+            _finish(operation, summary)
+
+@contextmanager
+def record_requests(operation):
+    """Record every Cosmos DB request made in this context on operation, e.g. while reading a query.
+
+    The SDK does not call a query's response_hook for all of its requests: not for the query
+    plan, nor for the partitions of a cross-partition ORDER BY (e.g. a vector search). The
+    requests are seen here through record_response, the raw_response_hook of the clients."""
+
+    operation.per_request = True
+    token = _recording.set(operation)
+    try:
+        yield operation
+    finally:
+        _recording.reset(token)
+
+def record_response(response):
+    """raw_response_hook of the Cosmos DB clients, called with each HTTP response on the thread
+    (or task) that made the request."""
+
+    operation = _recording.get()
+    if operation is not None:
+        operation.record(response.http_response.headers)
+
+# Functions called with every finished Operation
+_listeners = []
+
+def add_listener(listener):
+    """Call listener with each Cosmos DB operation as it finishes, e.g. to charge its RUs to a rate limit."""
+    _listeners.append(listener)
+
+def _finish(operation, summary):
+    if summary is not None:
+        summary.add(operation)
+    _add_to_totals(operation)
+    for listener in _listeners:
+        listener(operation)
+
+    if trace is not None:
+        attributes = operation.attributes
+        _request_charge.record(operation.request_charge, attributes)
+        _client_duration.record(operation.client_ms, attributes)
+        if operation.server_ms:
+            _server_duration.record(operation.server_ms, attributes)
+        if operation.retries:
+            _retries.add(operation.retries, attributes)
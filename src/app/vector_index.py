@@ -0,0 +1,140 @@
+import threading
+
+# NumPy is optional for the app (see vector_utils) but the local vector index needs it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# hnswlib is optional; without it the index always uses brute-force search
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Product fields returned by a search, matching the projection of the Cosmos DB vector search
+RESULT_FIELDS = ("product_id", "product_name", "price", "product_description")
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class LocalVectorIndex:
+    """In-process replica of the product description vectors for nearest neighbour search.
+
+    Small catalogs are searched exhaustively with a single matrix product. From hnsw_threshold
+    products on, and when hnswlib is installed, an HNSW graph is used instead. Searches return
+    rows shaped like the Cosmos DB vector search results, so they can be formatted the same way.
+
+    Deletes do not appear in the change feed, so products are soft-deleted: a product document
+    with "deleted": true is removed from the index."""
+
+    def __init__(self, hnsw_threshold=50000, ef_search=64):
+        self.hnsw_threshold = hnsw_threshold
+        self.ef_search = ef_search
+        self.ready = False
+        self._documents = []
+        self._rows = {}
+        # Rows of removed products, skipped by searches
+        self._removed = []
+        self._vectors = np.empty((0, 0), dtype=np.float32) if np is not None else None
+        self._hnsw = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def load(self, documents):
+        """Replace the index contents with an iterable of product documents."""
+
+        documents = [document for document in documents if document.get("product_description_vector") and not document.get("deleted")]
+        with self._lock:
+            self._documents = [{field: document[field] for field in RESULT_FIELDS} for document in documents]
+            self._rows = {str(document["product_id"]): row for row, document in enumerate(documents)}
+            self._removed = []
+            self._vectors = _normalize([document["product_description_vector"] for document in documents]) \
+                if documents else np.empty((0, 0), dtype=np.float32)
+            self._hnsw = None
+            self._build_hnsw()
+            self.ready = True
+
+    def upsert(self, document):
+        """Add or replace one product, e.g. from the change feed."""
+
+        if document.get("deleted"):
+            self.remove(document["product_id"])
+            return
+        if not document.get("product_description_vector"):
+            return
+
+        vector = _normalize(document["product_description_vector"])
+        with self._lock:
+            key = str(document["product_id"])
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self._documents)
+                self._rows[key] = row
+                self._documents.append({})
+                self._vectors = np.vstack([self._vectors, vector[None, :]]) if self._vectors.size else vector[None, :]
+            else:
+                self._vectors[row] = vector
+            self._documents[row] = {field: document[field] for field in RESULT_FIELDS}
+
+            if self._hnsw is not None:
+                if row >= self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(max(2 * row, 1024))
+                self._hnsw.add_items(vector[None, :], [row])
+            else:
+                self._build_hnsw()
+
+    def remove(self, product_id):
+        """Drop one product. Its row is left empty rather than renumbering the others."""
+
+        with self._lock:
+            row = self._rows.pop(str(product_id), None)
+            if row is None:
+                return
+            self._documents[row] = None
+            self._vectors[row] = 0
+            self._removed.append(row)
+            if self._hnsw is not None:
+                self._hnsw.mark_deleted(row)
+
+    def _build_hnsw(self):
+        if hnswlib is None or len(self._documents) < self.hnsw_threshold:
+            return
+        index = hnswlib.Index(space="cosine", dim=self._vectors.shape[1])
+        index.init_index(max_elements=2 * len(self._documents), ef_construction=200, M=16)
+        index.add_items(self._vectors, np.arange(len(self._documents)))
+        for row in self._removed:
+            index.mark_deleted(row)
+        index.set_ef(self.ef_search)
+        self._hnsw = index
+
+    def search(self, vector, similarity_score=0.02, num_results=3):
+        """Return the products most similar to vector, best first, at or above similarity_score."""
+
+        query = _normalize(vector)
+        with self._lock:
+            if not self._rows:
+                return []
+            k = min(num_results, len(self._rows))
+
+            if self._hnsw is not None:
+                labels, distances = self._hnsw.knn_query(query, k=k)
+                rows, similarities = labels[0], 1 - distances[0]
+            else:
+                scores = self._vectors @ query
+                scores[self._removed] = -np.inf
+                rows = np.argpartition(-scores, k - 1)[:k]
+                rows = rows[np.argsort(-scores[rows])]
+                similarities = scores[rows]
+
+            return [
+                {**self._documents[row], "SimilarityScore": float(similarity)}
+                for row, similarity in zip(rows.tolist(), similarities.tolist())
+                if similarity >= similarity_score
+            ]
@@ -0,0 +1,87 @@
+import math
+import sys
+from array import array
+
+# NumPy is optional; without it compact vectors are array('f') and the math falls back to Python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def pack(vector):
+    """Pack a vector into little-endian float32 bytes."""
+
+    if np is not None:
+        return np.asarray(vector, dtype="<f4").tobytes()
+    packed = array("f", vector)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+def unpack(data, compact=False):
+    """Unpack little-endian float32 bytes.
+
+    Returns a list of floats, or with compact=True a float32 NumPy array (a view over data)
+    or array('f') when NumPy is not installed."""
+
+    if np is not None:
+        vector = np.frombuffer(data, dtype="<f4")
+        return vector if compact else vector.tolist()
+    vector = array("f")
+    vector.frombytes(data)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector if compact else vector.tolist()
+
+def to_float32(vector):
+    """Return vector in the compact float32 form."""
+
+    if np is not None:
+        return np.asarray(vector, dtype=np.float32)
+    return vector if isinstance(vector, array) and vector.typecode == "f" else array("f", vector)
+
+def as_list(vector):
+    """Return vector as a list of floats, e.g. for a JSON query parameter."""
+    return vector if isinstance(vector, list) else vector.tolist()
+
+def normalize(vector):
+    """Return vector scaled to unit length, in the compact float32 form."""
+
+    vector = to_float32(vector)
+    if np is not None:
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+    norm = math.sqrt(sum(x * x for x in vector))
+    return to_float32([x / norm for x in vector]) if norm else vector
+
+def truncate(vector, dimensions):
+    """Shorten an embedding to its first dimensions values and renormalize it.
+
+    This matches requesting the shorter embedding from a text-embedding-3 model, whose leading
+    dimensions carry most of the meaning."""
+
+    return normalize(to_float32(vector)[:dimensions])
+
+def quantize_int8(vector):
+    """Scale a vector into int8 values (-127 to 127), returned as a list of ints.
+
+    Each vector is scaled by its own largest magnitude, which keeps its direction, and so its
+    cosine similarity to other vectors, up to rounding."""
+
+    if np is not None:
+        vector = to_float32(vector)
+        scale = float(np.abs(vector).max()) if vector.size else 0.0
+        return np.rint(vector * (127 / scale)).astype(np.int8).tolist() if scale else [0] * len(vector)
+    scale = max((abs(x) for x in vector), default=0.0)
+    return [int(round(x * 127 / scale)) for x in vector] if scale else [0] * len(vector)
+
+def to_storage(vector, data_type="float32"):
+    """Return vector as stored in a document or passed as a query parameter for the given vector
+    data type of the container's vector embedding policy ("float32" or "int8")."""
+
+    if data_type == "int8":
+        return quantize_int8(vector)
+    if data_type != "float32":
+        raise ValueError(f"Unsupported vector data type: {data_type}")
+    return as_list(vector)
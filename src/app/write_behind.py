@@ -0,0 +1,310 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# Tells the worker to write everything pending and stop
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """Writes chat messages to Cosmos DB in the background, off the chat turn's critical path.
+
+    enqueue() only puts a turn's messages on a bounded queue. A worker thread coalesces them per
+    [user_id, session_id] partition and writes a partition's messages as transactional batches
+    once flush_messages are waiting or the oldest has waited flush_seconds. Up to max_concurrency
+    partitions are written at once, but only one batch at a time per partition.
+
+    Messages that cannot be written (or that find the queue full) are appended to a local journal
+    and written again retry_seconds after the failure, and on the next start. The journal is moved
+    aside while its messages are written again, and only removed once they all have been. Message ids are
+    derived from their sequence numbers and written as upserts, so writing a message twice is harmless."""
+
+    def __init__(self, write, max_pending=config.WRITE_BEHIND_MAX_PENDING,
+                 flush_messages=config.WRITE_BEHIND_FLUSH_MESSAGES, flush_seconds=config.WRITE_BEHIND_FLUSH_SECONDS,
+                 max_concurrency=config.WRITE_BEHIND_CONCURRENCY, journal_path=config.WRITE_BEHIND_JOURNAL_PATH,
+                 retry_seconds=config.WRITE_BEHIND_RETRY_SECONDS):
+        self.write = write
+        self.flush_messages = flush_messages
+        self.flush_seconds = flush_seconds
+        self.journal_path = journal_path
+        self.retry_seconds = retry_seconds
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="write-behind")
+        self._pending = {}
+        self._oldest = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._failed_at = None
+        self._thread = None
+        self._closed = False
+        # Partitions with messages from the journal being replayed that are not written yet
+        self._replaying = set()
+        # Messages enqueued per partition that are not written or journaled yet
+        self._unwritten = {}
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "journaled": 0, "replayed": 0}
+
+    def start(self):
+        """Start the worker, first queueing any messages left in the journal by an earlier run."""
+
+        with self._lock:
+            if self._thread is not None:
+                return self._thread
+            self._replay()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+        return self._thread
+
+    def enqueue(self, user_id, session_id, messages):
+        """Queue messages of one session to be written; returns without waiting on Cosmos DB."""
+
+        if self._thread is None:
+            self.start()
+        if self._closed:
+            # The worker has stopped: the journal is written on the next start
+            self._journal(user_id, session_id, messages)
+            return
+        key = (user_id, session_id)
+        with self._lock:
+            self._unwritten.setdefault(key, []).extend(messages)
+        try:
+            self.queue.put_nowait((user_id, session_id, messages))
+        except queue.Full:
+            # Backlogged: keep the messages in the journal rather than slow down the turn
+            self._journal(user_id, session_id, messages)
+            self._forget(key, messages)
+            return
+        self._count("enqueued", len(messages))
+
+    def unwritten(self, user_id, session_id):
+        """Messages of a session that are not in Cosmos DB yet: queued, being written or journaled."""
+
+        key = (user_id, session_id)
+        with self._lock:
+            messages = list(self._unwritten.get(key, ()))
+        if not self.journal_path:
+            return messages
+        with self._journal_lock:
+            for path in (self._replay_path, self.journal_path):
+                if not os.path.exists(path):
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if (entry["user_id"], entry["session_id"]) == key:
+                            messages.extend(entry["messages"])
+        return messages
+
+    def close(self, timeout=30):
+        """Write everything pending and stop the worker (registered to run at exit)."""
+
+        self._closed = True
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+        self.executor.shutdown(wait=True)
+
+        # Messages queued while the worker was stopping
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                self._journal(*item)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _run(self):
+        stopping = False
+        while True:
+            try:
+                item = self.queue.get(timeout=self._wait_seconds())
+            except queue.Empty:
+                item = None
+
+            # Take whatever else is queued, so a burst of turns is written together
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    self._add(*item)
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if not stopping and self._failed_at is not None and time.monotonic() - self._failed_at >= self.retry_seconds:
+                with self._lock:
+                    # One replay at a time; the next starts once the current one is written
+                    if not self._replaying:
+                        self._failed_at = None
+                        self._replay()
+
+            for key, messages, replayed in self._ready(stopping):
+                if stopping:
+                    # Written on this thread, as at exit the executor has already been shut down
+                    self._flush(key, messages, replayed)
+                    continue
+                try:
+                    self.executor.submit(self._flush, key, messages, replayed)
+                except RuntimeError:
+                    self._flush(key, messages, replayed)
+
+            if stopping:
+                with self._lock:
+                    if not self._pending and not self._in_flight:
+                        return
+
+    def _wait_seconds(self):
+        with self._lock:
+            if not self._oldest:
+                return self.flush_seconds
+            return max(0.01, min(self._oldest.values()) + self.flush_seconds - time.monotonic())
+
+    def _add(self, user_id, session_id, messages):
+        key = (user_id, session_id)
+        with self._lock:
+            self._pending.setdefault(key, []).extend(messages)
+            self._oldest.setdefault(key, time.monotonic())
+
+    def _ready(self, force=False):
+        """Take the pending messages of partitions that are due, and not being written already."""
+
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for key in list(self._pending):
+                if key in self._in_flight:
+                    continue
+                if force or len(self._pending[key]) >= self.flush_messages or now - self._oldest[key] >= self.flush_seconds:
+                    ready.append((key, self._pending.pop(key), key in self._replaying))
+                    del self._oldest[key]
+                    self._in_flight.add(key)
+        return ready
+
+    def _flush(self, key, messages, replayed=False):
+        user_id, session_id = key
+        try:
+            result = self.write(user_id=user_id, session_id=session_id, messages=messages)
+            error = result.error
+        except Exception as e:
+            error = str(e)
+
+        if error:
+            print(f"Writing {len(messages)} messages of session {session_id} failed, keeping them in the journal: {error}")
+            self._journal(user_id, session_id, messages)
+            with self._lock:
+                self._failed_at = time.monotonic()
+        else:
+            self._count("written", len(messages))
+            self._count("batches", len(result.batches))
+
+        self._forget(key, messages)
+        with self._lock:
+            self._in_flight.discard(key)
+            if replayed:
+                # Written, or back in the journal: the replayed copy is no longer needed
+                self._replaying.discard(key)
+                if not self._replaying:
+                    self._remove_replay_file()
+
+    def _forget(self, key, messages):
+        # The messages are written or in the journal now
+        with self._lock:
+            done = set(map(id, messages))
+            remaining = [message for message in self._unwritten.get(key, ()) if id(message) not in done]
+            if remaining:
+                self._unwritten[key] = remaining
+            else:
+                self._unwritten.pop(key, None)
+
+    def _journal(self, user_id, session_id, messages):
+        """Append messages to the journal, synced to disk before returning."""
+
+        if not self.journal_path:
+            print(f"Dropped {len(messages)} messages of session {session_id}: no journal configured")
+            return
+        line = json.dumps({"user_id": user_id, "session_id": session_id, "messages": messages}, default=str)
+        with self._journal_lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self._count("journaled", len(messages))
+
+    @property
+    def _replay_path(self):
+        return self.journal_path + ".replaying"
+
+    def _remove_replay_file(self):
+        with self._journal_lock:
+            if os.path.exists(self._replay_path):
+                os.remove(self._replay_path)
+
+    def _read_journal(self, path):
+        """Entries of a journal file; lines that don't parse (e.g. torn by a crash) are set aside."""
+
+        entries, corrupt = [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    corrupt.append(line.rstrip("\n"))
+        if corrupt:
+            print(f"Skipped {len(corrupt)} unreadable lines of {path}, kept in {self.journal_path}.corrupt")
+            with open(self.journal_path + ".corrupt", "a", encoding="utf-8") as f:
+                f.write("\n".join(corrupt) + "\n")
+        return entries
+
+    def _replay(self):
+        """Move the journal's messages back to pending. Called with self._lock held.
+
+        The journal is renamed to the replay file, which is removed once every partition in it has
+        been written (or journaled again). A replay file left by a crash is replayed again."""
+
+        if not self.journal_path:
+            return
+        with self._journal_lock:
+            if os.path.exists(self.journal_path):
+                if os.path.exists(self._replay_path):
+                    # Left by an earlier run: add the journal to it, on a new line in case its last was torn
+                    with open(self.journal_path, encoding="utf-8") as journal, open(self._replay_path, "a", encoding="utf-8") as f:
+                        f.write("\n" + journal.read())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self._replay_path)
+            if not os.path.exists(self._replay_path):
+                return
+            entries = self._read_journal(self._replay_path)
+
+        now = time.monotonic()
+        for entry in entries:
+            key = (entry["user_id"], entry["session_id"])
+            self._pending.setdefault(key, []).extend(entry["messages"])
+            self._oldest.setdefault(key, now)
+            self._replaying.add(key)
+            self.stats["replayed"] += len(entry["messages"])
+        if entries:
+            print(f"Replaying {sum(len(entry['messages']) for entry in entries)} journaled chat messages")
+        else:
+            self._remove_replay_file()
@@ -0,0 +1,52 @@
+"""Microbenchmark of the ways to decode an embedding from an Azure OpenAI embeddings response.
+
+Run with: python src/benchmarks/bench_embedding_decode.py
+"""
+import base64
+import json
+import os
+import random
+import sys
+import timeit
+
+from openai.types import CreateEmbeddingResponse, Embedding
+from openai.types.create_embedding_response import Usage
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+import vector_utils
+
+DIMENSIONS = 1536
+NUMBER = 2000
+
+
+def make_response(embedding):
+    # Constructed without validation, as the SDK does: a base64 embedding is not a List[float]
+    return CreateEmbeddingResponse.model_construct(
+        object="list",
+        model="text-embedding-3-large",
+        data=[Embedding.model_construct(object="embedding", index=0, embedding=embedding)],
+        usage=Usage.model_construct(prompt_tokens=8, total_tokens=8),
+    )
+
+
+def main():
+    vector = [random.uniform(-0.1, 0.1) for _ in range(DIMENSIONS)]
+    float_response = make_response(vector)
+    base64_response = make_response(base64.b64encode(vector_utils.pack(vector)).decode("ascii"))
+
+    cases = {
+        "model_dump_json + json.loads": lambda: json.loads(float_response.model_dump_json(indent=2))["data"][0]["embedding"],
+        "response.data[0].embedding (list)": lambda: float_response.data[0].embedding,
+        "list -> float32": lambda: vector_utils.to_float32(float_response.data[0].embedding),
+        "base64 -> list": lambda: vector_utils.unpack(base64.b64decode(base64_response.data[0].embedding)),
+        "base64 -> float32 (compact)": lambda: vector_utils.unpack(base64.b64decode(base64_response.data[0].embedding), compact=True),
+    }
+
+    print(f"{DIMENSIONS}-dim embedding, numpy={'yes' if vector_utils.np is not None else 'no'}, {NUMBER} iterations")
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=NUMBER, repeat=5))
+        print(f"{name:<40} {seconds / NUMBER * 1e6:10.1f} us/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Offline load test of the chat turn path with in-memory Cosmos DB and Azure OpenAI (see fake_azure.py).
+
+Scripted multi-turn conversations are replayed through ai_chat_bot.chat_interface (through
+chat_interface_stream with --mode stream, or straight through Swarm.run with --mode swarm), many
+conversations at a time. The sample data is seeded into the fake Cosmos DB first. Reports turn
+latency percentiles, requests per turn and simulated request units, and exits with status 1 when
+a --max-* budget is exceeded.
+
+Run with: python src/benchmarks/bench_load.py --conversations 50 --concurrency 16
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+import fake_azure
+
+# No Azure resources are used, but the app reads its deployment names from the environment
+for name, value in {
+    "AZURE_COSMOSDB_ENDPOINT": "https://localhost:8081",
+    "AZURE_OPENAI_ENDPOINT": "https://localhost",
+    "AZURE_OPENAI_GPT_DEPLOYMENT": "gpt-4o",
+    "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "text-embedding-3-small",
+    # The scripted conversations start with the triage agent's handoff
+    "ROUTER_ENABLED": "false",
+}.items():
+    os.environ.setdefault(name, value)
+
+# Default conversations. Each turn is a user message and the model's steps for it: a reply, or a
+# list of [tool, arguments] calls. {user_id} and {n} are filled in per conversation.
+CONVERSATIONS = [
+    [
+        {"user": "Do you have something to keep my head warm?", "steps": [
+            [["transfer_to_product", {}]],
+            [["product_information", {"user_prompt": "something to keep my head warm"}]],
+            "Our hat keeps your head warm and costs $19.99.",
+        ]},
+        {"user": "Great, please order the hat for user id {user_id} (order {n})", "steps": [
+            [["transfer_to_sales", {}]],
+            [["order_item", {"user_id": "{user_id}", "product_id": 7}]],
+            [["notify_customer", {"user_id": "{user_id}", "method": "email"}]],
+            "Your hat is on its way, and we emailed you a confirmation.",
+        ]},
+    ],
+    [
+        {"user": "I want a refund for item 101, my user id is {user_id} (request {n})", "steps": [
+            [["transfer_to_refunds", {}]],
+            [["refund_item", {"user_id": "{user_id}", "item_id": 101}],
+             ["notify_customer", {"user_id": "{user_id}", "method": "phone"}]],
+            "Your refund is on its way and we texted you the details.",
+        ]},
+        {"user": "Thanks! Which socks would you recommend for hiking?", "steps": [
+            [["transfer_to_triage", {}]],
+            [["transfer_to_product", {}]],
+            [["product_information", {"user_prompt": "socks for hiking"}]],
+            "Our wool socks are warm, breathable and great for hiking.",
+        ]},
+    ],
+]
+
+
+def fill(value, user_id, n):
+    if isinstance(value, str):
+        return value.replace("{user_id}", str(user_id)).replace("{n}", str(n))
+    if isinstance(value, list):
+        return [fill(item, user_id, n) for item in value]
+    if isinstance(value, dict):
+        return {key: fill(item, user_id, n) for key, item in value.items()}
+    return value
+
+def build_conversations(templates, count, user_ids=(1, 2, 3)):
+    """Instantiate count conversations from templates, and the script that answers them."""
+
+    conversations, script = [], {}
+    for n in range(count):
+        conversation = fill(templates[n % len(templates)], user_ids[n % len(user_ids)], n)
+        conversations.append((user_ids[n % len(user_ids)], f"bench-{n}", conversation))
+        for turn in conversation:
+            script.setdefault(turn["user"], turn["steps"])
+    return conversations, script
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def install_fakes(cosmos, openai_client):
+    """Point the app's lazily created clients at the fakes and seed the sample data."""
+
+    import azure_cosmos_db
+    import azure_open_ai
+    import ingest
+    import telemetry
+
+    azure_cosmos_db._client = cosmos
+    # As clients.cosmos_options() sets it on the real clients
+    cosmos.raw_response_hook = telemetry.record_response
+    azure_cosmos_db._containers.clear()
+    azure_open_ai._client = openai_client
+
+    azure_cosmos_db.create_database()
+    ingest.ingest_directory(ingest.SAMPLE_DATA_DIR)
+
+def turn_runner(mode):
+    """Return a function running one turn: (user_input, agent_name, messages, user_id, session_id) -> agent_name."""
+
+    if mode == "chat":
+        import ai_chat_bot
+
+        def run_turn(user_input, agent_name, messages, user_id, session_id):
+            _, agent_name, _ = ai_chat_bot.chat_interface(user_input, agent_name, messages, user_id, session_id)
+            return agent_name
+        return run_turn
+
+    if mode == "stream":
+        import ai_chat_bot
+
+        def run_turn(user_input, agent_name, messages, user_id, session_id):
+            for _, agent_name, _ in ai_chat_bot.chat_interface_stream(user_input, agent_name, messages, user_id, session_id):
+                pass
+            return agent_name
+        return run_turn
+
+    import multi_agent_service
+    import telemetry
+    agents = {agent.name: agent for agent in (multi_agent_service.triage_agent, multi_agent_service.sales_agent,
+                                              multi_agent_service.refunds_agent, multi_agent_service.product_agent)}
+
+    def run_turn(user_input, agent_name, messages, user_id, session_id):
+        messages.append({"role": "user", "content": user_input})
+        turn = telemetry.start_turn(agent_name)
+        response = multi_agent_service.get_swarm_client().run(agent=agents[agent_name], messages=messages)
+        telemetry.end_turn(turn)
+        messages.extend(response.messages)
+        return response.agent.name
+    return run_turn
+
+
+def run_conversation(run_turn, user_id, session_id, conversation):
+    turns = []
+    agent_name, messages = "Triage Agent", []
+    for turn in conversation:
+        counter = fake_azure.CallCounter()
+        fake_azure.current_counter.set(counter)
+        start = time.perf_counter()
+        agent_name = run_turn(turn["user"], agent_name, messages, user_id, session_id)
+        turns.append(((time.perf_counter() - start) * 1000, counter))
+    return turns
+
+def report(turns, elapsed):
+    latencies = [latency for latency, _ in turns]
+    names = sorted({name for _, counter in turns for name in counter.counts})
+    charges = [counter.request_charge for _, counter in turns]
+
+    print(f"{len(turns)} turns in {elapsed:.1f} s ({len(turns) / elapsed:.1f} turns/s)")
+    print(f"turn latency ms: p50 {percentile(latencies, 0.5):.0f}, p95 {percentile(latencies, 0.95):.0f}, "
+          f"p99 {percentile(latencies, 0.99):.0f}, max {max(latencies):.0f}")
+    print("requests per turn:")
+    for name in names:
+        print(f"  {name:<28} {statistics.mean(counter.counts.get(name, 0) for _, counter in turns):6.2f}")
+    print(f"simulated RU per turn: mean {statistics.mean(charges):.1f}, p99 {percentile(charges, 0.99):.1f}")
+
+    import resilience
+    print("calls per dependency:")
+    for name, stats in resilience.stats().items():
+        print(f"  {name:<28} {stats['calls']} calls, {stats['retries']} retries, {stats['throttled']} throttled, "
+              f"{stats['failed']} failed, {stats['rejected']} rejected, circuit {stats['circuit']}")
+
+    import telemetry
+    print("RU by agent and tool:")
+    for (agent, tool), totals in telemetry.totals().items():
+        print(f"  {agent or '-':<16} {tool or '-':<22} {totals['operations']:6d} operations {totals['request_charge']:10.1f} RU")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["chat", "stream", "swarm"], default="chat",
+                        help="replay through chat_interface, chat_interface_stream or Swarm.run")
+    parser.add_argument("--conversations", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations replayed at the same time")
+    parser.add_argument("--script", help="JSON file of conversations in the format of CONVERSATIONS")
+    parser.add_argument("--cosmos-latency-ms", type=float, default=5.0)
+    parser.add_argument("--cosmos-ru-per-second", type=float, default=0, help="throttle Cosmos DB requests over this many RU/s (0: never)")
+    parser.add_argument("--openai-latency-ms", type=float, default=300.0, help="latency of each chat completion")
+    parser.add_argument("--embedding-latency-ms", type=float, default=30.0)
+    parser.add_argument("--max-p99-ms", type=float, help="fail if the p99 turn latency is higher")
+    parser.add_argument("--max-ru-per-turn", type=float, help="fail if the mean simulated RU per turn is higher")
+    args = parser.parse_args()
+
+    templates = CONVERSATIONS
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            templates = json.load(f)
+    conversations, script = build_conversations(templates, args.conversations)
+
+    cosmos = fake_azure.FakeCosmosClient(latency_ms=args.cosmos_latency_ms)
+    install_fakes(
+        cosmos,
+        fake_azure.FakeOpenAI(script, latency_ms=args.openai_latency_ms, embedding_latency_ms=args.embedding_latency_ms),
+    )
+    run_turn = turn_runner(args.mode)
+    # Throttling starts once the sample data is seeded
+    cosmos.ru_per_second = args.cosmos_ru_per_second
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = executor.map(lambda conversation: run_conversation(run_turn, *conversation), conversations)
+        turns = [turn for conversation in results for turn in conversation]
+    elapsed = time.perf_counter() - start
+
+    report(turns, elapsed)
+    if args.mode in ("chat", "stream"):
+        import ai_chat_bot
+
+        # Chat history is written in the background, off the measured turns
+        ai_chat_bot.history_writer.close()
+        print(f"chat history written behind: {ai_chat_bot.history_writer.stats}")
+
+    latencies = [latency for latency, _ in turns]
+    failed = []
+    if args.max_p99_ms is not None and percentile(latencies, 0.99) > args.max_p99_ms:
+        failed.append(f"p99 turn latency {percentile(latencies, 0.99):.0f} ms > {args.max_p99_ms:.0f} ms")
+    mean_charge = statistics.mean(counter.request_charge for _, counter in turns)
+    if args.max_ru_per_turn is not None and mean_charge > args.max_ru_per_turn:
+        failed.append(f"{mean_charge:.1f} RU per turn > {args.max_ru_per_turn:.1f} RU")
+    for failure in failed:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Recall and latency of shortened and int8 product vectors against full float32 vectors.
+
+Offline (default): a synthetic catalog whose embedding variance decays across dimensions, like a
+text-embedding-3 model's, is searched exhaustively in each storage format. Recall@k is measured
+against the float32 results at full dimensions, along with search latency and vector size in a
+JSON document.
+
+Live: pass products containers (the first is the baseline) to run sample questions through the
+product search query on each. The dimensions and data type are read from each container's vector
+embedding policy, and recall@k, latency and request charge are reported.
+
+Run with: python src/benchmarks/bench_vector_storage.py [--containers Products ProductsInt8 ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+import vector_utils
+
+FULL_DIMENSIONS = 1536
+FORMATS = [(1536, "float32"), (1536, "int8"), (512, "float32"), (512, "int8"), (256, "float32"), (256, "int8")]
+
+QUESTIONS = [
+    "Do you have something to keep my head warm?",
+    "I need socks for hiking in the cold",
+    "What can I wear to the beach?",
+    "Show me a warm winter jacket",
+    "Something stylish for a formal occasion",
+]
+
+
+def recall(expected, found):
+    return len(set(expected) & set(found)) / len(expected) if expected else 1.0
+
+def top_k(matrix, query, k):
+    scores = matrix @ query
+    rows = np.argpartition(-scores, k - 1)[:k]
+    return rows[np.argsort(-scores[rows])].tolist()
+
+def normalized(matrix):
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+def stored(matrix, dimensions, data_type):
+    """The vectors as they would be stored and searched in the given format."""
+
+    vectors = np.stack([vector_utils.truncate(vector, dimensions) for vector in matrix])
+    if data_type == "int8":
+        vectors = np.array([vector_utils.quantize_int8(vector) for vector in vectors], dtype=np.float32)
+    return normalized(vectors)
+
+
+def offline(products, queries, k):
+    rng = np.random.default_rng(7)
+    # Leading dimensions carry more of the signal, as in Matryoshka-trained embedding models
+    scale = np.exp(-np.arange(FULL_DIMENSIONS) / 400).astype(np.float32)
+    catalog = normalized(rng.standard_normal((products, FULL_DIMENSIONS)).astype(np.float32) * scale)
+    # Queries are noisy copies of products, so each has a few genuinely close neighbours
+    picked = catalog[rng.integers(0, products, queries)]
+    questions = normalized(picked + rng.standard_normal(picked.shape).astype(np.float32) * scale * 0.05)
+
+    expected = [top_k(catalog, question, k) for question in questions]
+
+    print(f"{products} products, {queries} queries, recall@{k} against float32/{FULL_DIMENSIONS}")
+    print(f"{'format':<16} {'recall':>8} {'p50 ms':>8} {'bytes/vector':>13}")
+    for dimensions, data_type in FORMATS:
+        matrix = stored(catalog, dimensions, data_type)
+        query_vectors = stored(questions, dimensions, data_type)
+
+        recalls, latencies = [], []
+        for question, truth in zip(query_vectors, expected):
+            start = time.perf_counter()
+            found = top_k(matrix, question, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(recall(truth, found))
+
+        size = len(json.dumps(vector_utils.to_storage(catalog[0][:dimensions], data_type)))
+        print(f"{data_type + '/' + str(dimensions):<16} {statistics.mean(recalls):8.3f} "
+              f"{statistics.median(latencies):8.3f} {size:13d}")
+
+
+def live(container_names, k):
+    import azure_cosmos_db
+    import azure_open_ai
+    import product_search
+
+    results = {}
+    print(f"{'container':<24} {'format':<16} {'recall':>8} {'p50 ms':>8} {'RU/query':>9}")
+    for container_name in container_names:
+        container = azure_cosmos_db.get_container(container_name)
+        policy = container.read()["vectorEmbeddingPolicy"]["vectorEmbeddings"][0]
+        dimensions, data_type = policy["dimensions"], policy["dataType"]
+
+        found, latencies, charges = [], [], []
+        for question in QUESTIONS:
+            vector = azure_open_ai.generate_embedding(question, compact=True, dimensions=dimensions)
+            start = time.perf_counter()
+            rows = list(container.query_items(
+                query=product_search.PRODUCT_SEARCH_QUERY,
+                parameters=[
+                    {"name": "@embedding", "value": vector_utils.to_storage(vector, data_type)},
+                    {"name": "@num_results", "value": k},
+                ],
+                enable_cross_partition_query=True))
+            latencies.append((time.perf_counter() - start) * 1000)
+            charges.append(float(container.client_connection.last_response_headers.get("x-ms-request-charge", 0)))
+            found.append([row["product_id"] for row in rows])
+
+        results[container_name] = found
+        baseline = results[container_names[0]]
+        mean_recall = statistics.mean(recall(expected, ids) for expected, ids in zip(baseline, found))
+        print(f"{container_name:<24} {data_type + '/' + str(dimensions):<16} {mean_recall:8.3f} "
+              f"{statistics.median(latencies):8.1f} {statistics.mean(charges):9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--containers", nargs="+", help="products containers to compare live; the first is the baseline")
+    parser.add_argument("--products", type=int, default=20000, help="synthetic catalog size (offline)")
+    parser.add_argument("--queries", type=int, default=200, help="synthetic queries (offline)")
+    parser.add_argument("-k", type=int, default=10, help="results per query")
+    args = parser.parse_args()
+
+    if args.containers:
+        live(args.containers, args.k)
+    else:
+        offline(args.products, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
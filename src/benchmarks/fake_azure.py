@@ -0,0 +1,510 @@
+"""In-memory stand-ins for the Cosmos DB and Azure OpenAI clients, used by the offline benchmarks.
+
+FakeCosmosClient keeps containers in memory with partition key semantics, transactional batches,
+the query shapes the app uses (projections, equality and IS_DEFINED filters, ORDER BY, TOP,
+VectorDistance and ORDER BY RANK RRF with FullTextScore) and a simple request unit model. FakeOpenAI answers chat completions from a
+script keyed by the user's message, and embeds text with a deterministic bag of words hash.
+Both sleep for a configurable latency per request and count requests in the current CallCounter.
+"""
+import base64
+import contextvars
+import copy
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+import numpy as np
+from azure.cosmos import exceptions
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+# Simulated request charges: point reads and writes per started KB, queries per document scanned
+# and per KB returned, vector distances per document compared
+READ_RU_PER_KB = 1.0
+WRITE_RU_PER_KB = 5.5
+QUERY_BASE_RU = 2.3
+QUERY_RU_PER_SCANNED = 0.02
+QUERY_RU_PER_KB_RETURNED = 0.3
+VECTOR_RU_PER_DOCUMENT = 0.05
+
+
+class CallCounter:
+    """Requests made to the fakes while serving something, e.g. one chat turn."""
+
+    def __init__(self):
+        self.counts = {}
+        self.request_charge = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name, request_charge=0.0):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.request_charge += request_charge
+
+# Counter of the turn being served; tool calls run in copies of the turn's context and share it
+current_counter = contextvars.ContextVar("fake_azure_counter", default=None)
+
+def _count(name, request_charge=0.0):
+    counter = current_counter.get()
+    if counter is not None:
+        counter.add(name, request_charge)
+
+def _sleep(latency_ms, jitter):
+    if latency_ms:
+        time.sleep(latency_ms * random.uniform(1 - jitter, 1 + jitter) / 1000)
+
+def _kb(document):
+    return max(1, -(-len(json.dumps(document)) // 1024))
+
+
+# Cosmos DB
+
+_QUERY = re.compile(
+    r"^\s*SELECT\s+(?:TOP\s+(?P<top>@?\w+)\s+)?(?P<select>.+?)\s+FROM\s+c\b"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+ORDER\s+BY\s+(?P<order>.+?))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_SPLIT_COMMAS = re.compile(r",\s*(?![^()]*\))")
+_VECTOR_DISTANCE = re.compile(r"VectorDistance\(\s*c\.(\w+)\s*,\s*(@\w+)\s*\)", re.IGNORECASE)
+_FIELD = re.compile(r"c\.(\w+)")
+_FULL_TEXT_SCORE = re.compile(r"FullTextScore\(\s*c\.(\w+)\s*,(.+)\)", re.IGNORECASE | re.DOTALL)
+
+# Constant of the reciprocal rank fusion of ORDER BY RANK RRF, as in the service
+RRF_K = 60
+
+
+def _cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / denominator if denominator else 0.0
+
+
+class FakeQuery:
+    """Evaluates the subset of the Cosmos DB SQL dialect the app's queries use."""
+
+    def __init__(self, query, parameters):
+        match = _QUERY.match(query)
+        if match is None:
+            raise ValueError(f"Unsupported query: {query}")
+        self.parameters = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+        self.top = self._value(match["top"]) if match["top"] else None
+        self.select = [item.strip() for item in _SPLIT_COMMAS.split(match["select"].strip())]
+        self.where = [condition.strip() for condition in re.split(r"\s+AND\s+", match["where"] or "", flags=re.IGNORECASE) if condition.strip()]
+        self.order = (match["order"] or "").strip()
+        self.vector_comparisons = 0
+
+    def _value(self, token):
+        return self.parameters[token] if token.startswith("@") else json.loads(token)
+
+    def _matches(self, document, condition):
+        negate = condition.upper().startswith("NOT ")
+        condition = condition[4:].strip() if negate else condition
+        if condition.upper().startswith("IS_DEFINED("):
+            result = _FIELD.search(condition)[1] in document
+        else:
+            left, _, right = condition.partition("=")
+            result = document.get(_FIELD.search(left)[1]) == self._value(right.strip())
+        return result != negate
+
+    def _similarity(self, document, expression):
+        field, parameter = _VECTOR_DISTANCE.search(expression).groups()
+        self.vector_comparisons += 1
+        return _cosine(document[field], self.parameters[parameter]) if field in document else float("-inf")
+
+    def _project(self, document):
+        if self.select == ["*"]:
+            return copy.deepcopy(document)
+        row = {}
+        for item in self.select:
+            expression, *alias = re.split(r"\s+AS\s+", item, maxsplit=1, flags=re.IGNORECASE)
+            expression, alias = expression.strip(), alias[0].strip() if alias else None
+            if _VECTOR_DISTANCE.search(expression):
+                row[alias or "$1"] = self._similarity(document, expression)
+            else:
+                field = _FIELD.fullmatch(expression)[1]
+                if field in document:
+                    row[alias or field] = copy.deepcopy(document[field])
+        return row
+
+    def _rank_fusion(self, documents):
+        # ORDER BY RANK RRF(...) of VectorDistance and FullTextScore components. Full-text scores
+        # count the search terms in the field; documents without any take no rank in it.
+        fused = [0.0] * len(documents)
+        for component in _SPLIT_COMMAS.split(self.order[self.order.index("(") + 1:self.order.rindex(")")]):
+            full_text = _FULL_TEXT_SCORE.search(component)
+            if full_text:
+                terms = [str(self._value(term.strip())).lower() for term in full_text[2].split(",")]
+                scores = [sum(_tokens(str(document.get(full_text[1], ""))).count(term) for term in terms) for document in documents]
+            else:
+                scores = [self._similarity(document, component) for document in documents]
+            ranking = sorted((i for i in range(len(documents)) if full_text is None or scores[i] > 0), key=lambda i: -scores[i])
+            for rank, i in enumerate(ranking):
+                fused[i] += 1 / (RRF_K + rank + 1)
+        return [documents[i] for i in sorted(range(len(documents)), key=lambda i: -fused[i])]
+
+    def run(self, documents):
+        documents = [document for document in documents if all(self._matches(document, condition) for condition in self.where)]
+        if self.order:
+            if self.order.upper().startswith("RANK "):
+                documents = self._rank_fusion(documents)
+            elif _VECTOR_DISTANCE.search(self.order):
+                # For cosine, ORDER BY VectorDistance returns the most similar documents first
+                scores = [self._similarity(document, self.order) for document in documents]
+                documents = [document for _, document in sorted(zip(scores, documents), key=lambda pair: -pair[0])]
+            else:
+                expression, _, direction = self.order.partition(" ")
+                field = _FIELD.fullmatch(expression.strip())[1]
+                documents = sorted(documents, key=lambda document: document.get(field), reverse=direction.strip().upper() == "DESC")
+        if self.top is not None:
+            documents = documents[:self.top]
+        return [self._project(document) for document in documents]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.last_response_headers = {}
+
+
+class FakePager:
+    """Page iterator over query results, with the continuation_token of the SDK's pager."""
+
+    def __init__(self, container, rows, charge, page_size, continuation_token, response_hook=None):
+        self.container = container
+        self.response_hook = response_hook
+        self.rows = rows
+        self.charge = charge
+        self.page_size = page_size or len(rows) or 1
+        self.offset = int(continuation_token or 0)
+        self.continuation_token = continuation_token
+        self.first = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.offset >= len(self.rows) and not self.first:
+            raise StopIteration
+        page = self.rows[self.offset:self.offset + self.page_size]
+        charge = (self.charge if self.first else QUERY_BASE_RU / 2) + QUERY_RU_PER_KB_RETURNED * _kb(page)
+        self.container._respond("query_items", charge, self.response_hook, {"Documents": page})
+        self.first = False
+        self.offset += len(page)
+        self.continuation_token = str(self.offset) if self.offset < len(self.rows) else None
+        return iter(page)
+
+
+class FakeItemPaged:
+    def __init__(self, container, query, parameters, partition_key, max_item_count, response_hook=None):
+        self.container = container
+        self.response_hook = response_hook
+        self.query = FakeQuery(query, parameters)
+        self.partition_key = partition_key
+        self.max_item_count = max_item_count
+
+    def by_page(self, continuation_token=None):
+        documents = self.container._documents(self.partition_key)
+        rows = self.query.run(documents)
+        charge = (QUERY_BASE_RU + QUERY_RU_PER_SCANNED * len(documents)
+                  + VECTOR_RU_PER_DOCUMENT * self.query.vector_comparisons)
+        # Like the SDK, which runs a cross-partition ORDER BY through per-partition requests that
+        # do not call the response_hook
+        response_hook = None if self.partition_key is None and self.query.order else self.response_hook
+        return FakePager(self.container, rows, charge, self.max_item_count, continuation_token, response_hook)
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.by_page())
+
+
+class FakeContainer:
+    def __init__(self, client, container_id, partition_key, vector_embedding_policy=None):
+        self.client = client
+        self.id = container_id
+        self.paths = [path.lstrip("/") for path in partition_key["paths"]]
+        self.vector_embedding_policy = vector_embedding_policy
+        self.client_connection = client.connection
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def _key(self, value):
+        return json.dumps(value if isinstance(value, list) else [value])
+
+    def _document_key(self, document):
+        return self._key([document.get(path) for path in self.paths])
+
+    def _documents(self, partition_key=None):
+        with self._lock:
+            if partition_key is not None:
+                return list(self._partitions.get(self._key(partition_key), {}).values())
+            return [document for partition in self._partitions.values() for document in partition.values()]
+
+    def _admit(self, name, charge):
+        """Raise a throttling error (429) if the request is over the client's RU/s budget."""
+
+        retry_after_ms = self.client.throttle(charge)
+        if retry_after_ms is not None:
+            _sleep(self.client.latency_ms, self.client.jitter)
+            _count(f"cosmos.{name}.throttled")
+            error = exceptions.CosmosHttpResponseError(status_code=429, message=f"{name} throttled")
+            error.headers = {"x-ms-retry-after-ms": str(retry_after_ms), "x-ms-request-charge": "0"}
+            self._raw_response(429, error.headers)
+            raise error
+
+    def _raw_response(self, status_code, headers):
+        # Every response goes through the client's raw_response_hook, as through the SDK's CustomHookPolicy
+        if self.client.raw_response_hook is not None:
+            self.client.raw_response_hook(_Namespace(http_response=_Namespace(status_code=status_code, headers=headers)))
+
+    def _respond(self, name, charge, response_hook=None, result=None, status_code=200, admitted=False):
+        if not admitted:
+            self._admit(name, charge)
+        _sleep(self.client.latency_ms, self.client.jitter)
+        headers = {"x-ms-request-charge": f"{charge:.2f}", "x-ms-request-duration-ms": f"{self.client.latency_ms * 0.6:.2f}"}
+        self.client_connection.last_response_headers = headers
+        _count(f"cosmos.{name}", charge)
+        self._raw_response(status_code, headers)
+        if status_code >= 400:
+            raise exceptions.CosmosHttpResponseError(status_code=status_code, message=f"{name} failed with {status_code}")
+        if response_hook is not None:
+            response_hook(headers, result)
+        return result
+
+    def read(self, **kwargs):
+        return {"id": self.id, "vectorEmbeddingPolicy": self.vector_embedding_policy}
+
+    def read_item(self, item, partition_key, response_hook=None, **kwargs):
+        with self._lock:
+            document = self._partitions.get(self._key(partition_key), {}).get(str(item))
+        if document is None:
+            _sleep(self.client.latency_ms, self.client.jitter)
+            _count("cosmos.read_item", READ_RU_PER_KB)
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {item} not found")
+        return self._respond("read_item", READ_RU_PER_KB * _kb(document), response_hook, copy.deepcopy(document))
+
+    def _write(self, document, overwrite):
+        document = copy.deepcopy(document)
+        document.setdefault("id", str(random.getrandbits(64)))
+        document["_ts"] = int(time.time())
+        with self._lock:
+            partition = self._partitions.setdefault(self._document_key(document), {})
+            if not overwrite and document["id"] in partition:
+                return None
+            partition[document["id"]] = document
+        return document
+
+    def create_item(self, body, response_hook=None, **kwargs):
+        # Writes are throttled before they are applied, so a retry does not find its own write
+        self._admit("create_item", WRITE_RU_PER_KB * _kb(body))
+        document = self._write(body, overwrite=False)
+        if document is None:
+            _sleep(self.client.latency_ms, self.client.jitter)
+            raise exceptions.CosmosResourceExistsError(status_code=409, message=f"Item {body.get('id')} already exists")
+        return self._respond("create_item", WRITE_RU_PER_KB * _kb(document), response_hook, copy.deepcopy(document), admitted=True)
+
+    def upsert_item(self, body, response_hook=None, **kwargs):
+        self._admit("upsert_item", WRITE_RU_PER_KB * _kb(body))
+        document = self._write(body, overwrite=True)
+        return self._respond("upsert_item", WRITE_RU_PER_KB * _kb(document), response_hook, copy.deepcopy(document), admitted=True)
+
+    def execute_item_batch(self, batch_operations, partition_key, response_hook=None, **kwargs):
+        """Apply create/upsert operations atomically: all of them, or none if a create conflicts."""
+
+        documents = [copy.deepcopy(args[0]) for _, args in batch_operations]
+        charge = sum(WRITE_RU_PER_KB * _kb(document) for document in documents)
+        self._admit("execute_item_batch", charge)
+        with self._lock:
+            partition = self._partitions.setdefault(self._key(partition_key), {})
+            for index, ((operation, _), document) in enumerate(zip(batch_operations, documents)):
+                if operation == "create" and document["id"] in partition:
+                    _sleep(self.client.latency_ms, self.client.jitter)
+                    raise exceptions.CosmosBatchOperationError(
+                        error_index=index, headers={}, status_code=409,
+                        message=f"Item {document['id']} already exists", operation_responses=[])
+            for document in documents:
+                document["_ts"] = int(time.time())
+                partition[document["id"]] = document
+        return self._respond("execute_item_batch", charge, response_hook, [{"statusCode": 201} for _ in documents], admitted=True)
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None, response_hook=None, **kwargs):
+        items = FakeItemPaged(self, query, parameters, partition_key, max_item_count, response_hook)
+        # Like the SDK, call the hook with the iterator before any page is read
+        if response_hook is not None:
+            response_hook(self.client_connection.last_response_headers, items)
+        return items
+
+    def query_items_change_feed(self, response_hook=None, **kwargs):
+        self._respond("change_feed", 1.0)
+        headers = {"etag": str(time.time())}
+        self.client_connection.last_response_headers = headers
+        if response_hook:
+            response_hook(headers, [])
+        return iter([])
+
+
+class FakeDatabase:
+    def __init__(self, client, database_id):
+        self.client = client
+        self.id = database_id
+        self.containers = {}
+
+    def create_container_if_not_exists(self, id, partition_key, vector_embedding_policy=None, **kwargs):
+        return self.containers.setdefault(id, FakeContainer(self.client, id, partition_key, vector_embedding_policy))
+
+    def get_container_client(self, container_id):
+        return self.containers[container_id]
+
+
+class FakeCosmosClient:
+    """Stand-in for azure.cosmos.CosmosClient; latency_ms is slept per request (+/- jitter), and
+    raw_response_hook is called with each response.
+
+    With ru_per_second, requests over that many RUs in the current second are throttled (429)
+    with a retry-after until the next second, as with provisioned throughput."""
+
+    def __init__(self, latency_ms=5.0, jitter=0.2, ru_per_second=0, raw_response_hook=None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.ru_per_second = ru_per_second
+        self.raw_response_hook = raw_response_hook
+        self.connection = FakeConnection()
+        self.databases = {}
+        self._second, self._charged = 0, 0.0
+        self._throttle_lock = threading.Lock()
+
+    def throttle(self, charge):
+        """Charge a request to the current second; return the retry-after in ms if it is over budget."""
+
+        if not self.ru_per_second:
+            return None
+        with self._throttle_lock:
+            now = time.monotonic()
+            if int(now) != self._second:
+                self._second, self._charged = int(now), 0.0
+            if self._charged + charge > self.ru_per_second:
+                return int((1 - now % 1) * 1000) + 1
+            self._charged += charge
+            return None
+
+    def create_database_if_not_exists(self, id, **kwargs):
+        return self.databases.setdefault(id, FakeDatabase(self, id))
+
+    def get_database_client(self, database_id):
+        return self.create_database_if_not_exists(database_id)
+
+
+# Azure OpenAI
+
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+def fake_embedding(text, dimensions=1536):
+    """Deterministic unit vector from hashed words, so texts sharing words are similar."""
+
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _tokens(text):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeOpenAI:
+    """Stand-in for AzureOpenAI answering chat completions from a script.
+
+    script maps a user message to the steps of its turn. Each step is either the assistant's reply
+    text or a list of [tool name, arguments] calls; the step is chosen by counting the assistant
+    messages after that user message. Unscripted turns are answered with a short reply.
+
+    With stream=True the step comes as chunks: the reply a word at a time, and each tool call's
+    name then its arguments. The first chunk arrives after a third of the latency, the others
+    spread over the rest."""
+
+    def __init__(self, script=None, latency_ms=300.0, embedding_latency_ms=30.0, jitter=0.2):
+        self.script = script or {}
+        self.latency_ms = latency_ms
+        self.embedding_latency_ms = embedding_latency_ms
+        self.jitter = jitter
+        self._ids = itertools.count()
+        self.chat = _Namespace(completions=_Namespace(create=self.create_chat_completion))
+        self.embeddings = _Namespace(create=self.create_embedding)
+
+    def _step(self, messages):
+        for position in range(len(messages) - 1, -1, -1):
+            if messages[position]["role"] == "user":
+                steps = self.script.get(messages[position]["content"])
+                if not steps:
+                    return "How else can I help you?"
+                done = sum(1 for message in messages[position + 1:] if message["role"] == "assistant")
+                return steps[min(done, len(steps) - 1)]
+        return "How can I help you?"
+
+    def create_chat_completion(self, model, messages, stream=False, **kwargs):
+        if stream:
+            _count("openai.chat")
+            return self._stream(model, self._step(messages))
+        _sleep(self.latency_ms, self.jitter)
+        _count("openai.chat")
+
+        step = self._step(messages)
+        message = {"role": "assistant", "content": step if isinstance(step, str) else None}
+        if not isinstance(step, str):
+            message["tool_calls"] = [
+                {"id": f"call_{next(self._ids)}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+                for name, arguments in step
+            ]
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model or "fake",
+            "choices": [{"index": 0, "finish_reason": "stop" if isinstance(step, str) else "tool_calls", "message": message}],
+        })
+
+    def _stream(self, model, step):
+        if isinstance(step, str):
+            deltas = [{"content": word} for word in re.findall(r"\S+\s*", step)]
+        else:
+            deltas = []
+            for index, (name, arguments) in enumerate(step):
+                call_id = f"call_{next(self._ids)}"
+                arguments = json.dumps(arguments)
+                # Tool calls come one per chunk, as Swarm merges only the first of a chunk
+                deltas.append({"tool_calls": [{"index": index, "id": call_id, "type": "function", "function": {"name": name, "arguments": ""}}]})
+                deltas.append({"tool_calls": [{"index": index, "function": {"arguments": arguments[:len(arguments) // 2]}}]})
+                deltas.append({"tool_calls": [{"index": index, "function": {"arguments": arguments[len(arguments) // 2:]}}]})
+        deltas[0]["role"] = "assistant"
+        finish_reason = "stop" if isinstance(step, str) else "tool_calls"
+
+        completion_id = f"chatcmpl-{next(self._ids)}"
+        _sleep(self.latency_ms / 3, self.jitter)
+        for position, delta in enumerate(deltas):
+            if position:
+                _sleep(self.latency_ms * 2 / 3 / len(deltas), self.jitter)
+            yield ChatCompletionChunk.model_validate({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model or "fake",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason if position == len(deltas) - 1 else None}],
+            })
+
+    def create_embedding(self, input, model, encoding_format="float", dimensions=None, **kwargs):
+        _sleep(self.embedding_latency_ms, self.jitter)
+        _count("openai.embeddings")
+
+        inputs = [input] if isinstance(input, str) else input
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(text, dimensions or 1536)
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii") if encoding_format == "base64" else vector.tolist()
+            data.append(_Namespace(object="embedding", index=index, embedding=embedding))
+        # Embedding responses are read by attribute only, so plain objects stand in for the SDK types
+        return _Namespace(object="list", model=model, data=data)
@@ -0,0 +1,130 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+from types import SimpleNamespace
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "src", "app")
+sys.path.insert(0, APP_DIR)
+import write_behind
+
+
+class Recorder:
+    """write function for the writer, failing the first failures calls."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.written = []
+        self._lock = threading.Lock()
+
+    def __call__(self, user_id, session_id, messages):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                return SimpleNamespace(error="unavailable", batches=[])
+            self.written.extend((session_id, message["seq"]) for message in messages)
+        return SimpleNamespace(error=None, batches=[None])
+
+
+def messages(*seqs):
+    return [{"role": "user", "content": str(seq), "seq": seq} for seq in seqs]
+
+
+def test_close_writes_pending_messages(tmp_path):
+    write = Recorder()
+    writer = write_behind.WriteBehindWriter(write, flush_seconds=5, journal_path=str(tmp_path / "journal.jsonl"))
+    writer.enqueue("u", "s1", messages(0, 1))
+    writer.enqueue("u", "s2", messages(0))
+    writer.close()
+
+    assert sorted(write.written) == [("s1", 0), ("s1", 1), ("s2", 0)]
+    assert writer.stats["written"] == 3
+    assert not os.path.exists(tmp_path / "journal.jsonl")
+
+
+def test_failed_messages_are_journaled_and_replayed(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    writer = write_behind.WriteBehindWriter(Recorder(failures=1), flush_seconds=5, journal_path=journal_path, retry_seconds=60)
+    writer.enqueue("u", "s", messages(0, 1))
+    writer.close()
+    with open(journal_path, encoding="utf-8") as f:
+        assert [entry["session_id"] for entry in map(json.loads, f)] == ["s"]
+
+    write = Recorder()
+    writer = write_behind.WriteBehindWriter(write, flush_seconds=5, journal_path=journal_path)
+    writer.enqueue("u", "s", messages(2))
+    writer.close()
+    assert sorted(write.written) == [("s", 0), ("s", 1), ("s", 2)]
+    assert not os.path.exists(journal_path)
+
+
+def test_enqueue_after_close_is_journaled(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    writer = write_behind.WriteBehindWriter(Recorder(), flush_seconds=5, journal_path=journal_path)
+    writer.start()
+    writer.close()
+    writer.enqueue("u", "s", messages(0))
+    assert writer.stats["journaled"] == 1
+
+
+def test_pending_messages_are_written_at_interpreter_exit(tmp_path):
+    output_path = tmp_path / "written.jsonl"
+    script = textwrap.dedent(f"""
+        import sys
+        from types import SimpleNamespace
+        sys.path.insert(0, {APP_DIR!r})
+        import write_behind
+
+        def write(user_id, session_id, messages):
+            with open({str(output_path)!r}, "a") as f:
+                for message in messages:
+                    f.write(f"{{session_id}} {{message['seq']}}\\n")
+            return SimpleNamespace(error=None, batches=[None])
+
+        writer = write_behind.WriteBehindWriter(write, flush_seconds=5, journal_path={str(tmp_path / "journal.jsonl")!r})
+        for seq in range(3):
+            writer.enqueue("u", "s", [{{"role": "user", "content": "hi", "seq": seq}}])
+    """)
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=60)
+
+    assert output_path.read_text().split("\n")[:-1] == ["s 0", "s 1", "s 2"]
+
+
+def test_journal_is_kept_until_replayed_messages_are_written(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"user_id": "u", "session_id": "s", "messages": messages(0, 1)}) + "\n")
+        # Torn by a crash while it was being appended
+        f.write('{"user_id": "u", "session_id": "s", "mess')
+
+    crashed = write_behind.WriteBehindWriter(Recorder(), flush_seconds=5, journal_path=journal_path)
+    crashed.start()
+    # Replayed but not written yet: a crash now must not lose them
+    assert crashed.stats["replayed"] == 2
+    assert os.path.exists(journal_path + ".replaying")
+    assert os.path.exists(journal_path + ".corrupt")
+
+    write = Recorder()
+    writer = write_behind.WriteBehindWriter(write, flush_seconds=5, journal_path=journal_path)
+    writer.enqueue("u", "s", messages(2))
+    writer.close()
+    assert sorted(write.written) == [("s", 0), ("s", 1), ("s", 2)]
+    assert not os.path.exists(journal_path) and not os.path.exists(journal_path + ".replaying")
+
+
+def test_unwritten_messages_include_queued_and_journaled(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"user_id": "u", "session_id": "s", "messages": messages(0)}) + "\n")
+        f.write(json.dumps({"user_id": "u", "session_id": "other", "messages": messages(0)}) + "\n")
+
+    write = Recorder(failures=1)
+    writer = write_behind.WriteBehindWriter(write, flush_seconds=60, journal_path=journal_path, retry_seconds=60)
+    writer.enqueue("u", "s", messages(1, 2))
+    assert sorted(message["seq"] for message in writer.unwritten("u", "s")) == [0, 1, 2]
+
+    writer.close()
+    # Journaled again by the failed write, and still not written
+    assert sorted(message["seq"] for message in writer.unwritten("u", "s")) == [0, 1, 2]